@@ -1,6 +1,7 @@
 """RBAC Middleware - Role-Based Access Control enforcement"""
 from fastapi import Request, HTTPException
 from services.auth_service import decode_token
+from services import cache_bus
 from typing import Optional, List
 
 async def get_current_user(request: Request) -> dict:
@@ -23,9 +24,22 @@ def set_rbac_db(database):
     _db = database
 
 
+# org_id -> membership fields; every permission check reads it
+_org_cache = cache_bus.LocalCache("rbac_orgs", max_entries=5000)
+cache_bus.subscribe("organizations", _org_cache.evictor("id"))
+
+
+async def _get_org_membership(org_id: str) -> Optional[dict]:
+    hit, org = _org_cache.get(org_id)
+    if not hit:
+        org = await _db.organizations.find_one({"id": org_id}, {"_id": 0, "id": 1, "members": 1, "authorizations": 1})
+        _org_cache.set(org_id, org)
+    return org
+
+
 async def _get_user_org_role(user_id: str, org_id: str) -> Optional[dict]:
     """Get user's role and authorization within an organization."""
-    org = await _db.organizations.find_one({"id": org_id}, {"_id": 0})
+    org = await _get_org_membership(org_id)
     if not org:
         return None
     member = next((m for m in org.get("members", []) if m["user_id"] == user_id), None)
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from typing import Optional
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from middleware.auth_middleware import get_current_user
+from services import llm_cache, llm_gateway, llm_backends, context_builder, ai_service, db_indexes, application_store, pagination, audit_sink, cache_bus, retention, dashboard_snapshot, guide_service
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 db = None
@@ -12,8 +13,10 @@ def set_db(database):
 
 @router.get("/audit-log")
 async def get_audit_log(
+    response: Response,
     entity_type: Optional[str] = None,
     user_id: Optional[str] = None,
+    cursor: Optional[str] = None,
     limit: int = 50,
     current_user: dict = Depends(get_current_user)
 ):
@@ -27,7 +30,8 @@ async def get_audit_log(
         query["entity_type"] = entity_type
     if user_id and user.get("is_admin"):
         query["user_id"] = user_id
-    logs = await db.audit_log.find(query, {"_id": 0}).sort("timestamp", -1).to_list(limit)
+    logs, next_cursor = await pagination.page(db.audit_log, query, cursor=cursor, limit=limit, field="timestamp")
+    pagination.set_next(response, next_cursor)
     return logs
 
 @router.get("/users")
@@ -52,24 +56,123 @@ async def toggle_user_active(user_id: str, current_user: dict = Depends(get_curr
 
 @router.get("/dashboard")
 async def admin_dashboard(current_user: dict = Depends(get_current_user)):
-    total_users = await db.users.count_documents({})
-    total_orgs = await db.organizations.count_documents({})
-    total_projects = await db.projects.count_documents({})
-    total_docs = await db.documents.count_documents({})
-    total_specialists = await db.specialists.count_documents({})
-    projects_by_state = {}
-    async for p in db.projects.find({}, {"stare": 1, "_id": 0}):
-        state = p.get("stare", "unknown")
-        projects_by_state[state] = projects_by_state.get(state, 0) + 1
-    recent_audit = await db.audit_log.find({}, {"_id": 0}).sort("timestamp", -1).to_list(10)
-    return {
-        "stats": {
-            "total_users": total_users,
-            "total_organizations": total_orgs,
-            "total_projects": total_projects,
-            "total_documents": total_docs,
-            "total_specialists": total_specialists
-        },
-        "projects_by_state": projects_by_state,
-        "recent_audit": recent_audit
-    }
+    """Totals, per-state breakdowns and recent audit entries from the background snapshot
+    (at most ADMIN_DASHBOARD_REFRESH seconds old, see generated_at)."""
+    return await dashboard_snapshot.get(db)
+
+@router.get("/llm-cache")
+async def llm_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit/miss counters for the agent response cache and single-flight coalescing of identical in-flight prompts."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return {**llm_cache.get_stats(), "coalescing": ai_service.get_coalescing_stats()}
+
+
+@router.get("/llm-gateway")
+async def llm_gateway_stats(current_user: dict = Depends(get_current_user)):
+    """Per-provider concurrency, queue depth and admission wait times, plus the active LLM backend."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return {**llm_gateway.get_stats(), "_backend": llm_backends.describe()}
+
+
+@router.get("/audit-sink")
+async def audit_sink_stats(current_user: dict = Depends(get_current_user)):
+    """Buffered audit writer: durability mode, pending records, batches and fallbacks."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return audit_sink.get_stats()
+
+
+@router.get("/cache-bus")
+async def cache_bus_stats(current_user: dict = Depends(get_current_user)):
+    """Invalidation mode (streaming | ttl), events received and per-cache hit/eviction counters."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return cache_bus.get_stats()
+
+
+@router.get("/retention")
+async def retention_state(current_user: dict = Depends(get_current_user)):
+    """Hot window, watermark and last pass per source (audit_log, agent_runs)."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return await retention.get_state(db)
+
+
+@router.post("/retention/run")
+async def run_retention(current_user: dict = Depends(get_current_user)):
+    """Roll up and archive everything older than the hot window now (same as `python -m services.retention`)."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return await retention.run(db)
+
+
+@router.get("/activity")
+async def activity(source: str = "audit_log", days: int = 30, granularity: str = "day", by: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Counts per hour/day (optionally per action, agent_id, entity_type or user_id); ranges older
+    than the hot window are answered from rollups."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    if source not in retention.SOURCES:
+        raise HTTPException(status_code=400, detail=f"Sursă necunoscută: {source}")
+    if granularity not in retention.PERIOD_CHARS:
+        raise HTTPException(status_code=400, detail=f"Granularitate necunoscută: {granularity}")
+    if by and by not in retention.SOURCES[source]:
+        raise HTTPException(status_code=400, detail=f"Dimensiune necunoscută pentru {source}: {by}")
+    now = datetime.now(timezone.utc)
+    since = (now - timedelta(days=max(1, min(days, 3660)))).isoformat()
+    return await retention.activity(db, source, since, now.isoformat(), granularity, by)
+
+
+@router.get("/context-cache")
+async def context_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit/miss counters for the project context snapshots."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return context_builder.get_cache_stats()
+
+
+@router.get("/indexes")
+async def index_health(current_user: dict = Depends(get_current_user)):
+    """Declared vs. present indexes per collection and $indexStats usage (missing / undeclared / unused)."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return await db_indexes.report(db)
+
+
+@router.post("/indexes/apply")
+async def apply_indexes(current_user: dict = Depends(get_current_user)):
+    """Re-run the index bootstrap (idempotent) after adding entries to the registry."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return await db_indexes.apply(db)
+
+
+@router.post("/migrations/application-arrays")
+async def migrate_application_arrays(current_user: dict = Depends(get_current_user)):
+    """Move embedded documents/drafts/history/guide_assets/required_documents of legacy applications
+    into their sub-collections (same as `python -m services.application_store`)."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return await application_store.migrate_all(db)
+
+
+@router.post("/guide-index/backfill")
+async def backfill_guide_index(current_user: dict = Depends(get_current_user)):
+    """Index the guides of existing applications for retrieval (same as `python -m services.guide_service`)."""
+    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    if not user or not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Acces interzis")
+    return await guide_service.backfill_index(db)
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel
 from typing import Optional, List
 import uuid
 from datetime import datetime, timezone
 from middleware.auth_middleware import get_current_user
+from services.context_builder import build_full_context, bump_context_version
+from services import application_store, pagination, audit_sink, agent_rules
 
 router = APIRouter(prefix="/api/agents", tags=["agents"])
 db = None
@@ -91,7 +93,7 @@ async def list_agents(current_user: dict = Depends(get_current_user)):
     user_id = current_user["user_id"]
     agents = []
     for agent in DEFAULT_AGENTS:
-        custom = await db.agent_rules.find_one({"agent_id": agent["id"], "user_id": user_id}, {"_id": 0})
+        custom = await agent_rules.get(db, agent["id"], user_id)
         a = {**agent}
         if custom:
             a["reguli_custom"] = custom.get("reguli", [])
@@ -106,7 +108,7 @@ async def get_agent(agent_id: str, current_user: dict = Depends(get_current_user
     agent = next((a for a in DEFAULT_AGENTS if a["id"] == agent_id), None)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent negăsit")
-    custom = await db.agent_rules.find_one({"agent_id": agent_id, "user_id": current_user["user_id"]}, {"_id": 0})
+    custom = await agent_rules.get(db, agent_id, current_user["user_id"])
     a = {**agent}
     a["reguli_custom"] = custom.get("reguli", []) if custom else []
     a["reguli_active"] = agent["reguli_default"] + a["reguli_custom"]
@@ -123,7 +125,8 @@ async def add_rule(agent_id: str, req: AddRuleRequest, current_user: dict = Depe
         await db.agent_rules.update_one({"agent_id": agent_id, "user_id": user_id}, {"$push": {"reguli": req.regula}})
     else:
         await db.agent_rules.insert_one({"agent_id": agent_id, "user_id": user_id, "reguli": [req.regula], "created_at": datetime.now(timezone.utc).isoformat()})
-    await db.audit_log.insert_one({"id": str(uuid.uuid4()), "action": "agent.rule_added", "entity_type": "agent", "entity_id": agent_id, "user_id": user_id, "details": {"regula": req.regula}, "timestamp": datetime.now(timezone.utc).isoformat()})
+    agent_rules.changed(agent_id, user_id)
+    await audit_sink.audit({"id": str(uuid.uuid4()), "action": "agent.rule_added", "entity_type": "agent", "entity_id": agent_id, "user_id": user_id, "details": {"regula": req.regula}, "timestamp": datetime.now(timezone.utc).isoformat()})
     return {"message": "Regulă adăugată"}
 
 @router.delete("/{agent_id}/rules/{rule_index}")
@@ -135,12 +138,14 @@ async def delete_rule(agent_id: str, rule_index: int, current_user: dict = Depen
     reguli = custom["reguli"]
     removed = reguli.pop(rule_index)
     await db.agent_rules.update_one({"agent_id": agent_id, "user_id": user_id}, {"$set": {"reguli": reguli}})
+    agent_rules.changed(agent_id, user_id)
     return {"message": f"Regulă ștearsă: {removed}"}
 
 @router.put("/{agent_id}/rules")
 async def set_rules(agent_id: str, req: UpdateAgentRules, current_user: dict = Depends(get_current_user)):
     user_id = current_user["user_id"]
     await db.agent_rules.update_one({"agent_id": agent_id, "user_id": user_id}, {"$set": {"reguli": req.reguli, "updated_at": datetime.now(timezone.utc).isoformat()}}, upsert=True)
+    agent_rules.changed(agent_id, user_id)
     return {"message": "Reguli actualizate"}
 
 
@@ -150,6 +155,7 @@ class RunAgentRequest(BaseModel):
     application_id: Optional[str] = None
     company_id: Optional[str] = None
     input_data: Optional[dict] = {}
+    no_cache: bool = False
 
 @router.post("/{agent_id}/run")
 async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = Depends(get_current_user)):
@@ -159,7 +165,7 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
         raise HTTPException(404, "Agent negăsit")
 
     # Load custom rules
-    custom_rules = await db.agent_rules.find_one({"agent_id": agent_id, "user_id": current_user["user_id"]}, {"_id": 0})
+    custom_rules = await agent_rules.get(db, agent_id, current_user["user_id"])
     rules = (agent.get("reguli_default", []) + (custom_rules.get("reguli", []) if custom_rules else []))
     rules_text = "\n".join(rules)
 
@@ -167,7 +173,7 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
     app = None
     org = None
     if req.application_id:
-        app = await db.applications.find_one({"id": req.application_id}, {"_id": 0})
+        app = await db.applications.find_one({"id": req.application_id}, application_store.HEAD_PROJECTION)
         if app:
             org = await db.organizations.find_one({"id": app.get("company_id")}, {"_id": 0})
     if req.company_id and not org:
@@ -175,9 +181,9 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
 
     run_id = str(uuid.uuid4())
     result = {}
+    ai_result = {}  # set by the LLM-backed agents; carries prompt_tokens for the run log
 
     # Build full project context (shared by all agents)
-    from services.context_builder import build_full_context
     full_ctx = {}
     if req.application_id:
         full_ctx = await build_full_context(req.application_id, db)
@@ -200,11 +206,13 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
                 if update_fields:
                     update_fields["updated_at"] = datetime.now(timezone.utc).isoformat()
                     await db.organizations.update_one({"id": org["id"]}, {"$set": update_fields})
+                    await bump_context_version(db, company_id=org["id"])
                     actions.append(f"Date ONRC actualizate: {', '.join(update_fields.keys())}")
             # Financial data
             fin = await get_financial_data(org["cui"])
             if fin.get("success"):
                 await db.organizations.update_one({"id": org["id"]}, {"$set": {"date_financiare": fin["data"], "updated_at": datetime.now(timezone.utc).isoformat()}})
+                await bump_context_version(db, company_id=org["id"])
                 actions.append(f"Date financiare ANAF actualizate (CA: {fin['data'].get('cifra_afaceri', 'N/A')})")
         result = {"actions": actions, "company": org.get("denumire")}
 
@@ -226,17 +234,18 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
                     break
             if file_path: break
         tip = req.input_data.get("tip_document", "altele")
-        ocr = await process_ocr(doc_id, tip, req.input_data.get("filename", ""), db, file_path=file_path)
-        result = {"ocr_status": ocr.get("status"), "fields_count": len(ocr.get("extracted_fields", {})), "confidence": ocr.get("overall_confidence")}
+        ocr = await process_ocr(doc_id, tip, req.input_data.get("filename", ""), db, file_path=file_path, force_refresh=bool(req.input_data.get("force_refresh")))
+        result = {"ocr_status": ocr.get("status"), "fields_count": len(ocr.get("extracted_fields", {})), "confidence": ocr.get("overall_confidence"), "cache_hit": ocr.get("cache_hit", False)}
 
     # --- ELIGIBILITATE ---
     elif agent_id == "eligibilitate":
         if not req.application_id:
             raise HTTPException(400, "application_id necesar")
         from services.ai_service import check_eligibility
-        ai_result = await check_eligibility({}, {}, full_context=full_ctx, extra_rules=rules_text)
+        ai_result = await check_eligibility({}, {}, full_context=full_ctx, extra_rules=rules_text, use_cache=not req.no_cache)
         report = {"id": str(uuid.uuid4()), "type": "evaluation", "application_id": req.application_id, "result": ai_result.get("result", ""), "created_at": datetime.now(timezone.utc).isoformat()}
         await db.compliance_reports.insert_one(report)
+        await bump_context_version(db, app_id=req.application_id)
         result = {"report_id": report["id"], "success": ai_result.get("success"), "preview": ai_result.get("result", "")[:300]}
 
     # --- REDACTOR ---
@@ -255,16 +264,24 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
             tpl = next((t for t in custom_tpls if t["id"] == template_id), None)
         if not tpl:
             raise HTTPException(404, "Template negăsit")
-        ai_result = await generate_document_section(
-            template=f"{tpl['label']}: {', '.join(tpl.get('sections', []))}",
-            data={}, section=req.input_data.get("section") or ", ".join(tpl.get("sections", [])),
-            full_context=full_ctx, extra_rules=rules_text
-        )
+        sections = tpl.get("sections", [])
+        if req.input_data.get("parallel") and not req.input_data.get("section") and len(sections) > 1:
+            from services.ai_service import generate_document_sections
+            ai_result = await generate_document_sections(
+                f"{tpl['label']}: {', '.join(sections)}", sections,
+                full_context=full_ctx, extra_rules=rules_text, use_cache=not req.no_cache
+            )
+        else:
+            ai_result = await generate_document_section(
+                template=f"{tpl['label']}: {', '.join(sections)}",
+                data={}, section=req.input_data.get("section") or ", ".join(sections),
+                full_context=full_ctx, extra_rules=rules_text, use_cache=not req.no_cache
+            )
         content = ai_result.get("result", "")
         import os
         pdf_file = generate_pdf(tpl["label"], content, full_ctx.get("firma", {}).get("denumire", ""), app["title"])
         draft = {"id": str(uuid.uuid4()), "template_id": template_id, "template_label": tpl["label"], "content": content, "pdf_filename": pdf_file, "status": "draft", "version": 1, "created_at": datetime.now(timezone.utc).isoformat(), "created_by": current_user["user_id"], "applied_rules": rules}
-        await db.applications.update_one({"id": req.application_id}, {"$push": {"drafts": draft}})
+        await application_store.add(db, req.application_id, "drafts", draft)
         result = {"draft_id": draft["id"], "pdf_url": f"/api/v2/drafts/download/{pdf_file}", "preview": content[:300]}
 
     # --- VALIDATOR ---
@@ -272,9 +289,10 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
         if not req.application_id:
             raise HTTPException(400, "application_id necesar")
         from services.ai_service import validate_coherence
-        ai_result = await validate_coherence([], {}, full_context=full_ctx, extra_rules=rules_text)
+        ai_result = await validate_coherence([], {}, full_context=full_ctx, extra_rules=rules_text, use_cache=not req.no_cache)
         report = {"id": str(uuid.uuid4()), "type": "validation", "application_id": req.application_id, "result": ai_result.get("result", ""), "created_at": datetime.now(timezone.utc).isoformat()}
         await db.compliance_reports.insert_one(report)
+        await bump_context_version(db, app_id=req.application_id)
         result = {"report_id": report["id"], "preview": ai_result.get("result", "")[:300]}
 
     # --- EVALUATOR (grilă conformitate) ---
@@ -284,10 +302,11 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
         from services.ai_service import validate_coherence
         ai_result = await validate_coherence([], {},
             full_context={**full_ctx, "instrucțiune_specială": "Evaluează conform GRILEI DE CONFORMITATE din ghid. Verifică completitudinea dosarului, documente obligatorii, coerență date, semnături. Dă scoring per criteriu."},
-            extra_rules=rules_text
+            extra_rules=rules_text, use_cache=not req.no_cache
         )
         report = {"id": str(uuid.uuid4()), "type": "conformity_grid", "application_id": req.application_id, "result": ai_result.get("result", ""), "created_at": datetime.now(timezone.utc).isoformat()}
         await db.compliance_reports.insert_one(report)
+        await bump_context_version(db, app_id=req.application_id)
         result = {"report_id": report["id"], "preview": ai_result.get("result", "")[:300]}
 
     # --- NAVIGATOR ---
@@ -296,7 +315,7 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
         if not message:
             raise HTTPException(400, "message necesar")
         from services.ai_service import chat_navigator
-        ai_result = await chat_navigator(message, {}, full_context=full_ctx, extra_rules=rules_text)
+        ai_result = await chat_navigator(message, {}, full_context=full_ctx, extra_rules=rules_text, use_cache=not req.no_cache)
         result = {"response": ai_result.get("result", ""), "success": ai_result.get("success")}
 
     # --- ORCHESTRATOR ---
@@ -304,29 +323,66 @@ async def run_agent(agent_id: str, req: RunAgentRequest, current_user: dict = De
         if not app or not org:
             raise HTTPException(400, "application_id necesar")
         from services.orchestrator_service import run_orchestrator_check
-        result = await run_orchestrator_check(app, org, db)
+        result = await run_orchestrator_check(app, org, db, user_id=current_user["user_id"],
+                                              mode="fast" if (req.input_data or {}).get("mode") == "fast" else "full")
 
     else:
         raise HTTPException(400, f"Agent {agent_id} nu are implementare de execuție")
 
     # Log AgentRun
-    await db.agent_runs.insert_one({
+    await audit_sink.agent_run({
         "id": run_id, "agent_id": agent_id,
         "application_id": req.application_id, "company_id": req.company_id,
         "action": "run", "applied_rules": rules,
         "input": req.input_data or {},
         "output": {k: str(v)[:500] if isinstance(v, str) else v for k, v in result.items()},
+        "prompt_tokens": ai_result.get("prompt_tokens"),
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "user_id": current_user["user_id"]
     })
 
     return {"agent_id": agent_id, "run_id": run_id, "applied_rules": rules, "result": result}
 
+@router.post("/navigator/run/stream")
+async def run_navigator_stream(req: RunAgentRequest, current_user: dict = Depends(get_current_user)):
+    """SSE variant of /navigator/run: answer tokens as they arrive, the logged run as the final event."""
+    message = (req.input_data or {}).get("message", "")
+    if not message:
+        raise HTTPException(400, "message necesar")
+    agent = next(a for a in DEFAULT_AGENTS if a["id"] == "navigator")
+    custom_rules = await agent_rules.get(db, "navigator", current_user["user_id"])
+    rules = (agent.get("reguli_default", []) + (custom_rules.get("reguli", []) if custom_rules else []))
+
+    from services.ai_service import stream_agent
+    from services.streaming import sse_response, stream_frames, require_token_streaming
+    require_token_streaming()
+    full_ctx = await build_full_context(req.application_id, db) if req.application_id else {}
+    run_id = str(uuid.uuid4())
+    usage = {}
+    deltas = stream_agent("navigator", message, {}, full_context=full_ctx, extra_rules="\n".join(rules), use_cache=not req.no_cache, usage=usage)
+
+    async def on_complete(text: str) -> dict:
+        result = {"response": text, "success": bool(text)}
+        await audit_sink.agent_run({
+            "id": run_id, "agent_id": "navigator",
+            "application_id": req.application_id, "company_id": req.company_id,
+            "action": "run", "applied_rules": rules,
+            "input": req.input_data or {},
+            "output": {"response": text[:500], "success": bool(text), "streamed": True},
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "user_id": current_user["user_id"]
+        })
+        return {"agent_id": "navigator", "run_id": run_id, "applied_rules": rules, "result": result}
+
+    return sse_response(stream_frames(deltas, on_complete, {"agent": "navigator", "run_id": run_id}))
+
 @router.get("/{agent_id}/runs")
-async def get_agent_runs(agent_id: str, application_id: Optional[str] = None, limit: int = 20, current_user: dict = Depends(get_current_user)):
+async def get_agent_runs(agent_id: str, response: Response, application_id: Optional[str] = None, cursor: Optional[str] = None, limit: int = 20, current_user: dict = Depends(get_current_user)):
     """Get execution history for an agent."""
     q = {"agent_id": agent_id}
     if application_id:
         q["application_id"] = application_id
-    runs = await db.agent_runs.find(q, {"_id": 0}).sort("timestamp", -1).to_list(limit)
+    runs, next_cursor = await pagination.page(db.agent_runs, q, cursor=cursor, limit=limit, field="timestamp")
+    pagination.set_next(response, next_cursor)
     return runs
@@ -1,18 +1,26 @@
 """Applications (Dosare) - Complete workflow routes"""
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Response
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import uuid, os, json, zipfile, io
+import uuid, os, json, zipfile, io, asyncio
 from datetime import datetime, timezone
 from middleware.auth_middleware import get_current_user
 from services.funding_service import (
     get_programs, get_measures, get_calls, get_call, get_templates, get_template,
     APPLICATION_STATES, APPLICATION_STATE_LABELS, APPLICATION_TRANSITIONS, DEFAULT_FOLDER_GROUPS
 )
-from services.ai_service import generate_document_section, validate_coherence, check_eligibility
+from services.ai_service import (
+    generate_document_section, generate_document_sections, stream_document_sections,
+    validate_coherence, check_eligibility, stream_agent
+)
 from services.pdf_service import generate_pdf
+from services.streaming import sse_response, stream_frames, require_token_streaming
+from services.context_builder import build_full_context, bump_context_version
 from services.orchestrator_service import run_orchestrator_check
+from services.guide_service import GUIDE_JOB
+from services import job_queue, guide_index, application_store, pagination, audit_sink, agent_rules
+from services.update_builder import UpdateBuilder
 
 router = APIRouter(prefix="/api/v2", tags=["applications"])
 db = None
@@ -159,6 +167,7 @@ async def create_application(req: CreateApplicationRequest, current_user: dict =
 
     # If custom links provided, extract session data from pages
     extracted_data = {}
+    link_prompt_tokens = None
     if req.custom_links:
         try:
             import httpx
@@ -187,6 +196,7 @@ async def create_application(req: CreateApplicationRequest, current_user: dict =
                     {}
                 )
                 extracted_data["scraped_info"] = extract_result.get("result", "")
+                link_prompt_tokens = extract_result.get("prompt_tokens")
 
                 # Try to fill in missing fields from extraction
                 if not program_name and req.custom_program:
@@ -222,10 +232,9 @@ async def create_application(req: CreateApplicationRequest, current_user: dict =
         "custom_links": req.custom_links or [],
         "extracted_data": extracted_data,
         "status": initial_status, "status_label": APPLICATION_STATE_LABELS[initial_status],
-        "history": initial_history,
-        "guide_assets": [], "required_documents": [], "checklist_frozen": False,
+        "checklist_frozen": False,
         "folder_groups": DEFAULT_FOLDER_GROUPS,
-        "documents": [], "drafts": [], "procurement": [],
+        "procurement": [],
         "budget_estimated": call.get("value_max", 0) if call else 0,
         "budget_approved": 0, "expenses_total": 0,
         "call_budget": call.get("budget") if call else None,
@@ -243,34 +252,47 @@ async def create_application(req: CreateApplicationRequest, current_user: dict =
         },
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat(),
-        "created_by": current_user["user_id"]
+        "created_by": current_user["user_id"],
+        **application_store.new_application_fields()
     }
     await db.applications.insert_one(application)
+    initial_history = [{"id": str(uuid.uuid4()), **h} for h in initial_history]
+    await application_store.add(db, app_id, "history", initial_history)
+    application.update(history=initial_history, guide_assets=[], required_documents=[], documents=[], drafts=[])
 
     # Log agent run for link extraction
     if extracted_data.get("scraped_info"):
-        await db.agent_runs.insert_one({
+        await audit_sink.agent_run({
             "id": str(uuid.uuid4()), "agent_id": "colector",
             "application_id": app_id, "action": "extract_from_links",
             "input": {"links": req.custom_links},
             "output": {"extracted": bool(extracted_data.get("scraped_info"))},
+            "prompt_tokens": link_prompt_tokens,
             "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": current_user["user_id"]
         })
 
-    await db.audit_log.insert_one({"id": str(uuid.uuid4()), "action": "application.created", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"title": req.title, "call": call_name, "links_extracted": bool(extracted_data)}, "timestamp": datetime.now(timezone.utc).isoformat()})
+    await audit_sink.audit({"id": str(uuid.uuid4()), "action": "application.created", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"title": req.title, "call": call_name, "links_extracted": bool(extracted_data)}, "timestamp": datetime.now(timezone.utc).isoformat()})
     application.pop("_id", None)
     return application
 
+def _check_view(view: str):
+    if view not in application_store.VIEWS:
+        raise HTTPException(400, f"View necunoscut: {view} (disponibile: {', '.join(application_store.VIEWS)})")
+
 @router.get("/applications")
-async def list_applications(company_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+async def list_applications(response: Response, company_id: Optional[str] = None, view: str = "summary", cursor: Optional[str] = None, limit: int = 100, current_user: dict = Depends(get_current_user)):
+    """view: summary (default, list fields only) | workflow | documents | full. Newest first; next page via X-Next-Cursor."""
+    _check_view(view)
     q = {"created_by": current_user["user_id"]}
     if company_id: q["company_id"] = company_id
-    apps = await db.applications.find(q, {"_id": 0}).to_list(100)
+    apps, next_cursor = await application_store.list_view(db, q, view, limit=limit, cursor=cursor)
+    pagination.set_next(response, next_cursor)
     return apps
 
 @router.get("/applications/{app_id}")
-async def get_application(app_id: str, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+async def get_application(app_id: str, view: str = "full", current_user: dict = Depends(get_current_user)):
+    _check_view(view)
+    app = await application_store.get_view(db, app_id, view)
     if not app: raise HTTPException(404, "Dosar negăsit")
     return app
 
@@ -281,7 +303,8 @@ async def update_application(app_id: str, updates: dict, current_user: dict = De
     data = {k: v for k, v in updates.items() if k in allowed}
     data["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.applications.update_one({"id": app_id}, {"$set": data})
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    await bump_context_version(db, app_id=app_id)
+    app = await application_store.get_application(db, app_id, parts=application_store.PARTS)
     return app
 
 class CustomTemplateRequest(BaseModel):
@@ -293,23 +316,27 @@ async def add_custom_template(app_id: str, req: CustomTemplateRequest, current_u
     """User creates a custom draft template for this application."""
     tpl = {"id": f"custom_{uuid.uuid4().hex[:8]}", "label": req.label, "category": "custom", "sections": req.sections, "created_by": current_user["user_id"], "created_at": datetime.now(timezone.utc).isoformat()}
     await db.applications.update_one({"id": app_id}, {"$push": {"custom_templates": tpl}})
+    await bump_context_version(db, app_id=app_id)
     return tpl
 
 @router.post("/applications/{app_id}/transition")
 async def transition_application(app_id: str, req: TransitionRequest, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1, "status": 1})
     if not app: raise HTTPException(404, "Dosar negăsit")
     current = app["status"]
     if req.new_state not in APPLICATION_TRANSITIONS.get(current, []):
         raise HTTPException(400, f"Tranziția {current} → {req.new_state} nu este permisă")
     entry = {"from": current, "to": req.new_state, "at": datetime.now(timezone.utc).isoformat(), "by": current_user["user_id"], "reason": req.reason or ""}
-    await db.applications.update_one({"id": app_id}, {"$set": {"status": req.new_state, "status_label": APPLICATION_STATE_LABELS.get(req.new_state), "updated_at": datetime.now(timezone.utc).isoformat()}, "$push": {"history": entry}})
-    await db.audit_log.insert_one({"id": str(uuid.uuid4()), "action": "application.transition", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"from": current, "to": req.new_state}, "timestamp": datetime.now(timezone.utc).isoformat()})
+    await application_store.add_event(db, app_id, entry, {"$set": {"status": req.new_state, "status_label": APPLICATION_STATE_LABELS.get(req.new_state), "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await audit_sink.audit({"id": str(uuid.uuid4()), "action": "application.transition", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"from": current, "to": req.new_state}, "timestamp": datetime.now(timezone.utc).isoformat()})
     return {"message": f"Dosar mutat: {APPLICATION_STATE_LABELS.get(req.new_state)}", "new_state": req.new_state}
 
 # --- Guide & Annexes ---
-@router.post("/applications/{app_id}/guide")
+@router.post("/applications/{app_id}/guide", status_code=202)
 async def upload_guide(app_id: str, file: UploadFile = File(...), tip: str = Form("ghid"), current_user: dict = Depends(get_current_user)):
+    """Store the guide and queue it for parsing; poll GET /api/v2/jobs/{job_id} for the result."""
+    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1})
+    if not app: raise HTTPException(404, "Dosar negăsit")
     upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "guides")
     os.makedirs(upload_dir, exist_ok=True)
     fid = str(uuid.uuid4())
@@ -319,179 +346,12 @@ async def upload_guide(app_id: str, file: UploadFile = File(...), tip: str = For
     filepath = os.path.join(upload_dir, safe)
     with open(filepath, "wb") as f: f.write(raw_content)
 
-    asset = {"id": fid, "filename": file.filename, "stored_name": safe, "file_size": len(raw_content), "tip": tip, "uploaded_at": datetime.now(timezone.utc).isoformat(), "uploaded_by": current_user["user_id"]}
-    agent_actions = []
-
-    # === AGENT PARSER: Extract text content from guide ===
-    try:
-        import base64
-        from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContent
-
-        ext_lower = ext.lower()
-        ct_map = {".pdf": "application/pdf", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
-        content_type = ct_map.get(ext_lower)
-
-        # Load custom rules for parser agent
-        parser_rules = await db.agent_rules.find_one({"agent_id": "parser", "user_id": current_user["user_id"]}, {"_id": 0})
-        parser_extra = "\n".join(parser_rules.get("reguli", [])) if parser_rules else ""
-
-        chat = LlmChat(api_key=os.environ.get("EMERGENT_LLM_KEY", ""), session_id=str(uuid.uuid4()),
-            system_message="Ești expert în analiză ghiduri de finanțare din România. Extrage informații structurate." + (f"\nReguli suplimentare: {parser_extra}" if parser_extra else ""))
-        chat.with_model("openai", "gpt-5.2")
-
-        extract_prompt = (
-            "Analizează acest document (ghid solicitant / anexă / procedură de evaluare) și extrage TOATE informațiile relevante.\n"
-            "Returnează un JSON STRICT cu aceste câmpuri:\n"
-            '{\n'
-            '  "tip_document": "ghid_solicitant / procedura_evaluare / anexa / grila_conformitate / altul",\n'
-            '  "program": "numele programului",\n'
-            '  "masura": "codul și numele măsurii",\n'
-            '  "sesiune": "numele sesiunii/apelului",\n'
-            '  "buget_total": "number sau null",\n'
-            '  "valoare_min_proiect": "number sau null",\n'
-            '  "valoare_max_proiect": "number sau null",\n'
-            '  "beneficiari_eligibili": ["lista tipurilor de beneficiari"],\n'
-            '  "criterii_eligibilitate": ["lista criteriilor de eligibilitate"],\n'
-            '  "documente_obligatorii": [{"nume": "string", "obligatoriu": true/false}],\n'
-            '  "grila_conformitate": [{"criteriu": "string", "punctaj_max": "number sau null"}],\n'
-            '  "termene": {"data_start": "string", "data_sfarsit": "string"},\n'
-            '  "activitati_eligibile": ["lista activităților eligibile"],\n'
-            '  "cheltuieli_eligibile": ["lista cheltuielilor eligibile"],\n'
-            '  "rezumat": "rezumat 3-5 propoziții"\n'
-            '}\n'
-            "IMPORTANT: Returnează DOAR JSON-ul valid. Dacă un câmp nu e disponibil, pune null."
-        )
-
-        if content_type in ["application/pdf", "image/jpeg", "image/png"]:
-            b64 = base64.b64encode(raw_content).decode("utf-8")
-            msg = UserMessage(text=extract_prompt, file_contents=[FileContent(content_type=content_type, file_content_base64=b64)])
-        else:
-            try:
-                text = raw_content.decode("utf-8", errors="replace")
-            except Exception:
-                text = raw_content.decode("latin-1", errors="replace")
-            msg = UserMessage(text=f"{extract_prompt}\n\nCONȚINUT DOCUMENT:\n{text[:8000]}")
-
-        response = await chat.send_message(msg)
-
-        # Parse JSON from response
-        import json as json_mod, re
-        clean = response.strip()
-        if clean.startswith("```"): clean = clean.split("\n", 1)[1] if "\n" in clean else clean[3:]
-        if clean.endswith("```"): clean = clean[:-3]
-        if clean.startswith("json"): clean = clean[4:]
-        clean = clean.strip()
-        start = clean.find("{")
-        end = clean.rfind("}") + 1
-        extracted = {}
-        if start >= 0 and end > start:
-            try:
-                extracted = json_mod.loads(clean[start:end])
-            except Exception:
-                pass
-
-        asset["extracted_content"] = extracted
-        asset["extraction_status"] = "completed" if extracted else "failed"
-        agent_actions.append(f"Parser: Document analizat, {len(extracted)} câmpuri extrase")
-
-        # === AUTO-ACTIONS based on extracted content ===
-        app = await db.applications.find_one({"id": app_id}, {"_id": 0})
-
-        # 1. Update program/session info if missing
-        if extracted and app:
-            updates = {}
-            if extracted.get("program") and not app.get("program_name"):
-                updates["program_name"] = extracted["program"]
-            if extracted.get("masura") and not app.get("measure_name"):
-                updates["measure_name"] = extracted["masura"]
-            if extracted.get("sesiune") and (not app.get("call_name") or app.get("call_name") == "Sesiune custom"):
-                updates["call_name"] = extracted["sesiune"]
-            if extracted.get("valoare_max_proiect") and not app.get("budget_estimated"):
-                try:
-                    updates["budget_estimated"] = float(extracted["valoare_max_proiect"])
-                    updates["call_value_max"] = float(extracted["valoare_max_proiect"])
-                except (ValueError, TypeError): pass
-            if extracted.get("valoare_min_proiect"):
-                try: updates["call_value_min"] = float(extracted["valoare_min_proiect"])
-                except (ValueError, TypeError): pass
-            if extracted.get("buget_total"):
-                try: updates["call_budget"] = float(extracted["buget_total"])
-                except (ValueError, TypeError): pass
-            if extracted.get("beneficiari_eligibili"):
-                updates["call_beneficiaries"] = extracted["beneficiari_eligibili"]
-            if updates:
-                updates["updated_at"] = datetime.now(timezone.utc).isoformat()
-                await db.applications.update_one({"id": app_id}, {"$set": updates})
-                agent_actions.append(f"Colector: Actualizate {', '.join(updates.keys())}")
-
-        # 2. Auto-propose required documents from guide
-        if extracted.get("documente_obligatorii") and app and not app.get("checklist_frozen"):
-            existing_names = [r.get("official_name", "").lower() for r in app.get("required_documents", [])]
-            new_docs = []
-            for i, doc_req in enumerate(extracted["documente_obligatorii"]):
-                name = doc_req.get("nume", "") if isinstance(doc_req, dict) else str(doc_req)
-                if name and name.lower() not in existing_names:
-                    new_docs.append({
-                        "id": str(uuid.uuid4()), "order_index": len(existing_names) + len(new_docs) + 1,
-                        "official_name": name, "required": doc_req.get("obligatoriu", True) if isinstance(doc_req, dict) else True,
-                        "folder_group": "depunere", "status": "missing", "source": "ghid_auto"
-                    })
-            if new_docs:
-                await db.applications.update_one({"id": app_id}, {"$push": {"required_documents": {"$each": new_docs}}})
-                agent_actions.append(f"Checklist: {len(new_docs)} documente cerute adăugate automat din ghid")
-
-        # 3. Store eligibility criteria for later use
-        if extracted.get("criterii_eligibilitate"):
-            await db.applications.update_one({"id": app_id}, {"$set": {"criterii_eligibilitate_ghid": extracted["criterii_eligibilitate"]}})
-            agent_actions.append(f"Eligibilitate: {len(extracted['criterii_eligibilitate'])} criterii extrase din ghid")
-
-        # 4. Store conformity grid
-        if extracted.get("grila_conformitate"):
-            await db.applications.update_one({"id": app_id}, {"$set": {"grila_conformitate_ghid": extracted["grila_conformitate"]}})
-            agent_actions.append(f"Evaluator: Grilă conformitate cu {len(extracted['grila_conformitate'])} criterii extrasă")
-
-        # 5. Store eligible activities/expenses
-        if extracted.get("activitati_eligibile"):
-            await db.applications.update_one({"id": app_id}, {"$set": {"activitati_eligibile": extracted["activitati_eligibile"]}})
-        if extracted.get("cheltuieli_eligibile"):
-            await db.applications.update_one({"id": app_id}, {"$set": {"cheltuieli_eligibile": extracted["cheltuieli_eligibile"]}})
-
-    except Exception as e:
-        import logging
-        logging.getLogger(__name__).error(f"Guide extraction failed: {e}")
-        asset["extraction_status"] = "error"
-        asset["extraction_error"] = str(e)[:200]
-        agent_actions.append(f"Eroare parsare ghid: {str(e)[:100]}")
-
-    # Save asset with extraction results
-    await db.applications.update_one({"id": app_id}, {"$push": {"guide_assets": asset}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}})
-
-    # Auto-transition to guide_ready
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
-    if app and app["status"] == "call_selected":
-        await db.applications.update_one({"id": app_id}, {"$set": {"status": "guide_ready", "status_label": APPLICATION_STATE_LABELS["guide_ready"]}, "$push": {"history": {"from": "call_selected", "to": "guide_ready", "at": datetime.now(timezone.utc).isoformat(), "by": "orchestrator", "reason": "Ghid procesat automat"}}})
-
-    # Log all agent runs
-    for action in agent_actions:
-        agent_name = action.split(":")[0].strip().lower()
-        await db.agent_runs.insert_one({
-            "id": str(uuid.uuid4()), "agent_id": agent_name if agent_name in ["parser", "colector", "eligibilitate", "evaluator", "checklist"] else "orchestrator",
-            "application_id": app_id, "action": "guide_upload_processing",
-            "input": {"filename": file.filename, "tip": tip},
-            "output": {"action": action},
-            "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": current_user["user_id"]
-        })
-
-    await db.audit_log.insert_one({
-        "id": str(uuid.uuid4()), "action": "guide.uploaded_and_processed",
-        "entity_type": "application", "entity_id": app_id,
-        "user_id": current_user["user_id"],
-        "details": {"filename": file.filename, "actions": agent_actions},
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
-
-    asset["agent_actions"] = agent_actions
-    return asset
+    asset = {"id": fid, "filename": file.filename, "stored_name": safe, "file_size": len(raw_content), "tip": tip, "uploaded_at": datetime.now(timezone.utc).isoformat(), "uploaded_by": current_user["user_id"], "extraction_status": "queued", "job_id": str(uuid.uuid4())}
+    # Placeholder first: the worker replaces it and may pick the job up as soon as it is queued
+    await application_store.add(db, app_id, "guide_assets", asset, {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}})
+    asset.pop("_id", None)
+    job = await job_queue.enqueue(GUIDE_JOB, {"application_id": app_id, "asset": asset, "file_path": filepath, "user_id": current_user["user_id"]}, user_id=current_user["user_id"], entity_id=app_id, job_id=asset["job_id"])
+    return {**asset, "job_id": job["id"], "job_status": job["status"], "status_url": f"/api/v2/jobs/{job['id']}"}
 
 # --- Required Documents (Checklist) ---
 class RequiredDocumentRequest(BaseModel):
@@ -502,18 +362,18 @@ class RequiredDocumentRequest(BaseModel):
 
 @router.post("/applications/{app_id}/required-docs")
 async def add_required_doc(app_id: str, req: RequiredDocumentRequest, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1, "checklist_frozen": 1})
     if not app: raise HTTPException(404)
     if app.get("checklist_frozen"): raise HTTPException(400, "Checklist-ul este înghețat")
-    existing = app.get("required_documents", [])
-    doc = {"id": str(uuid.uuid4()), "order_index": len(existing) + 1, "official_name": req.official_name, "required": req.required, "folder_group": req.folder_group, "guide_reference": req.guide_reference, "status": "missing"}
-    await db.applications.update_one({"id": app_id}, {"$push": {"required_documents": doc}})
+    existing = (await application_store.counts(db, app_id, ("required_documents",)))["required_documents"]
+    doc = {"id": str(uuid.uuid4()), "order_index": existing + 1, "official_name": req.official_name, "required": req.required, "folder_group": req.folder_group, "guide_reference": req.guide_reference, "status": "missing"}
+    await application_store.add(db, app_id, "required_documents", doc)
     return doc
 
 @router.post("/applications/{app_id}/required-docs/propose")
 async def propose_required_docs(app_id: str, current_user: dict = Depends(get_current_user)):
     """AI agent proposes required documents from guide."""
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    app = await application_store.get_application(db, app_id, parts=("guide_assets",))
     if not app: raise HTTPException(404)
     guide_info = ", ".join([a["filename"] for a in app.get("guide_assets", [])])
     call = get_call(app.get("call_id", ""))
@@ -525,11 +385,15 @@ async def propose_required_docs(app_id: str, current_user: dict = Depends(get_cu
 @router.post("/applications/{app_id}/required-docs/freeze")
 async def freeze_checklist(app_id: str, current_user: dict = Depends(get_current_user)):
     await db.applications.update_one({"id": app_id}, {"$set": {"checklist_frozen": True, "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await bump_context_version(db, app_id=app_id)
     return {"message": "Checklist înghețat"}
 
 # --- Documents in folders ---
 @router.post("/applications/{app_id}/documents")
-async def upload_app_document(app_id: str, file: UploadFile = File(...), folder_group: str = Form("depunere"), required_doc_id: Optional[str] = Form(None), tip_document: Optional[str] = Form(None), current_user: dict = Depends(get_current_user)):
+async def upload_app_document(app_id: str, file: UploadFile = File(...), folder_group: str = Form("depunere"), required_doc_id: Optional[str] = Form(None), tip_document: Optional[str] = Form(None), force_ocr: bool = Form(False), current_user: dict = Depends(get_current_user)):
+    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1, "company_id": 1})
+    if not app: raise HTTPException(404, "Dosar negăsit")
+    head = UpdateBuilder()  # head changes from the upload and its OCR, written once at the end
     upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "app_docs")
     os.makedirs(upload_dir, exist_ok=True)
     did = str(uuid.uuid4())
@@ -561,52 +425,43 @@ async def upload_app_document(app_id: str, file: UploadFile = File(...), folder_
         "uploaded_at": datetime.now(timezone.utc).isoformat(),
         "uploaded_by": current_user["user_id"]
     }
-    await db.applications.update_one({"id": app_id}, {"$push": {"documents": doc}})
+    await application_store.add(db, app_id, "documents", doc, head)
 
     # Update required doc status
     if required_doc_id:
-        await db.applications.update_one(
-            {"id": app_id, "required_documents.id": required_doc_id},
-            {"$set": {"required_documents.$.status": "uploaded"}}
-        )
+        await application_store.update_item(db, app_id, "required_documents", required_doc_id, {"status": "uploaded"}, head)
 
     # Run OCR automatically
     ocr_actions = []
     try:
         from services.ocr_service import process_ocr
-        ocr_result = await process_ocr(did, tip_document, file.filename, db, file_path=filepath)
+        ocr_result = await process_ocr(did, tip_document, file.filename, db, file_path=filepath, force_refresh=force_ocr)
         doc["ocr_status"] = ocr_result.get("status", "pending")
         doc["ocr_data"] = ocr_result
         ocr_actions.append(f"OCR executat: {ocr_result.get('status')} (încredere: {ocr_result.get('overall_confidence', 0):.0%})")
 
         # Update doc with OCR results
-        await db.applications.update_one(
-            {"id": app_id, "documents.id": did},
-            {"$set": {
-                "documents.$.ocr_status": ocr_result.get("status"),
-                "documents.$.ocr_data": ocr_result
-            }}
-        )
+        await application_store.update_item(db, app_id, "documents", did, {"ocr_status": ocr_result.get("status"), "ocr_data": ocr_result}, head)
 
         # Extract and apply data based on document type
         fields = ocr_result.get("extracted_fields", {})
-        app = await db.applications.find_one({"id": app_id}, {"_id": 0})
 
         if fields and tip_document == "factura":
             try:
                 total = float(str(fields.get("total", "0")).replace(",", ".").replace(" ", ""))
                 if total > 0:
-                    await db.applications.update_one({"id": app_id}, {"$inc": {"expenses_total": total}})
+                    head.inc("expenses_total", total)
                     ocr_actions.append(f"Cheltuială detectată: {total} RON (factură {fields.get('numar_factura', 'N/A')})")
             except (ValueError, TypeError):
                 pass
 
-        if fields and tip_document == "bilant" and app:
+        if fields and tip_document == "bilant":
             company_id = app.get("company_id")
             if company_id:
                 await db.organizations.update_one({"id": company_id}, {
                     "$set": {"date_financiare_ocr": fields, "updated_at": datetime.now(timezone.utc).isoformat()}
                 })
+                await bump_context_version(db, company_id=company_id)
                 ocr_actions.append("Date financiare extrase și salvate la firmă")
 
         if fields and tip_document == "contract":
@@ -621,8 +476,11 @@ async def upload_app_document(app_id: str, file: UploadFile = File(...), folder_
         doc["ocr_status"] = "error"
         ocr_actions.append(f"OCR eroare: {str(e)[:100]}")
 
+    head.set("updated_at", datetime.now(timezone.utc).isoformat())
+    await head.commit(db.applications, {"id": app_id}, {"_id": 0, "id": 1})
+
     # Log agent run
-    await db.agent_runs.insert_one({
+    await audit_sink.agent_run({
         "id": str(uuid.uuid4()), "agent_id": "parser",
         "application_id": app_id, "action": "ocr_document",
         "input": {"filename": file.filename, "tip": tip_document, "folder": folder_group},
@@ -637,44 +495,45 @@ async def upload_app_document(app_id: str, file: UploadFile = File(...), folder_
 
 @router.delete("/applications/{app_id}/documents/{doc_id}")
 async def delete_app_document(app_id: str, doc_id: str, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1})
     if not app: raise HTTPException(404, "Dosar negăsit")
-    doc = next((d for d in app.get("documents", []) if d["id"] == doc_id), None)
+    doc = await application_store.get_item(db, app_id, "documents", doc_id)
     if not doc: raise HTTPException(404, "Document negăsit")
-    # Remove from documents array
-    await db.applications.update_one({"id": app_id}, {"$pull": {"documents": {"id": doc_id}}})
+    await application_store.remove_item(db, app_id, "documents", doc_id)
     # If linked to required doc, reset status to missing
     if doc.get("required_doc_id"):
-        await db.applications.update_one({"id": app_id, "required_documents.id": doc["required_doc_id"]}, {"$set": {"required_documents.$.status": "missing"}})
+        await application_store.update_item(db, app_id, "required_documents", doc["required_doc_id"], {"status": "missing"})
     # Delete physical file
     for d in ["uploads/app_docs", "uploads/generated"]:
         fpath = os.path.join(os.path.dirname(os.path.dirname(__file__)), d, doc.get("stored_name", ""))
         if os.path.exists(fpath):
             os.remove(fpath)
             break
-    await db.audit_log.insert_one({"id": str(uuid.uuid4()), "action": "document.deleted", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"filename": doc.get("filename"), "folder": doc.get("folder_group")}, "timestamp": datetime.now(timezone.utc).isoformat()})
+    await audit_sink.audit({"id": str(uuid.uuid4()), "action": "document.deleted", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"filename": doc.get("filename"), "folder": doc.get("folder_group")}, "timestamp": datetime.now(timezone.utc).isoformat()})
     return {"message": f"Document '{doc.get('filename')}' șters"}
 
 @router.delete("/applications/{app_id}/guide/{guide_id}")
 async def delete_guide(app_id: str, guide_id: str, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1})
     if not app: raise HTTPException(404, "Dosar negăsit")
-    guide = next((g for g in app.get("guide_assets", []) if g["id"] == guide_id), None)
+    guide = await application_store.get_item(db, app_id, "guide_assets", guide_id)
     if not guide: raise HTTPException(404, "Ghid negăsit")
-    await db.applications.update_one({"id": app_id}, {"$pull": {"guide_assets": {"id": guide_id}}})
+    await application_store.remove_item(db, app_id, "guide_assets", guide_id)
     fpath = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "guides", guide.get("stored_name", ""))
     if os.path.exists(fpath): os.remove(fpath)
-    await db.audit_log.insert_one({"id": str(uuid.uuid4()), "action": "guide.deleted", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"filename": guide.get("filename")}, "timestamp": datetime.now(timezone.utc).isoformat()})
+    await guide_index.remove_guide(app_id, guide_id)
+    await audit_sink.audit({"id": str(uuid.uuid4()), "action": "guide.deleted", "entity_type": "application", "entity_id": app_id, "user_id": current_user["user_id"], "details": {"filename": guide.get("filename")}, "timestamp": datetime.now(timezone.utc).isoformat()})
     return {"message": f"Ghid '{guide.get('filename')}' șters"}
 
 # --- Drafts ---
 class GenerateDraftRequest(BaseModel):
     template_id: str
     section: Optional[str] = None
+    no_cache: bool = False
+    parallel: bool = False  # one completion per template section, generated concurrently
 
-@router.post("/applications/{app_id}/drafts/generate")
-async def generate_draft(app_id: str, req: GenerateDraftRequest, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+async def _load_draft_inputs(app_id: str, req: GenerateDraftRequest, user_id: str) -> tuple:
+    app = await db.applications.find_one({"id": app_id}, application_store.HEAD_PROJECTION)
     if not app: raise HTTPException(404)
     tpl = get_template(req.template_id)
     if not tpl:
@@ -683,68 +542,137 @@ async def generate_draft(app_id: str, req: GenerateDraftRequest, current_user: d
     if not tpl: raise HTTPException(404, "Template negăsit")
 
     # Build full context
-    from services.context_builder import build_full_context
     full_ctx = await build_full_context(app_id, db)
 
-    section = req.section or ", ".join(tpl.get("sections", []))
-    custom_rules = await db.agent_rules.find_one({"agent_id": "redactor", "user_id": current_user["user_id"]}, {"_id": 0})
-    extra_rules = "\n".join(custom_rules.get("reguli", [])) if custom_rules else ""
+    custom_rules = await agent_rules.get(db, "redactor", user_id)
+    return app, tpl, full_ctx, custom_rules
 
-    result = await generate_document_section(
-        template=f"{tpl['label']}: {', '.join(tpl.get('sections', []))}",
-        data={}, section=section,
-        full_context=full_ctx, extra_rules=extra_rules
-    )
-    content_text = result.get("result", "")
+async def _persist_draft(app: dict, tpl: dict, template_id: str, content_text: str, custom_rules: Optional[dict], user_id: str, prompt_tokens: Optional[int] = None) -> dict:
+    """Render the PDF and store draft + folder document + agent run."""
+    app_id = app["id"]
     org = await db.organizations.find_one({"id": app.get("company_id")}, {"_id": 0})
-    pdf_file = generate_pdf(tpl["label"], content_text, (org or {}).get("denumire", ""), app["title"])
-    draft = {"id": str(uuid.uuid4()), "template_id": req.template_id, "template_label": tpl["label"], "content": content_text, "pdf_filename": pdf_file, "status": "draft", "version": 1, "created_at": datetime.now(timezone.utc).isoformat(), "created_by": current_user["user_id"], "applied_rules": (custom_rules.get("reguli", []) if custom_rules else [])}
-    await db.applications.update_one({"id": app_id}, {"$push": {"drafts": draft}})
+    pdf_file = await asyncio.to_thread(generate_pdf, tpl["label"], content_text, (org or {}).get("denumire", ""), app["title"])
+    draft = {"id": str(uuid.uuid4()), "template_id": template_id, "template_label": tpl["label"], "content": content_text, "pdf_filename": pdf_file, "status": "draft", "version": 1, "created_at": datetime.now(timezone.utc).isoformat(), "created_by": user_id, "applied_rules": (custom_rules.get("reguli", []) if custom_rules else [])}
+    head = UpdateBuilder()
+    await application_store.add(db, app_id, "drafts", draft, head)
     gen_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "generated")
-    doc_entry = {"id": str(uuid.uuid4()), "filename": f"{tpl['label']}.pdf", "stored_name": pdf_file, "file_size": os.path.getsize(os.path.join(gen_dir, pdf_file)), "content_type": "application/pdf", "folder_group": "depunere", "status": "uploaded", "uploaded_at": datetime.now(timezone.utc).isoformat(), "uploaded_by": current_user["user_id"], "draft_id": draft["id"]}
-    await db.applications.update_one({"id": app_id}, {"$push": {"documents": doc_entry}})
+    doc_entry = {"id": str(uuid.uuid4()), "filename": f"{tpl['label']}.pdf", "stored_name": pdf_file, "file_size": os.path.getsize(os.path.join(gen_dir, pdf_file)), "content_type": "application/pdf", "folder_group": "depunere", "status": "uploaded", "uploaded_at": datetime.now(timezone.utc).isoformat(), "uploaded_by": user_id, "draft_id": draft["id"]}
+    await application_store.add(db, app_id, "documents", doc_entry, head)
+    await head.set("updated_at", datetime.now(timezone.utc).isoformat()).commit(db.applications, {"id": app_id}, {"_id": 0, "id": 1})
     draft["pdf_url"] = f"/api/v2/drafts/download/{pdf_file}"
-    await db.agent_runs.insert_one({"id": str(uuid.uuid4()), "agent_id": "redactor", "application_id": app_id, "action": "generate_draft", "input": {"template": tpl["label"]}, "output": {"draft_id": draft["id"]}, "applied_rules": draft.get("applied_rules", []), "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": current_user["user_id"]})
+    await audit_sink.agent_run({"id": str(uuid.uuid4()), "agent_id": "redactor", "application_id": app_id, "action": "generate_draft", "input": {"template": tpl["label"]}, "output": {"draft_id": draft["id"]}, "applied_rules": draft.get("applied_rules", []), "prompt_tokens": prompt_tokens, "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": user_id})
+    draft.pop("_id", None)
+    return draft
+
+@router.post("/applications/{app_id}/drafts/generate")
+async def generate_draft(app_id: str, req: GenerateDraftRequest, current_user: dict = Depends(get_current_user)):
+    app, tpl, full_ctx, custom_rules = await _load_draft_inputs(app_id, req, current_user["user_id"])
+    sections = tpl.get("sections", [])
+    template = f"{tpl['label']}: {', '.join(sections)}"
+    extra_rules = "\n".join(custom_rules.get("reguli", [])) if custom_rules else ""
+
+    if req.parallel and not req.section and len(sections) > 1:
+        result = await generate_document_sections(template, sections, full_context=full_ctx, extra_rules=extra_rules, use_cache=not req.no_cache)
+    else:
+        result = await generate_document_section(
+            template=template,
+            data={}, section=req.section or ", ".join(sections),
+            full_context=full_ctx, extra_rules=extra_rules, use_cache=not req.no_cache
+        )
+    draft = await _persist_draft(app, tpl, req.template_id, result.get("result", ""), custom_rules, current_user["user_id"], result.get("prompt_tokens"))
+    if result.get("failed_sections"):
+        draft["failed_sections"] = result["failed_sections"]
     return draft
 
+@router.post("/applications/{app_id}/drafts/generate/stream")
+async def generate_draft_stream(app_id: str, req: GenerateDraftRequest, current_user: dict = Depends(get_current_user)):
+    """SSE variant of generate_draft: tokens as they arrive (whole sections with parallel=true), the saved
+    draft (with PDF) as the final event."""
+    app, tpl, full_ctx, custom_rules = await _load_draft_inputs(app_id, req, current_user["user_id"])
+    sections = tpl.get("sections", [])
+    template = f"{tpl['label']}: {', '.join(sections)}"
+    extra_rules = "\n".join(custom_rules.get("reguli", [])) if custom_rules else ""
+    usage = {}
+    if req.parallel and not req.section and len(sections) > 1:
+        deltas = stream_document_sections(template, sections, full_context=full_ctx, extra_rules=extra_rules, use_cache=not req.no_cache, usage=usage)
+    else:
+        require_token_streaming()
+        deltas = stream_agent(
+            "redactor", template, {}, req.section or ", ".join(sections),
+            full_context=full_ctx, extra_rules=extra_rules, use_cache=not req.no_cache, usage=usage
+        )
+    async def on_complete(text: str) -> dict:
+        return await _persist_draft(app, tpl, req.template_id, text, custom_rules, current_user["user_id"], usage.get("prompt_tokens"))
+    return sse_response(stream_frames(deltas, on_complete, {"agent": "redactor", "template": tpl["label"], "parallel": req.parallel}))
+
 @router.get("/applications/{app_id}/drafts")
 async def list_drafts(app_id: str, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "drafts": 1})
-    return app.get("drafts", []) if app else []
+    return await application_store.list_items(db, app_id, "drafts")
 
 # --- Validation & Evaluation ---
-@router.post("/applications/{app_id}/validate")
-async def validate_application(app_id: str, current_user: dict = Depends(get_current_user)):
-    from services.context_builder import build_full_context
+# (agent_id, report type, agent_runs action) per report endpoint
+REPORT_AGENTS = {
+    "validate": ("validator", "validation", "validate"),
+    "evaluate": ("eligibilitate", "evaluation", "evaluate"),
+}
+
+async def _load_report_inputs(app_id: str, agent_id: str, user_id: str) -> tuple:
     full_ctx = await build_full_context(app_id, db)
     if not full_ctx: raise HTTPException(404)
-    custom_rules = await db.agent_rules.find_one({"agent_id": "validator", "user_id": current_user["user_id"]}, {"_id": 0})
-    extra = "\n".join(custom_rules.get("reguli", [])) if custom_rules else ""
-    result = await validate_coherence([], {}, full_context=full_ctx, extra_rules=extra)
-    report = {"id": str(uuid.uuid4()), "type": "validation", "application_id": app_id, "result": result.get("result", ""), "created_at": datetime.now(timezone.utc).isoformat()}
+    custom_rules = await agent_rules.get(db, agent_id, user_id)
+    return full_ctx, custom_rules
+
+async def _persist_report(app_id: str, kind: str, result_text: str, custom_rules: Optional[dict], user_id: str, prompt_tokens: Optional[int] = None) -> dict:
+    agent_id, report_type, action = REPORT_AGENTS[kind]
+    report = {"id": str(uuid.uuid4()), "type": report_type, "application_id": app_id, "result": result_text, "created_at": datetime.now(timezone.utc).isoformat()}
     await db.compliance_reports.insert_one(report)
-    await db.agent_runs.insert_one({"id": str(uuid.uuid4()), "agent_id": "validator", "application_id": app_id, "action": "validate", "applied_rules": (custom_rules.get("reguli", []) if custom_rules else []), "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": current_user["user_id"]})
+    await bump_context_version(db, app_id=app_id)
+    await audit_sink.agent_run({"id": str(uuid.uuid4()), "agent_id": agent_id, "application_id": app_id, "action": action, "applied_rules": (custom_rules.get("reguli", []) if custom_rules else []), "prompt_tokens": prompt_tokens, "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": user_id})
     report.pop("_id", None)
     return report
 
+@router.post("/applications/{app_id}/validate")
+async def validate_application(app_id: str, no_cache: bool = False, current_user: dict = Depends(get_current_user)):
+    full_ctx, custom_rules = await _load_report_inputs(app_id, "validator", current_user["user_id"])
+    extra = "\n".join(custom_rules.get("reguli", [])) if custom_rules else ""
+    result = await validate_coherence([], {}, full_context=full_ctx, extra_rules=extra, use_cache=not no_cache)
+    return await _persist_report(app_id, "validate", result.get("result", ""), custom_rules, current_user["user_id"], result.get("prompt_tokens"))
+
 @router.post("/applications/{app_id}/evaluate")
-async def evaluate_application(app_id: str, current_user: dict = Depends(get_current_user)):
-    from services.context_builder import build_full_context
-    full_ctx = await build_full_context(app_id, db)
-    if not full_ctx: raise HTTPException(404)
-    custom_rules = await db.agent_rules.find_one({"agent_id": "eligibilitate", "user_id": current_user["user_id"]}, {"_id": 0})
+async def evaluate_application(app_id: str, no_cache: bool = False, current_user: dict = Depends(get_current_user)):
+    full_ctx, custom_rules = await _load_report_inputs(app_id, "eligibilitate", current_user["user_id"])
     extra = "\n".join(custom_rules.get("reguli", [])) if custom_rules else ""
-    result = await check_eligibility({}, {}, full_context=full_ctx, extra_rules=extra)
-    report = {"id": str(uuid.uuid4()), "type": "evaluation", "application_id": app_id, "result": result.get("result", ""), "created_at": datetime.now(timezone.utc).isoformat()}
-    await db.compliance_reports.insert_one(report)
-    await db.agent_runs.insert_one({"id": str(uuid.uuid4()), "agent_id": "eligibilitate", "application_id": app_id, "action": "evaluate", "applied_rules": (custom_rules.get("reguli", []) if custom_rules else []), "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": current_user["user_id"]})
-    report.pop("_id", None)
-    return report
+    result = await check_eligibility({}, {}, full_context=full_ctx, extra_rules=extra, use_cache=not no_cache)
+    return await _persist_report(app_id, "evaluate", result.get("result", ""), custom_rules, current_user["user_id"], result.get("prompt_tokens"))
+
+async def _report_stream(app_id: str, kind: str, no_cache: bool, user_id: str):
+    require_token_streaming()
+    agent_id = REPORT_AGENTS[kind][0]
+    full_ctx, custom_rules = await _load_report_inputs(app_id, agent_id, user_id)
+    extra = "\n".join(custom_rules.get("reguli", [])) if custom_rules else ""
+    usage = {}
+    if kind == "validate":
+        deltas = stream_agent("validator", [], {}, full_context=full_ctx, extra_rules=extra, use_cache=not no_cache, usage=usage)
+    else:
+        deltas = stream_agent("eligibilitate", {}, {}, full_context=full_ctx, extra_rules=extra, use_cache=not no_cache, usage=usage)
+    async def on_complete(text: str) -> dict:
+        return await _persist_report(app_id, kind, text, custom_rules, user_id, usage.get("prompt_tokens"))
+    return sse_response(stream_frames(deltas, on_complete, {"agent": agent_id}))
+
+@router.post("/applications/{app_id}/validate/stream")
+async def validate_application_stream(app_id: str, no_cache: bool = False, current_user: dict = Depends(get_current_user)):
+    """SSE variant of validate; the stored report is the final event."""
+    return await _report_stream(app_id, "validate", no_cache, current_user["user_id"])
+
+@router.post("/applications/{app_id}/evaluate/stream")
+async def evaluate_application_stream(app_id: str, no_cache: bool = False, current_user: dict = Depends(get_current_user)):
+    """SSE variant of evaluate; the stored report is the final event."""
+    return await _report_stream(app_id, "evaluate", no_cache, current_user["user_id"])
 
 # --- ZIP Export ---
 @router.get("/applications/{app_id}/export")
 async def export_application_zip(app_id: str, current_user: dict = Depends(get_current_user)):
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    app = await application_store.get_application(db, app_id, parts=("documents", "guide_assets"))
     if not app: raise HTTPException(404)
     zip_buffer = io.BytesIO()
     base_dirs = [
@@ -781,11 +709,23 @@ async def export_application_zip(app_id: str, current_user: dict = Depends(get_c
 
 # --- Orchestrator ---
 @router.post("/applications/{app_id}/orchestrator")
-async def orchestrator_check(app_id: str, current_user: dict = Depends(get_current_user)):
-    """Run orchestrator agent to check all agents and determine actions."""
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+async def orchestrator_check(app_id: str, mode: str = "full", current_user: dict = Depends(get_current_user)):
+    """Run orchestrator agent to check all agents and determine actions.
+    mode=fast returns the deterministic checks immediately; the AI analysis follows via the check id."""
+    if mode not in ("full", "fast"): raise HTTPException(400, "Mod invalid (full | fast)")
+    app = await db.applications.find_one({"id": app_id}, application_store.HEAD_PROJECTION)
     if not app: raise HTTPException(404, "Dosar negăsit")
     org = await db.organizations.find_one({"id": app.get("company_id")}, {"_id": 0})
     if not org: raise HTTPException(404, "Firmă negăsită")
-    result = await run_orchestrator_check(app, org, db, user_id=current_user["user_id"])
+    result = await run_orchestrator_check(app, org, db, user_id=current_user["user_id"], mode=mode)
     return result
+
+
+@router.get("/applications/{app_id}/orchestrator/{check_id}")
+async def get_orchestrator_check(app_id: str, check_id: str, current_user: dict = Depends(get_current_user)):
+    """Stored orchestrator check; ai_status turns "completed" once the queued analysis is attached."""
+    check = await db.orchestrator_checks.find_one({"id": check_id, "application_id": app_id}, {"_id": 0})
+    if not check or check.get("user_id") != current_user["user_id"]:
+        raise HTTPException(404, "Verificare negăsită")
+    check.pop("user_id", None)
+    return check
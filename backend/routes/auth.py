@@ -7,6 +7,7 @@ from datetime import datetime, timezone, timedelta
 from services.auth_service import hash_password, verify_password, create_token
 from middleware.auth_middleware import get_current_user
 from services.email_service import send_verification_email, send_password_reset_email
+from services import audit_sink
 import logging
 
 logger = logging.getLogger(__name__)
@@ -84,7 +85,7 @@ async def register(req: RegisterRequest):
     email_result = await send_verification_email(req.email, verification_token, req.prenume)
     logger.info(f"Verification email result for {req.email}: {email_result}")
 
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "user.registered",
         "entity_type": "user",
@@ -129,7 +130,7 @@ async def verify_email(req: VerifyEmailRequest):
         }
     })
 
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "user.email_verified",
         "entity_type": "user",
@@ -212,7 +213,7 @@ async def request_reset_password(req: ResetPasswordRequest):
     if recent_resets >= 3:
         raise HTTPException(status_code=429, detail="Prea multe cereri de resetare. Încercați mai târziu.")
 
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "user.password_reset_requested",
         "entity_type": "user",
@@ -247,7 +248,7 @@ async def confirm_reset_password(req: ResetPasswordConfirm):
         }
     })
 
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "user.password_reset_completed",
         "entity_type": "user",
@@ -274,7 +275,7 @@ async def change_password(req: ChangePasswordRequest, current_user: dict = Depen
         }
     })
 
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "user.password_changed",
         "entity_type": "user",
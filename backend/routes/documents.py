@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Response
 from typing import Optional, List
 import uuid
 import os
@@ -6,6 +6,7 @@ from datetime import datetime, timezone
 from middleware.auth_middleware import get_current_user, require_doc_permission
 from services.ocr_service import process_ocr, correct_ocr_field
 from services.orchestrator_service import auto_process_upload
+from services import pagination, audit_sink
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 db = None
@@ -71,7 +72,7 @@ async def upload_document(
         "created_by": current_user["user_id"]
     }
     await db.documents.insert_one(doc)
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "document.uploaded",
         "entity_type": "document",
@@ -95,10 +96,13 @@ async def upload_document(
 
 @router.get("")
 async def list_documents(
+    response: Response,
     organizatie_id: Optional[str] = None,
     project_id: Optional[str] = None,
     tip: Optional[str] = None,
     faza: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 200,
     current_user: dict = Depends(get_current_user)
 ):
     query = {}
@@ -110,7 +114,8 @@ async def list_documents(
         query["tip"] = tip
     if faza:
         query["faza"] = faza
-    docs = await db.documents.find(query, {"_id": 0}).to_list(200)
+    docs, next_cursor = await pagination.page(db.documents, query, cursor=cursor, limit=limit)
+    pagination.set_next(response, next_cursor)
     return docs
 
 @router.get("/types")
@@ -169,13 +174,13 @@ async def update_document_status(doc_id: str, status: str, current_user: dict =
     return {"message": f"Status actualizat: {status}"}
 
 @router.post("/{doc_id}/ocr")
-async def trigger_ocr(doc_id: str, current_user: dict = Depends(get_current_user)):
-    """Trigger OCR processing for a document."""
+async def trigger_ocr(doc_id: str, force_refresh: bool = False, current_user: dict = Depends(get_current_user)):
+    """Trigger OCR processing for a document. force_refresh bypasses the content-hash OCR cache."""
     doc = await db.documents.find_one({"id": doc_id}, {"_id": 0})
     if not doc:
         raise HTTPException(status_code=404, detail="Document negăsit")
-    result = await process_ocr(doc_id, doc.get("tip", "altele"), doc.get("filename", ""), db)
-    await db.audit_log.insert_one({
+    result = await process_ocr(doc_id, doc.get("tip", "altele"), doc.get("filename", ""), db, force_refresh=force_refresh)
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "document.ocr_processed",
         "entity_type": "document",
@@ -4,6 +4,7 @@ from typing import Optional
 import uuid
 from datetime import datetime, timezone
 from middleware.auth_middleware import get_current_user
+from services import audit_sink, cache_bus
 
 router = APIRouter(prefix="/api/integrations", tags=["integrations"])
 db = None
@@ -12,6 +13,17 @@ def set_db(database):
     global db
     db = database
 
+# All integration configs in one entry (a handful of documents, read on every integrations page)
+_configs = cache_bus.LocalCache("integration_configs", max_entries=1)
+cache_bus.subscribe("integrations_config", lambda doc: _configs.clear())
+
+async def _load_configs() -> dict:
+    hit, configs = _configs.get("all")
+    if not hit:
+        configs = {c["integration_id"]: c async for c in db.integrations_config.find({}, {"_id": 0})}
+        _configs.set("all", configs)
+    return configs
+
 DEFAULT_INTEGRATIONS = {
     "firme": [
         {"id": "openapi_ro", "nume": "OpenAPI.ro", "categorie": "firme", "descriere": "Date firme din Registrul Comerțului (ONRC) - CUI, denumire, adresă, CAEN, administratori", "url_config": "https://openapi.ro", "env_key": "OPENAPI_RO_KEY", "status": "activ", "fields": ["CUI", "Denumire", "Adresă", "CAEN", "Nr. Reg. Com.", "Administratori", "Asociați", "Capital social"]},
@@ -42,10 +54,11 @@ class ConfigureIntegrationRequest(BaseModel):
 @router.get("")
 async def list_integrations(current_user: dict = Depends(get_current_user)):
     result = {}
+    configs = await _load_configs()
     for cat, integrations in DEFAULT_INTEGRATIONS.items():
         items = []
         for integ in integrations:
-            config = await db.integrations_config.find_one({"integration_id": integ["id"]}, {"_id": 0})
+            config = configs.get(integ["id"])
             item = {**integ}
             if config:
                 item["status"] = "activ" if config.get("enabled", True) and config.get("api_key") else integ["status"]
@@ -63,7 +76,7 @@ async def get_integration(integration_id: str, current_user: dict = Depends(get_
     for cat, integrations in DEFAULT_INTEGRATIONS.items():
         for integ in integrations:
             if integ["id"] == integration_id:
-                config = await db.integrations_config.find_one({"integration_id": integration_id}, {"_id": 0})
+                config = (await _load_configs()).get(integration_id)
                 item = {**integ}
                 if config:
                     item["configured"] = True
@@ -103,7 +116,8 @@ async def configure_integration(integration_id: str, req: ConfigureIntegrationRe
     await db.integrations_config.update_one(
         {"integration_id": integration_id}, {"$set": config}, upsert=True
     )
-    await db.audit_log.insert_one({
+    cache_bus.invalidate("integrations_config", config)
+    await audit_sink.audit({
         "id": str(uuid.uuid4()), "action": "integration.configured",
         "entity_type": "integration", "entity_id": integration_id,
         "user_id": current_user["user_id"],
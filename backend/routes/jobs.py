@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException, Depends
+from middleware.auth_middleware import get_current_user
+from services import job_queue
+
+router = APIRouter(prefix="/api/v2/jobs", tags=["jobs"])
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Background job status: queued → running → completed | failed, with progress and result."""
+    job = await job_queue.get_job(job_id)
+    if not job or job.get("user_id") != current_user["user_id"]:
+        raise HTTPException(404, "Job negăsit")
+    return job
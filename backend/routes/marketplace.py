@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel
 from typing import Optional, List
 import uuid
 from datetime import datetime, timezone
 from middleware.auth_middleware import get_current_user
+from services import pagination
 
 router = APIRouter(prefix="/api/marketplace", tags=["marketplace"])
 db = None
@@ -52,18 +53,23 @@ async def create_specialist_profile(req: CreateSpecialistProfile, current_user:
 
 @router.get("/specialists")
 async def list_specialists(
+    response: Response,
     specializare: Optional[str] = None,
-    disponibilitate: Optional[str] = None
+    disponibilitate: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100
 ):
     query = {}
     if specializare:
         query["specializare"] = {"$regex": specializare, "$options": "i"}
     if disponibilitate:
         query["disponibilitate"] = disponibilitate
-    specialists = await db.specialists.find(query, {"_id": 0}).to_list(100)
-    # Enrich with user data
+    specialists, next_cursor = await pagination.page(db.specialists, query, cursor=cursor, limit=limit)
+    pagination.set_next(response, next_cursor)
+    # Enrich with user data (one lookup for the whole page)
+    users = {u["id"]: u async for u in db.users.find({"id": {"$in": [s["user_id"] for s in specialists]}}, {"_id": 0, "id": 1, "nume": 1, "prenume": 1})}
     for s in specialists:
-        user = await db.users.find_one({"id": s["user_id"]}, {"_id": 0, "password_hash": 0})
+        user = users.get(s["user_id"])
         if user:
             s["nume"] = user.get("nume", "")
             s["prenume"] = user.get("prenume", "")
@@ -1,13 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Response
 from pydantic import BaseModel, Field
 from typing import Optional, List
 import uuid
 import os
+import time
+import asyncio
+import logging
 from datetime import datetime, timezone
 from middleware.auth_middleware import get_current_user, require_org_permission
 from services.onrc_service import lookup_cui, get_certificat_constatator
 from services.anaf_service import get_financial_data, get_financial_history, check_obligatii_restante
 from services.ocr_service import process_ocr
+from services import pagination, audit_sink, cache_bus
+from services.context_builder import bump_context_version
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/organizations", tags=["organizations"])
 db = None
@@ -84,7 +91,7 @@ async def create_organization(req: CreateOrgRequest, current_user: dict = Depend
         "created_by": current_user["user_id"]
     }
     await db.organizations.insert_one(org_doc)
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "organization.created",
         "entity_type": "organization",
@@ -103,31 +110,44 @@ async def create_organization_manual(
     ci_file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
-    """Create organization by uploading ONRC + CI. Agents handle OCR → extract → validate → store."""
+    """Create organization by uploading ONRC + CI. Agents handle OCR → extract → validate → store.
+    The two documents are independent, so each stage handles both concurrently; onboarding latency
+    is bounded by the slower OCR rather than their sum. Stage timings are returned and audited."""
     upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "onrc")
     os.makedirs(upload_dir, exist_ok=True)
+    timings = {}
+    started = time.perf_counter()
+
+    def _mark(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        timings[stage] = round((now - since) * 1000, 1)
+        return now
 
-    # Save ONRC document
+    # Stage 1: read + save both documents
     onrc_id = str(uuid.uuid4())
     onrc_ext = os.path.splitext(onrc_file.filename)[1] if onrc_file.filename else ""
     onrc_safe = f"{onrc_id}{onrc_ext}"
-    onrc_content = await onrc_file.read()
-    with open(os.path.join(upload_dir, onrc_safe), "wb") as f:
-        f.write(onrc_content)
-
-    # Save CI document
     ci_id = str(uuid.uuid4())
     ci_ext = os.path.splitext(ci_file.filename)[1] if ci_file.filename else ""
     ci_safe = f"{ci_id}{ci_ext}"
-    ci_content = await ci_file.read()
-    with open(os.path.join(upload_dir, ci_safe), "wb") as f:
-        f.write(ci_content)
-
-    # Agent Parser: OCR both documents with file paths
     onrc_path = os.path.join(upload_dir, onrc_safe)
     ci_path = os.path.join(upload_dir, ci_safe)
-    onrc_ocr = await process_ocr(onrc_id, "certificat", onrc_file.filename, db, file_path=onrc_path)
-    ci_ocr = await process_ocr(ci_id, "ci", ci_file.filename, db, file_path=ci_path)
+    onrc_content, ci_content = await asyncio.gather(onrc_file.read(), ci_file.read())
+    await asyncio.gather(asyncio.to_thread(_write_file, onrc_path, onrc_content), asyncio.to_thread(_write_file, ci_path, ci_content))
+    t = _mark("save_ms", started)
+
+    # Stage 2: Agent Parser OCRs both documents in parallel
+    async def _timed_ocr(key: str, *args, **kwargs) -> dict:
+        t0 = time.perf_counter()
+        result = await process_ocr(*args, **kwargs)
+        timings[key] = round((time.perf_counter() - t0) * 1000, 1)
+        return result
+
+    onrc_ocr, ci_ocr = await asyncio.gather(
+        _timed_ocr("ocr_onrc_ms", onrc_id, "certificat", onrc_file.filename, db, file_path=onrc_path),
+        _timed_ocr("ocr_ci_ms", ci_id, "ci", ci_file.filename, db, file_path=ci_path),
+    )
+    t = _mark("ocr_ms", t)
 
     # Agent Colector: Extract firm data from OCR results
     onrc_fields = onrc_ocr.get("extracted_fields", {})
@@ -226,12 +246,13 @@ async def create_organization_manual(
         "updated_at": datetime.now(timezone.utc).isoformat(),
         "created_by": current_user["user_id"]
     }
-    await db.organizations.insert_one(org_doc)
+    t = _mark("extract_ms", t)
 
-    # Store documents in documents collection too
+    # Stage 3: store the organization and both documents (documents collection too) together
+    doc_entries = []
     for doc_info, doc_type in [({"id": onrc_id, "filename": onrc_file.filename, "stored_name": onrc_safe, "size": len(onrc_content), "ct": onrc_file.content_type, "ocr": onrc_ocr}, "certificat"),
                                 ({"id": ci_id, "filename": ci_file.filename, "stored_name": ci_safe, "size": len(ci_content), "ct": ci_file.content_type, "ocr": ci_ocr}, "ci")]:
-        await db.documents.insert_one({
+        doc_entries.append({
             "id": doc_info["id"], "filename": doc_info["filename"], "stored_name": doc_info["stored_name"],
             "file_size": doc_info["size"], "content_type": doc_info["ct"],
             "organizatie_id": org_id, "project_id": None,
@@ -243,8 +264,12 @@ async def create_organization_manual(
             "ocr_data": doc_info["ocr"], "tags": ["upload_manual"],
             "created_at": datetime.now(timezone.utc).isoformat(), "updated_at": datetime.now(timezone.utc).isoformat(), "created_by": current_user["user_id"]
         })
+    await asyncio.gather(db.organizations.insert_one(org_doc), db.documents.insert_many(doc_entries))
+    _mark("store_ms", t)
+    timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Manual onboarding {org_id}: {timings}")
 
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "organization.created_from_documents",
         "entity_type": "organization",
@@ -255,14 +280,21 @@ async def create_organization_manual(
             "denumire_extracted": denumire_extracted,
             "onrc_confidence": onrc_ocr.get("overall_confidence"),
             "ci_confidence": ci_ocr.get("overall_confidence"),
-            "needs_review": org_doc["needs_review"]
+            "needs_review": org_doc["needs_review"],
+            "timings": timings
         },
         "timestamp": datetime.now(timezone.utc).isoformat()
     })
     org_doc.pop("_id", None)
+    org_doc["onboarding_timings"] = timings
     return org_doc
 
 
+def _write_file(path: str, content: bytes):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
 def _detect_forma(denumire: str) -> str:
     d = (denumire or "").upper()
     if "S.R.L" in d or "SRL" in d: return "SRL"
@@ -272,10 +304,9 @@ def _detect_forma(denumire: str) -> str:
     return "SRL"
 
 @router.get("")
-async def list_organizations(current_user: dict = Depends(get_current_user)):
-    orgs = await db.organizations.find(
-        {"members.user_id": current_user["user_id"]}, {"_id": 0}
-    ).to_list(100)
+async def list_organizations(response: Response, cursor: Optional[str] = None, limit: int = 100, current_user: dict = Depends(get_current_user)):
+    orgs, next_cursor = await pagination.page(db.organizations, {"members.user_id": current_user["user_id"]}, cursor=cursor, limit=limit)
+    pagination.set_next(response, next_cursor)
     return orgs
 
 @router.get("/{org_id}")
@@ -310,7 +341,9 @@ async def add_member(org_id: str, req: AddMemberRequest, current_user: dict = De
         "added_at": datetime.now(timezone.utc).isoformat()
     }
     await db.organizations.update_one({"id": org_id}, {"$push": {"members": new_member}})
-    await db.audit_log.insert_one({
+    cache_bus.invalidate("organizations", {"id": org_id})
+    await bump_context_version(db, company_id=org_id)
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "organization.member_added",
         "entity_type": "organization",
@@ -339,6 +372,8 @@ async def create_authorization(org_id: str, req: CreateAuthorizationRequest, cur
         "created_by": current_user["user_id"]
     }
     await db.organizations.update_one({"id": org_id}, {"$push": {"authorizations": authorization}})
+    cache_bus.invalidate("organizations", {"id": org_id})
+    await bump_context_version(db, company_id=org_id)
     return {"message": "Împuternicire creată", "authorization": authorization}
 
 @router.get("/{org_id}/financial")
@@ -362,6 +397,7 @@ async def refresh_onrc(org_id: str, current_user: dict = Depends(get_current_use
         "certificat_constatator": cert.get("certificat"),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }})
+    await bump_context_version(db, company_id=org_id)
     return {"message": "Date ONRC actualizate", "data": onrc_data["data"]}
 
 
@@ -376,7 +412,9 @@ async def delete_organization(org_id: str, current_user: dict = Depends(get_curr
     if active_projects > 0:
         raise HTTPException(status_code=400, detail=f"Nu se poate șterge firma. Există {active_projects} proiecte active asociate.")
     await db.organizations.delete_one({"id": org_id})
-    await db.audit_log.insert_one({
+    cache_bus.invalidate("organizations", {"id": org_id})
+    await bump_context_version(db, company_id=org_id)
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "organization.deleted",
         "entity_type": "organization",
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
 import uuid
 from datetime import datetime, timezone
 from middleware.auth_middleware import get_current_user, require_org_permission, require_project_permission
+from services import pagination, audit_sink
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 db = None
@@ -111,7 +112,7 @@ async def create_project(req: CreateProjectRequest, current_user: dict = Depends
         "created_by": current_user["user_id"]
     }
     await db.projects.insert_one(project)
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "project.created",
         "entity_type": "project",
@@ -124,11 +125,12 @@ async def create_project(req: CreateProjectRequest, current_user: dict = Depends
     return project
 
 @router.get("")
-async def list_projects(organizatie_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+async def list_projects(response: Response, organizatie_id: Optional[str] = None, cursor: Optional[str] = None, limit: int = 100, current_user: dict = Depends(get_current_user)):
     query = {"members.user_id": current_user["user_id"]}
     if organizatie_id:
         query["organizatie_id"] = organizatie_id
-    projects = await db.projects.find(query, {"_id": 0}).to_list(100)
+    projects, next_cursor = await pagination.page(db.projects, query, cursor=cursor, limit=limit)
+    pagination.set_next(response, next_cursor)
     return projects
 
 @router.get("/states")
@@ -166,7 +168,7 @@ async def transition_project(project_id: str, req: TransitionRequest, current_us
         },
         "$push": {"history": transition_entry}
     })
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "project.transition",
         "entity_type": "project",
@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -9,8 +10,11 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+from services import db_pool
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+mongo_options = db_pool.client_options()
+client = AsyncIOMotorClient(mongo_url, **mongo_options)
 db = client[os.environ['DB_NAME']]
 
 app = FastAPI(title="GrantFlow API", version="1.0.0")
@@ -21,8 +25,15 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+from services.pagination import InvalidCursor
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
 # Import and register all routers
 from routes.auth import router as auth_router, set_db as auth_set_db
 from routes.organizations import router as org_router, set_db as org_set_db
@@ -35,10 +46,21 @@ from routes.funding import router as funding_router, set_db as funding_set_db
 from routes.agents import router as agents_router, set_db as agents_set_db
 from routes.integrations import router as integrations_router, set_db as integrations_set_db
 from routes.applications import router as apps_router, set_db as apps_set_db
+from routes.jobs import router as jobs_router, set_db as jobs_set_db
 from middleware.auth_middleware import set_rbac_db
+from services import llm_cache, job_queue, guide_service, guide_index, orchestrator_service, db_indexes, audit_sink, cache_bus, retention, dashboard_snapshot
 
 # Set DB references
 set_rbac_db(db)
+llm_cache.set_cache_db(db)
+job_queue.set_db(db)
+guide_service.set_db(db)
+guide_index.set_db(db)
+orchestrator_service.set_db(db)
+audit_sink.set_db(db)
+cache_bus.set_db(db)
+retention.set_db(db)
+dashboard_snapshot.set_db(db)
 auth_set_db(db)
 org_set_db(db)
 project_set_db(db)
@@ -50,6 +72,11 @@ funding_set_db(db)
 agents_set_db(db)
 integrations_set_db(db)
 apps_set_db(db)
+jobs_set_db(db)
+
+# Background job handlers
+job_queue.register_handler(guide_service.GUIDE_JOB, guide_service.process_guide)
+job_queue.register_handler(orchestrator_service.NARRATIVE_JOB, orchestrator_service.process_narrative)
 
 # Include routers
 app.include_router(auth_router)
@@ -63,6 +90,7 @@ app.include_router(funding_router)
 app.include_router(agents_router)
 app.include_router(integrations_router)
 app.include_router(apps_router)
+app.include_router(jobs_router)
 
 @app.get("/api")
 async def root():
@@ -70,11 +98,45 @@ async def root():
 
 @app.get("/api/health")
 async def health():
-    return {"status": "ok"}
+    """Pings MongoDB and reports per-server pool usage (open/in-use connections, checkout waits)."""
+    db_status = await db_pool.ping(db)
+    body = {"status": "ok" if db_status["ok"] else "degraded", "db": db_status,
+            "pool": db_pool.pool_listener.snapshot(), "pool_config": db_pool.describe(mongo_options)}
+    return body if db_status["ok"] else JSONResponse(status_code=503, content=body)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    db_indexes.start(db)
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start_workers()
+
+@app.on_event("startup")
+async def start_audit_sink():
+    audit_sink.start()
+
+@app.on_event("startup")
+async def start_cache_bus():
+    cache_bus.start()
+
+@app.on_event("startup")
+async def start_retention():
+    retention.start()
+
+@app.on_event("startup")
+async def start_dashboard_snapshot():
+    dashboard_snapshot.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await job_queue.stop_workers()
+    await dashboard_snapshot.stop()
+    await retention.stop()
+    await cache_bus.stop()
+    await audit_sink.stop()  # after the workers: their last records must still be flushed
+    await db_indexes.stop()
     client.close()
@@ -0,0 +1,20 @@
+"""Agent Rules - Per-user custom agent rules, cached per worker and invalidated through the cache bus"""
+import copy
+from services import cache_bus
+
+_cache = cache_bus.LocalCache("agent_rules", max_entries=5000)
+cache_bus.subscribe("agent_rules", _cache.evictor("agent_id", "user_id"))
+
+
+async def get(db, agent_id: str, user_id: str):
+    """The user's agent_rules document for this agent (None when there are no custom rules)."""
+    hit, rules = _cache.get((agent_id, user_id))
+    if not hit:
+        rules = await db.agent_rules.find_one({"agent_id": agent_id, "user_id": user_id}, {"_id": 0})
+        _cache.set((agent_id, user_id), rules)
+    return copy.deepcopy(rules)
+
+
+def changed(agent_id: str, user_id: str):
+    """Call after writing a user's rules for an agent."""
+    cache_bus.invalidate("agent_rules", {"agent_id": agent_id, "user_id": user_id})
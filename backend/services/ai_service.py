@@ -1,137 +1,405 @@
 """AI Service - All agents use full project context"""
 import os
-import uuid
 import json
+import asyncio
+import inspect
 import logging
+from typing import AsyncIterator
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from services import llm_cache, llm_gateway, prompt_budget, guide_index
 
 logger = logging.getLogger(__name__)
 
+LLM_PROVIDER = "openai"
+LLM_MODEL = "gpt-5.2"
+INTERACTIVE_AGENTS = {"navigator"}  # admitted ahead of reports and batch OCR by the gateway
+
+# Per-section draft generation: max sections in flight per draft, and retries per failed section
+DRAFT_SECTION_CONCURRENCY = int(os.environ.get("DRAFT_SECTION_CONCURRENCY", "4"))
+DRAFT_SECTION_RETRIES = int(os.environ.get("DRAFT_SECTION_RETRIES", "2"))
+
+# prompt hash -> task of the model call shared by identical concurrent requests (single-flight)
+_inflight: dict = {}
+_coalesce_stats = {"leaders": 0, "coalesced": 0}
+
+# Prompts open with the (static, cacheable) project context and end with the per-request task
+CONTEXT_HEADER = "Context proiect:\n"
+
 MARKDOWN_INSTRUCTION = (
     "\n\nFORMATARE: Răspunde ÎNTOTDEAUNA în Markdown structurat (## headings, **bold**, liste, > blockquote). Limba: română."
 )
 
-def _get_chat(system_message: str, extra_rules: str = "") -> LlmChat:
+def _full_system(system_message: str, extra_rules: str = "") -> str:
     full_system = system_message + MARKDOWN_INSTRUCTION
     if extra_rules:
         full_system += f"\n\nReguli suplimentare de respectat:\n{extra_rules}"
-    chat = LlmChat(api_key=os.environ["EMERGENT_LLM_KEY"], session_id=str(uuid.uuid4()), system_message=full_system)
-    chat.with_model("openai", "gpt-5.2")
-    return chat
+    return full_system
+
+
+def _get_chat(system_message: str, extra_rules: str = "") -> LlmChat:
+    return llm_gateway.new_chat(_full_system(system_message, extra_rules), LLM_PROVIDER, LLM_MODEL)
+
+
+def _prompt_tokens(system_message: str, prompt: str, extra_rules: str = "") -> int:
+    """Tokens actually sent: system message (with formatting + custom rules) and user prompt."""
+    return prompt_budget.count_tokens(_full_system(system_message, extra_rules)) + prompt_budget.count_tokens(prompt)
+
+
+async def _ask(agent: str, system_message: str, prompt: str, extra_rules: str = "", use_cache: bool = True) -> str:
+    """Send one prompt to the model, serving byte-identical requests from the response cache."""
+    model = f"{LLM_PROVIDER}/{LLM_MODEL}"
+    key = llm_cache.make_key(model, system_message, extra_rules, prompt)
+    if use_cache:
+        cached = await llm_cache.get(key, agent)
+        if cached is not None:
+            logger.info(f"LLM cache hit: agent={agent}, key={key[:12]}")
+            return cached
+    else:
+        llm_cache.record_bypass()
+
+    return await _single_flight(key, agent, _sender(agent, system_message, prompt, extra_rules, use_cache, key))
+
+
+def _priority(agent: str) -> int:
+    return llm_gateway.PRIORITY_INTERACTIVE if agent in INTERACTIVE_AGENTS else llm_gateway.PRIORITY_DEFAULT
+
+
+def _sender(agent: str, system_message: str, prompt: str, extra_rules: str, use_cache: bool, key: str):
+    """The blocking model call (and cache write) for one prompt, as a coroutine function for _single_flight."""
+    async def call():
+        chat = _get_chat(system_message, extra_rules)
+        response = await llm_gateway.send(chat, UserMessage(text=prompt), LLM_PROVIDER, _priority(agent))
+        if use_cache:
+            await llm_cache.put(key, agent, f"{LLM_PROVIDER}/{LLM_MODEL}", response)
+        return response
+    return call
 
 
-def _context_to_text(ctx: dict) -> str:
-    """Convert full context dict to readable text for AI prompt."""
+async def _ask_stream(agent: str, system_message: str, prompt: str, extra_rules: str = "", use_cache: bool = True) -> AsyncIterator[str]:
+    """Yield the response as the model produces it (needs llm_backends.can_stream()). A cache hit
+    or an identical request already in flight arrives as one delta; the streamed text is cached
+    once complete."""
+    model = f"{LLM_PROVIDER}/{LLM_MODEL}"
+    key = llm_cache.make_key(model, system_message, extra_rules, prompt)
+    if use_cache:
+        cached = await llm_cache.get(key, agent)
+        if cached is not None:
+            logger.info(f"LLM cache hit: agent={agent}, key={key[:12]}")
+            yield cached
+            return
+    else:
+        llm_cache.record_bypass()
+
+    if key in _inflight:
+        yield await _single_flight(key, agent, _sender(agent, system_message, prompt, extra_rules, use_cache, key))
+        return
+    # Lead the call: identical requests arriving meanwhile wait for the joined text
+    _coalesce_stats["leaders"] += 1
+    done = asyncio.get_running_loop().create_future()
+    _inflight[key] = done
     parts = []
+    try:
+        chat = _get_chat(system_message, extra_rules)
+        async for chunk in llm_gateway.stream(chat, UserMessage(text=prompt), LLM_PROVIDER, _priority(agent)):
+            parts.append(chunk)
+            yield chunk
+        response = "".join(parts)
+        if use_cache:
+            await llm_cache.put(key, agent, model, response)
+        done.set_result(response)
+    except BaseException as e:
+        if isinstance(e, Exception):
+            done.set_exception(e)
+            done.exception()  # mark retrieved even if nobody was waiting
+        else:
+            done.cancel()  # client went away: waiters make their own call
+        raise
+    finally:
+        if _inflight.get(key) is done:
+            del _inflight[key]
 
-    f = ctx.get("firma", {})
-    if f.get("denumire"):
-        parts.append(f"## Firmă\n- **{f['denumire']}** (CUI: `{f.get('cui')}`, {f.get('forma_juridica')})\n- Adresă: {f.get('adresa')}, {f.get('judet')}\n- Stare: **{f.get('stare')}** {f.get('stare_detalii', '')}\n- CAEN principal: {f.get('caen_principal')}\n- Angajați: {f.get('nr_angajati')}, Capital: {f.get('capital_social')}\n- Înființare: {f.get('data_infiintare')}")
-        fin = f.get("date_financiare")
-        if fin:
-            parts.append(f"- Date financiare: CA={fin.get('cifra_afaceri')}, Profit={fin.get('profit_net')}, Obligații restante={fin.get('obligatii_restante', 0)}")
 
-    p = ctx.get("program", {})
-    if p.get("program"):
-        parts.append(f"\n## Program\n- **{p['program']}** / {p.get('masura')} ({p.get('masura_cod')})\n- Sesiune: **{p.get('sesiune')}**\n- Buget sesiune: {p.get('buget_sesiune')} RON\n- Valoare proiect: {p.get('valoare_min')} – {p.get('valoare_max')} RON\n- Beneficiari: {', '.join(p.get('beneficiari_eligibili', []))}\n- Regiune: {p.get('regiune')}\n- Perioadă: {p.get('data_start')} → {p.get('data_sfarsit')}")
+async def _single_flight(key: str, agent: str, call) -> str:
+    """Identical prompts already in flight share one model call instead of issuing a duplicate.
+    The call runs as its own task, so a caller that disconnects does not cancel it for the others.
+    A streamed lead call that gets abandoned is replaced by a fresh call."""
+    task = _inflight.get(key)
+    if task is None:
+        _coalesce_stats["leaders"] += 1
+        task = asyncio.ensure_future(call())
+        _inflight[key] = task
 
-    c = ctx.get("config", {})
-    if c.get("titlu"):
-        parts.append(f"\n## Proiect\n- Titlu: **{c['titlu']}**\n- Buget estimat: {c.get('buget_estimat')} RON\n- Tip: {c.get('tip_proiect')}\n- Locație: {c.get('locatie')}, {c.get('judet_implementare')}\n- Temă: {c.get('tema')}\n- Status: **{c.get('status_label')}**")
+        def _done(t):
+            if _inflight.get(key) is t:
+                del _inflight[key]
+            if not t.cancelled():
+                t.exception()  # mark retrieved even if every waiter went away
+        task.add_done_callback(_done)
+    else:
+        _coalesce_stats["coalesced"] += 1
+        logger.info(f"LLM request coalesced: agent={agent}, key={key[:12]}")
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        return await _single_flight(key, agent, call)
+
+
+def get_coalescing_stats() -> dict:
+    total = _coalesce_stats["leaders"] + _coalesce_stats["coalesced"]
+    return {**_coalesce_stats, "in_flight": len(_inflight),
+            "coalescing_rate": round(_coalesce_stats["coalesced"] / total, 3) if total else 0.0}
+
+
+def _context_blocks(ctx: dict) -> list:
+    """Split the full context into prioritised blocks for prompt_budget.assemble().
+
+    Blocks are emitted in a fixed order, slowest-changing first (guide criteria, firm, program/project,
+    document status), so consecutive calls for an application share the longest possible prompt prefix
+    and hit the provider's prompt cache."""
+    blocks = []
+    B = prompt_budget
 
     g = ctx.get("ghid", {})
     if g.get("criterii_eligibilitate"):
-        parts.append(f"\n## Criterii eligibilitate (din ghid)\n" + "\n".join(f"- {c}" for c in g["criterii_eligibilitate"]))
+        blocks.append(B.block("criterii", B.PRIORITY_CRITERIA, f"\n## Criterii eligibilitate (din ghid)\n" + "\n".join(f"- {c}" for c in g["criterii_eligibilitate"])))
     if g.get("grila_conformitate"):
-        parts.append(f"\n## Grilă conformitate (din ghid)\n" + "\n".join(f"- {c.get('criteriu', c) if isinstance(c, dict) else c}: {c.get('punctaj_max', '') if isinstance(c, dict) else ''}" for c in g["grila_conformitate"]))
+        blocks.append(B.block("grila", B.PRIORITY_CRITERIA, f"\n## Grilă conformitate (din ghid)\n" + "\n".join(f"- {c.get('criteriu', c) if isinstance(c, dict) else c}: {c.get('punctaj_max', '') if isinstance(c, dict) else ''}" for c in g["grila_conformitate"])))
     if g.get("activitati_eligibile"):
-        parts.append(f"\n## Activități eligibile\n" + "\n".join(f"- {a}" for a in g["activitati_eligibile"]))
+        blocks.append(B.block("activitati", B.PRIORITY_EXTRAS, f"\n## Activități eligibile\n" + "\n".join(f"- {a}" for a in g["activitati_eligibile"])))
     if g.get("cheltuieli_eligibile"):
-        parts.append(f"\n## Cheltuieli eligibile\n" + "\n".join(f"- {c}" for c in g["cheltuieli_eligibile"]))
+        blocks.append(B.block("cheltuieli", B.PRIORITY_EXTRAS, f"\n## Cheltuieli eligibile\n" + "\n".join(f"- {c}" for c in g["cheltuieli_eligibile"])))
     if g.get("rezumat_ghid"):
-        parts.append(f"\n## Rezumat ghid\n{g['rezumat_ghid']}")
+        blocks.append(B.block("rezumat_ghid", B.PRIORITY_EXTRAS, f"\n## Rezumat ghid\n{g['rezumat_ghid']}"))
     if g.get("date_din_linkuri"):
-        parts.append(f"\n## Date extrase din linkuri\n{g['date_din_linkuri'][:800]}")
+        blocks.append(B.block("linkuri", B.PRIORITY_EXTRAS, f"\n## Date extrase din linkuri\n{g['date_din_linkuri'][:800]}"))
+
+    f = ctx.get("firma", {})
+    if f.get("denumire"):
+        firm = f"\n## Firmă\n- **{f['denumire']}** (CUI: `{f.get('cui')}`, {f.get('forma_juridica')})\n- Adresă: {f.get('adresa')}, {f.get('judet')}\n- Stare: **{f.get('stare')}** {f.get('stare_detalii', '')}\n- CAEN principal: {f.get('caen_principal')}\n- Angajați: {f.get('nr_angajati')}, Capital: {f.get('capital_social')}\n- Înființare: {f.get('data_infiintare')}"
+        fin = f.get("date_financiare")
+        if fin:
+            firm += f"\n- Date financiare: CA={fin.get('cifra_afaceri')}, Profit={fin.get('profit_net')}, Obligații restante={fin.get('obligatii_restante', 0)}"
+        blocks.append(B.block("firma", B.PRIORITY_FIRM, firm))
+
+    p = ctx.get("program", {})
+    if p.get("program"):
+        blocks.append(B.block("program", B.PRIORITY_PROGRAM, f"\n## Program\n- **{p['program']}** / {p.get('masura')} ({p.get('masura_cod')})\n- Sesiune: **{p.get('sesiune')}**\n- Buget sesiune: {p.get('buget_sesiune')} RON\n- Valoare proiect: {p.get('valoare_min')} – {p.get('valoare_max')} RON\n- Beneficiari: {', '.join(p.get('beneficiari_eligibili', []))}\n- Regiune: {p.get('regiune')}\n- Perioadă: {p.get('data_start')} → {p.get('data_sfarsit')}"))
+
+    c = ctx.get("config", {})
+    if c.get("titlu"):
+        blocks.append(B.block("proiect", B.PRIORITY_PROGRAM, f"\n## Proiect\n- Titlu: **{c['titlu']}**\n- Buget estimat: {c.get('buget_estimat')} RON\n- Tip: {c.get('tip_proiect')}\n- Locație: {c.get('locatie')}, {c.get('judet_implementare')}\n- Temă: {c.get('tema')}\n- Status: **{c.get('status_label')}**"))
 
     d = ctx.get("documente", {})
     if d:
-        parts.append(f"\n## Stare documente\n- Cerute: {d.get('total_cerute')}, Încărcate: {d.get('total_incarcate')}, Lipsă: {d.get('total_lipsa')}\n- Drafturi: {d.get('drafturi_generate')}, Ghiduri: {d.get('ghiduri_incarcate')}\n- Achiziții: {d.get('achizitii_count')} (total: {d.get('achizitii_total')} RON)")
+        blocks.append(B.block("documente", B.PRIORITY_DOCS, f"\n## Stare documente\n- Cerute: {d.get('total_cerute')}, Încărcate: {d.get('total_incarcate')}, Lipsă: {d.get('total_lipsa')}\n- Drafturi: {d.get('drafturi_generate')}, Ghiduri: {d.get('ghiduri_incarcate')}\n- Achiziții: {d.get('achizitii_count')} (total: {d.get('achizitii_total')} RON)"))
+
+    return blocks
 
-    return "\n".join(parts)
 
+def _context_to_text(ctx: dict, agent: str = None) -> str:
+    """Convert full context dict to readable text for AI prompt, trimmed to the agent's token budget."""
+    budget = prompt_budget.budget_for(agent) if agent else prompt_budget.DEFAULT_BUDGET
+    text, stats = prompt_budget.assemble(_context_blocks(ctx), budget)
+    if stats["trimmed"] or stats["dropped"]:
+        logger.info(f"Context for {agent} cut to {stats['tokens']}/{budget} tokens (trimmed={stats['trimmed']}, dropped={stats['dropped']})")
+    return text.lstrip("\n")
 
-async def check_eligibility(firm_data: dict, program_info: dict, full_context: dict = None, extra_rules: str = "") -> dict:
-    chat = _get_chat(
+
+def _eligibility_request(firm_data: dict, program_info: dict, full_context: dict = None) -> tuple:
+    system_message = (
         "Ești expert în finanțări europene și naționale din România. "
         "Analizezi eligibilitatea firmei pe baza TUTUROR datelor disponibile: date firmă, program, criterii din ghid, grila de conformitate. "
-        "Oferă raport structurat: Rezumat, Scor, Criterii îndeplinite/neîndeplinite, Blocaje, Recomandări.",
-        extra_rules
+        "Oferă raport structurat: Rezumat, Scor, Criterii îndeplinite/neîndeplinite, Blocaje, Recomandări."
     )
     if full_context:
-        prompt = f"Analizează eligibilitatea pe baza întregului context al proiectului:\n\n{_context_to_text(full_context)}"
+        prompt = f"{CONTEXT_HEADER}{_context_to_text(full_context, 'eligibilitate')}\n\nAnalizează eligibilitatea pe baza întregului context al proiectului."
     else:
         prompt = f"Date firmă: {json.dumps(firm_data, ensure_ascii=False, default=str)}\n\nProgram: {json.dumps(program_info, ensure_ascii=False, default=str)}"
     prompt += "\n\nOferă un raport detaliat de eligibilitate."
-    try:
-        response = await chat.send_message(UserMessage(text=prompt))
-        return {"success": True, "result": response}
-    except Exception as e:
-        logger.error(f"AI eligibility failed: {e}")
-        return {"success": False, "error": str(e)}
+    return system_message, prompt
+
+
+def _guide_excerpts(guide_chunks: list) -> str:
+    return f"\n\n{guide_index.format_chunks(guide_chunks)}" if guide_chunks else ""
 
 
-async def generate_document_section(template: str, data: dict, section: str, full_context: dict = None, extra_rules: str = "") -> dict:
-    chat = _get_chat(
+def _document_section_request(template: str, data: dict, section: str, full_context: dict = None, guide_chunks: list = None) -> tuple:
+    system_message = (
         "Ești expert în redactarea documentelor pentru proiecte de finanțare în România. "
         "Completezi secțiunile pe baza TUTUROR datelor disponibile din proiect. "
-        "NU inventa date. Scrie formal, profesional.",
-        extra_rules
+        "NU inventa date. Scrie formal, profesional."
     )
     if full_context:
-        prompt = f"Context complet proiect:\n{_context_to_text(full_context)}\n\nCompletează: **{section}**\nTemplate: {template}"
+        # Template is shared by every section of a draft; retrieved excerpts and the section vary per call
+        prompt = f"{CONTEXT_HEADER}{_context_to_text(full_context, 'redactor')}\n\nTemplate: {template}{_guide_excerpts(guide_chunks)}\n\nCompletează: **{section}**"
     else:
         prompt = f"Template: {template}\nDate: {json.dumps(data, ensure_ascii=False, default=str)}\nCompletează secțiunea: {section}"
-    try:
-        response = await chat.send_message(UserMessage(text=prompt))
-        return {"success": True, "result": response}
-    except Exception as e:
-        logger.error(f"AI doc generation failed: {e}")
-        return {"success": False, "error": str(e)}
+    return system_message, prompt
 
 
-async def validate_coherence(documents: list, project_data: dict, full_context: dict = None, extra_rules: str = "") -> dict:
-    chat = _get_chat(
+def _coherence_request(documents: list, project_data: dict, full_context: dict = None) -> tuple:
+    system_message = (
         "Ești validator de coerență pentru dosare de finanțare. "
         "Verifici consistența între TOATE datele proiectului: documente, buget, achiziții, criterii ghid, grilă conformitate. "
-        "Structurează: Rezumat, Verificări, Probleme, Recomandări.",
-        extra_rules
+        "Structurează: Rezumat, Verificări, Probleme, Recomandări."
     )
     if full_context:
-        prompt = f"Validează coerența dosarului pe baza contextului complet:\n\n{_context_to_text(full_context)}"
+        prompt = f"{CONTEXT_HEADER}{_context_to_text(full_context, 'validator')}\n\nValidează coerența dosarului pe baza contextului complet."
     else:
         prompt = f"Documente: {json.dumps(documents, ensure_ascii=False, default=str)}\nProiect: {json.dumps(project_data, ensure_ascii=False, default=str)}"
     prompt += "\n\nIdentifică inconsistențe și oferă recomandări."
-    try:
-        response = await chat.send_message(UserMessage(text=prompt))
-        return {"success": True, "result": response}
-    except Exception as e:
-        logger.error(f"AI validation failed: {e}")
-        return {"success": False, "error": str(e)}
+    return system_message, prompt
 
 
-async def chat_navigator(message: str, context: dict, full_context: dict = None, extra_rules: str = "") -> dict:
-    chat = _get_chat(
+def _navigator_request(message: str, context: dict, full_context: dict = None, guide_chunks: list = None) -> tuple:
+    system_message = (
         "Ești Ghidul GrantFlow. Ajuți utilizatorii să navigheze procesul de finanțare. "
-        "Ai acces la TOATE datele proiectului. Răspunde concis, structurat.",
-        extra_rules
+        "Ai acces la TOATE datele proiectului. Răspunde concis, structurat."
     )
     if full_context:
-        prompt = f"Context proiect:\n{_context_to_text(full_context)}\n\nÎntrebare: {message}"
+        prompt = f"{CONTEXT_HEADER}{_context_to_text(full_context, 'navigator')}{_guide_excerpts(guide_chunks)}\n\nÎntrebare: {message}"
     else:
         prompt = f"Context: {json.dumps(context, ensure_ascii=False, default=str)}\n\nÎntrebare: {message}"
+    return system_message, prompt
+
+
+# agent_id -> prompt builder; shared by the blocking functions below and by stream_agent()
+AGENT_REQUESTS = {
+    "eligibilitate": _eligibility_request,
+    "redactor": _document_section_request,
+    "validator": _coherence_request,
+    "navigator": _navigator_request,
+}
+
+# agent_id -> builder argument used as the query against the application's guide index
+RETRIEVAL_QUERY_ARGS = {
+    "redactor": "section",
+    "navigator": "message",
+}
+
+
+async def _build_request(agent: str, *args, **kwargs) -> tuple:
+    """Run the agent's prompt builder, first fetching the top-k guide chunks for agents that use retrieval."""
+    builder = AGENT_REQUESTS[agent]
+    query_arg = RETRIEVAL_QUERY_ARGS.get(agent)
+    if query_arg:
+        bound = inspect.signature(builder).bind(*args, **kwargs).arguments
+        app_id = (bound.get("full_context") or {}).get("application_id")
+        kwargs["guide_chunks"] = await guide_index.retrieve(app_id, bound.get(query_arg))
+    return builder(*args, **kwargs)
+
+
+async def check_eligibility(firm_data: dict, program_info: dict, full_context: dict = None, extra_rules: str = "", use_cache: bool = True) -> dict:
+    system_message, prompt = await _build_request("eligibilitate", firm_data, program_info, full_context)
+    prompt_tokens = _prompt_tokens(system_message, prompt, extra_rules)
+    try:
+        response = await _ask("eligibilitate", system_message, prompt, extra_rules, use_cache)
+        return {"success": True, "result": response, "prompt_tokens": prompt_tokens}
+    except Exception as e:
+        logger.error(f"AI eligibility failed: {e}")
+        return {"success": False, "error": str(e), "prompt_tokens": prompt_tokens}
+
+
+async def generate_document_section(template: str, data: dict, section: str, full_context: dict = None, extra_rules: str = "", use_cache: bool = True) -> dict:
+    system_message, prompt = await _build_request("redactor", template, data, section, full_context)
+    prompt_tokens = _prompt_tokens(system_message, prompt, extra_rules)
     try:
-        response = await chat.send_message(UserMessage(text=prompt))
-        return {"success": True, "result": response}
+        response = await _ask("redactor", system_message, prompt, extra_rules, use_cache)
+        return {"success": True, "result": response, "prompt_tokens": prompt_tokens}
+    except Exception as e:
+        logger.error(f"AI doc generation failed: {e}")
+        return {"success": False, "error": str(e), "prompt_tokens": prompt_tokens}
+
+
+def _section_block(section: str, result: dict) -> str:
+    if not result.get("success"):
+        return f"## {section}\n\n> Secțiune negenerată: {result.get('error', 'eroare')[:200]}"
+    text = result.get("result", "").strip()
+    return text if text.startswith("#") else f"## {section}\n\n{text}"
+
+
+async def _stream_section_blocks(template: str, sections: list, full_context: dict, extra_rules: str, use_cache: bool,
+                                 concurrency: int, outcomes: dict) -> AsyncIterator[str]:
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(section: str) -> dict:
+        result = {}
+        for attempt in range(DRAFT_SECTION_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))  # back off without holding a slot
+            async with sem:
+                result = await generate_document_section(template, {}, section, full_context, extra_rules, use_cache)
+            if result.get("success"):
+                break
+            logger.warning(f"Section '{section}' failed (attempt {attempt + 1}): {result.get('error')}")
+        return result
+
+    tasks = [asyncio.create_task(one(sec)) for sec in sections]
+    try:
+        # Release sections in template order as soon as every earlier one is done
+        for sec, task in zip(sections, tasks):
+            result = await task
+            outcomes[sec] = result
+            yield _section_block(sec, result)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def generate_document_sections(template: str, sections: list, full_context: dict = None, extra_rules: str = "",
+                                     use_cache: bool = True, concurrency: int = None) -> dict:
+    """Generate each section as its own completion (bounded fan-out) and stitch them in template order."""
+    outcomes = {}
+    blocks = [b async for b in _stream_section_blocks(template, sections, full_context, extra_rules, use_cache,
+                                                      concurrency or DRAFT_SECTION_CONCURRENCY, outcomes)]
+    failed = [sec for sec in sections if not outcomes[sec].get("success")]
+    return {"success": len(failed) < len(sections), "result": "\n\n".join(blocks), "failed_sections": failed,
+            "prompt_tokens": sum(o.get("prompt_tokens", 0) for o in outcomes.values())}
+
+
+async def stream_document_sections(template: str, sections: list, full_context: dict = None, extra_rules: str = "",
+                                   use_cache: bool = True, concurrency: int = None, usage: dict = None) -> AsyncIterator[str]:
+    """Streaming form of generate_document_sections(): one delta per section, in template order.
+    If `usage` is given it receives the summed prompt_tokens once all sections are done."""
+    first = True
+    outcomes = {}
+    async for block in _stream_section_blocks(template, sections, full_context, extra_rules, use_cache,
+                                              concurrency or DRAFT_SECTION_CONCURRENCY, outcomes):
+        yield block if first else "\n\n" + block
+        first = False
+    if usage is not None:
+        usage["prompt_tokens"] = sum(o.get("prompt_tokens", 0) for o in outcomes.values())
+
+
+async def validate_coherence(documents: list, project_data: dict, full_context: dict = None, extra_rules: str = "", use_cache: bool = True) -> dict:
+    system_message, prompt = await _build_request("validator", documents, project_data, full_context)
+    prompt_tokens = _prompt_tokens(system_message, prompt, extra_rules)
+    try:
+        response = await _ask("validator", system_message, prompt, extra_rules, use_cache)
+        return {"success": True, "result": response, "prompt_tokens": prompt_tokens}
+    except Exception as e:
+        logger.error(f"AI validation failed: {e}")
+        return {"success": False, "error": str(e), "prompt_tokens": prompt_tokens}
+
+
+async def chat_navigator(message: str, context: dict, full_context: dict = None, extra_rules: str = "", use_cache: bool = True) -> dict:
+    system_message, prompt = await _build_request("navigator", message, context, full_context)
+    prompt_tokens = _prompt_tokens(system_message, prompt, extra_rules)
+    try:
+        response = await _ask("navigator", system_message, prompt, extra_rules, use_cache)
+        return {"success": True, "result": response, "prompt_tokens": prompt_tokens}
     except Exception as e:
         logger.error(f"AI navigator failed: {e}")
-        return {"success": False, "error": str(e)}
+        return {"success": False, "error": str(e), "prompt_tokens": prompt_tokens}
+
+
+async def stream_agent(agent: str, *args, extra_rules: str = "", use_cache: bool = True, usage: dict = None, **kwargs) -> AsyncIterator[str]:
+    """Yield the agent's answer as text deltas. Same prompts and cache as the blocking calls.
+    If `usage` is given it receives prompt_tokens before the first delta."""
+    system_message, prompt = await _build_request(agent, *args, **kwargs)
+    if usage is not None:
+        usage["prompt_tokens"] = _prompt_tokens(system_message, prompt, extra_rules)
+    async for delta in _ask_stream(agent, system_message, prompt, extra_rules, use_cache):
+        yield delta
@@ -0,0 +1,261 @@
+"""Application Store - Per-application sub-collections (documents, drafts, history, guide assets, checklist)
+
+The applications document holds only scalar/config fields. Its former embedded arrays live in their
+own collections keyed by application_id, ordered by `seq`. Legacy applications (no storage_version)
+are migrated on first access, or in bulk with `python -m services.application_store`.
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from services import pagination
+from services.update_builder import UpdateBuilder
+
+logger = logging.getLogger(__name__)
+
+# former embedded array -> collection
+COLLECTIONS = {
+    "documents": "application_documents",
+    "drafts": "application_drafts",
+    "history": "application_events",
+    "guide_assets": "application_guide_assets",
+    "required_documents": "application_required_documents",
+}
+PARTS = tuple(COLLECTIONS)
+STORAGE_VERSION = 2
+
+# The application itself, without anything that lives in a sub-collection
+HEAD_PROJECTION = {"_id": 0, **{part: 0 for part in PARTS}}
+_ITEM_PROJECTION = {"_id": 0, "application_id": 0, "seq": 0}
+
+# Named read views (?view=): a head projection plus the sub-collections loaded with it
+_SUMMARY_FIELDS = ("id", "title", "description", "company_id", "company_name", "call_id", "call_name", "call_code",
+                   "program_name", "status", "status_label", "budget_estimated", "created_at", "updated_at")
+_WORKFLOW_FIELDS = _SUMMARY_FIELDS + ("checklist_frozen", "folder_groups", "context_version")
+VIEWS = {
+    "summary": ({"_id": 0, **{f: 1 for f in _SUMMARY_FIELDS}}, ()),
+    "workflow": ({"_id": 0, **{f: 1 for f in _WORKFLOW_FIELDS}}, ("history", "required_documents")),
+    "documents": ({"_id": 0, **{f: 1 for f in _WORKFLOW_FIELDS}}, ("documents", "required_documents", "guide_assets")),
+    "full": (HEAD_PROJECTION, PARTS),
+}
+
+# Application ids known to be on STORAGE_VERSION (skips the version lookup on writes)
+_migrated = set()
+MIGRATED_CACHE_SIZE = 100000
+
+
+def _mark_migrated(app_id: str):
+    if len(_migrated) >= MIGRATED_CACHE_SIZE:
+        _migrated.clear()
+    _migrated.add(app_id)
+
+
+def new_application_fields() -> dict:
+    """Fields a freshly created application carries so it is never treated as legacy."""
+    return {"storage_version": STORAGE_VERSION}
+
+
+async def migrate_application(db, app_id: str) -> int:
+    """Move the embedded arrays of one application into the sub-collections. Idempotent: items get
+    deterministic _ids, so a concurrent or repeated run upserts the same documents. Returns items moved."""
+    app = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1, "storage_version": 1, **{p: 1 for p in PARTS}})
+    if not app:
+        return 0
+    if app.get("storage_version", 0) >= STORAGE_VERSION:
+        _mark_migrated(app_id)
+        return 0
+    moved = 0
+    for part, collection in COLLECTIONS.items():
+        items = app.get(part) or []
+        if not items:
+            continue
+        ops = [UpdateOne({"_id": f"{app_id}:{part}:{i}"},
+                         {"$setOnInsert": {"id": str(uuid.uuid4()), **item, "application_id": app_id, "seq": i}},
+                         upsert=True)
+               for i, item in enumerate(items)]
+        await db[collection].bulk_write(ops, ordered=False)
+        moved += len(items)
+    await db.applications.update_one({"id": app_id}, {"$unset": {p: "" for p in PARTS}, "$set": {"storage_version": STORAGE_VERSION}})
+    _mark_migrated(app_id)
+    logger.info(f"Application {app_id}: {moved} embedded items moved to sub-collections")
+    return moved
+
+
+async def migrate_all(db) -> dict:
+    """Migrate every legacy application."""
+    stats = {"applications": 0, "items": 0, "failed": []}
+    ids = [a["id"] async for a in db.applications.find({"storage_version": {"$exists": False}}, {"_id": 0, "id": 1})]
+    for app_id in ids:
+        try:
+            stats["items"] += await migrate_application(db, app_id)
+            stats["applications"] += 1
+        except Exception as e:
+            logger.error(f"Migration failed for application {app_id}: {e}")
+            stats["failed"].append({"id": app_id, "error": str(e)[:200]})
+    return stats
+
+
+async def ensure_migrated(db, app_id: str):
+    if app_id in _migrated:
+        return
+    head = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1, "storage_version": 1})
+    if head and head.get("storage_version", 0) < STORAGE_VERSION:
+        await migrate_application(db, app_id)
+    elif head:
+        _mark_migrated(app_id)
+
+
+async def list_items(db, app_id: str, part: str, query: dict = None, projection: dict = None) -> list:
+    return await db[COLLECTIONS[part]].find(
+        {"application_id": app_id, **(query or {})}, projection or _ITEM_PROJECTION
+    ).sort("seq", 1).to_list(None)
+
+
+async def get_item(db, app_id: str, part: str, item_id: str):
+    await ensure_migrated(db, app_id)
+    return await db[COLLECTIONS[part]].find_one({"application_id": app_id, "id": item_id}, _ITEM_PROJECTION)
+
+
+async def load_parts(db, app_id: str, parts=PARTS) -> dict:
+    results = await asyncio.gather(*[list_items(db, app_id, p) for p in parts])
+    return dict(zip(parts, results))
+
+
+async def load_parts_many(db, app_ids: list, parts=PARTS) -> dict:
+    """app_id -> {part: items} for several applications: one query per sub-collection, grouped in memory."""
+    grouped = {app_id: {p: [] for p in parts} for app_id in app_ids}
+
+    async def fetch(part):
+        async for item in db[COLLECTIONS[part]].find({"application_id": {"$in": app_ids}}, {"_id": 0, "seq": 0}).sort("seq", 1):
+            grouped[item.pop("application_id")][part].append(item)
+
+    await asyncio.gather(*[fetch(p) for p in parts])
+    return grouped
+
+
+async def counts(db, app_id: str, parts=PARTS) -> dict:
+    await ensure_migrated(db, app_id)
+    results = await asyncio.gather(*[db[COLLECTIONS[p]].count_documents({"application_id": app_id}) for p in parts])
+    return dict(zip(parts, results))
+
+
+async def get_application(db, app_id: str, parts=(), projection: dict = None):
+    """The application head plus only the requested sub-collections, each as a list under its old key."""
+    projection = dict(projection or HEAD_PROJECTION)
+    internal = any(v == 1 for v in projection.values()) and "storage_version" not in projection
+    if internal:
+        projection["storage_version"] = 1
+    app = await db.applications.find_one({"id": app_id}, projection)
+    if not app:
+        return None
+    if app.get("storage_version", 0) < STORAGE_VERSION:
+        await migrate_application(db, app_id)
+        app = await db.applications.find_one({"id": app_id}, projection)
+    else:
+        _mark_migrated(app_id)
+    if internal:
+        app.pop("storage_version", None)
+    if parts:
+        app.update(await load_parts(db, app_id, parts))
+    return app
+
+
+async def get_view(db, app_id: str, view: str = "full"):
+    projection, parts = VIEWS[view]
+    return await get_application(db, app_id, parts=parts, projection=projection)
+
+
+async def list_view(db, query: dict, view: str = "summary", limit: int = 100, cursor: str = None) -> tuple:
+    """One page of applications matching query in the given view: (apps, next_cursor).
+    Views without sub-collections are a single find; the others add one query per sub-collection for the whole page."""
+    projection, parts = VIEWS[view]
+    if not parts:
+        return await pagination.page(db.applications, query, projection, cursor=cursor, limit=limit)
+    projection = dict(projection)
+    internal = any(v == 1 for v in projection.values())
+    if internal:
+        projection["storage_version"] = 1
+    apps, next_cursor = await pagination.page(db.applications, query, projection, cursor=cursor, limit=limit)
+    for app in apps:
+        if app.get("storage_version", 0) < STORAGE_VERSION:
+            await migrate_application(db, app["id"])
+            app["storage_version"] = STORAGE_VERSION
+        else:
+            _mark_migrated(app["id"])
+        if internal:
+            app.pop("storage_version", None)
+    grouped = await load_parts_many(db, [app["id"] for app in apps], parts)
+    for app in apps:
+        app.update(grouped[app["id"]])
+    return apps, next_cursor
+
+
+async def _touch(db, app_id: str, app_update=None):
+    """Sub-collection writes change the project context: bump context_version, plus any update for the head.
+    app_update may be an UpdateBuilder: the bump is added to it and the caller commits the head once."""
+    if isinstance(app_update, UpdateBuilder):
+        app_update.inc("context_version")
+        return
+    await db.applications.update_one({"id": app_id}, UpdateBuilder(app_update).inc("context_version").as_update())
+
+
+async def add(db, app_id: str, part: str, items, app_update=None):
+    """Append one item (dict) or several (list) to a sub-collection."""
+    await ensure_migrated(db, app_id)
+    batch = items if isinstance(items, list) else [items]
+    if batch:
+        base = time.time_ns()
+        await db[COLLECTIONS[part]].insert_many([{**item, "application_id": app_id, "seq": base + i} for i, item in enumerate(batch)])
+    await _touch(db, app_id, app_update)
+
+
+async def update_item(db, app_id: str, part: str, item_id: str, fields: dict, app_update=None) -> bool:
+    await ensure_migrated(db, app_id)
+    result = await db[COLLECTIONS[part]].update_one({"application_id": app_id, "id": item_id}, {"$set": fields})
+    await _touch(db, app_id, app_update)
+    return result.matched_count > 0
+
+
+async def replace_item(db, app_id: str, part: str, item: dict, app_update=None) -> bool:
+    """Replace an item wholesale (keeps its position)."""
+    await ensure_migrated(db, app_id)
+    current = await db[COLLECTIONS[part]].find_one({"application_id": app_id, "id": item["id"]}, {"_id": 0, "seq": 1})
+    if not current:
+        return False
+    await db[COLLECTIONS[part]].replace_one({"application_id": app_id, "id": item["id"]}, {**item, "application_id": app_id, "seq": current["seq"]})
+    await _touch(db, app_id, app_update)
+    return True
+
+
+async def remove_item(db, app_id: str, part: str, item_id: str, app_update=None) -> bool:
+    await ensure_migrated(db, app_id)
+    result = await db[COLLECTIONS[part]].delete_one({"application_id": app_id, "id": item_id})
+    await _touch(db, app_id, app_update)
+    return result.deleted_count > 0
+
+
+async def add_event(db, app_id: str, entry: dict, app_update=None):
+    """History entry (status transition); events get an id like every other sub-collection item."""
+    await add(db, app_id, "history", {"id": str(uuid.uuid4()), **entry}, app_update)
+
+
+if __name__ == "__main__":
+    # One-off bulk migration: python -m services.application_store (from backend/, reads MONGO_URL / DB_NAME)
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent.parent / ".env")
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        started = datetime.now(timezone.utc)
+        stats = await migrate_all(client[os.environ["DB_NAME"]])
+        logger.info(f"Migration finished in {(datetime.now(timezone.utc) - started).total_seconds():.1f}s: {stats}")
+        client.close()
+
+    asyncio.run(_main())
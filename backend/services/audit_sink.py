@@ -0,0 +1,156 @@
+"""Audit Sink - Buffered writer for audit_log and agent_runs, flushed with insert_many off the request path
+
+Records go into a bounded in-memory queue; one background task writes them in batches, when a batch
+is full or AUDIT_FLUSH_INTERVAL has passed. AUDIT_DURABILITY picks what a request waits for:
+  async - nothing; the record is written with the next batch (lost if the process dies before it)
+  sync  - until the batch holding its record is written (concurrent requests still share one insert_many)
+A full queue, or a sink that is not running (scripts, startup), falls back to a direct insert_one.
+"""
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+AUDIT_DURABILITY = os.environ.get("AUDIT_DURABILITY", "async").lower()  # async | sync
+QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "0.5"))
+DRAIN_TIMEOUT = float(os.environ.get("AUDIT_DRAIN_TIMEOUT", "10"))
+WRITE_ATTEMPTS = 3
+
+_db = None
+_queue = None
+_task = None
+_STOP = object()
+_stats = {"queued": 0, "written": 0, "batches": 0, "direct": 0, "overflow": 0, "failed": 0}
+
+
+def set_db(database):
+    global _db
+    _db = database
+
+
+async def _direct(collection: str, doc: dict):
+    _stats["direct"] += 1
+    await _db[collection].insert_one(doc)
+
+
+async def record(collection: str, doc: dict):
+    if _task is None or _task.done():
+        return await _direct(collection, doc)
+    fut = asyncio.get_running_loop().create_future() if AUDIT_DURABILITY == "sync" else None
+    try:
+        _queue.put_nowait((collection, doc, fut))
+    except asyncio.QueueFull:
+        # Back-pressure instead of dropping: this request pays for its own write
+        _stats["overflow"] += 1
+        return await _direct(collection, doc)
+    _stats["queued"] += 1
+    if fut is not None:
+        await fut
+
+
+async def audit(entry: dict):
+    await record("audit_log", entry)
+
+
+async def agent_run(run: dict):
+    await record("agent_runs", run)
+
+
+async def _write(batch: list):
+    by_collection = {}
+    for collection, doc, fut in batch:
+        by_collection.setdefault(collection, []).append((doc, fut))
+    for collection, items in by_collection.items():
+        error = None
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                await _db[collection].insert_many([doc for doc, _ in items], ordered=False)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                # A partial write leaves _id on the inserted docs; duplicates are reported, not re-sent
+                if "duplicate key" in str(e).lower():
+                    error = None
+                    break
+                await asyncio.sleep(0.2 * (attempt + 1))
+        if error is None:
+            _stats["written"] += len(items)
+        else:
+            _stats["failed"] += len(items)
+            logger.error(f"Audit sink: {len(items)} {collection} records not written: {error}")
+        for _, fut in items:
+            if fut is None or fut.done():
+                continue
+            if error is None:
+                fut.set_result(None)
+            else:
+                fut.set_exception(error)
+    _stats["batches"] += 1
+
+
+async def _flusher():
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        item = await _queue.get()
+        if item is _STOP:
+            break
+        batch = [item]
+        deadline = loop.time() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            try:
+                item = _queue.get_nowait()
+            except asyncio.QueueEmpty:
+                # sync callers are waiting: write what is there now instead of waiting for more
+                if AUDIT_DURABILITY == "sync" or loop.time() >= deadline:
+                    break
+                try:
+                    item = await asyncio.wait_for(_queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        await _write(batch)
+    # Drain whatever is left after the stop marker
+    rest = []
+    while not _queue.empty():
+        item = _queue.get_nowait()
+        if item is not _STOP:
+            rest.append(item)
+    for i in range(0, len(rest), BATCH_SIZE):
+        await _write(rest[i:i + BATCH_SIZE])
+
+
+def start():
+    global _queue, _task
+    if _task is not None and not _task.done():
+        return
+    _queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _task = asyncio.create_task(_flusher())
+    logger.info(f"Audit sink started (durability={AUDIT_DURABILITY}, batch={BATCH_SIZE}, interval={FLUSH_INTERVAL}s)")
+
+
+async def stop():
+    """Flush everything queued, then stop. New records go straight to the database from here on."""
+    global _task
+    if _task is None:
+        return
+    task, _task = _task, None
+    if not task.done():
+        try:
+            await asyncio.wait_for(_queue.put(_STOP), DRAIN_TIMEOUT)
+            await asyncio.wait_for(task, DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Audit sink: drain timed out, {_queue.qsize()} records not written")
+    logger.info(f"Audit sink stopped ({_stats['written']} records written)")
+
+
+def get_stats() -> dict:
+    return {"durability": AUDIT_DURABILITY, "running": _task is not None and not _task.done(),
+            "pending": _queue.qsize() if _queue else 0, "batch_size": BATCH_SIZE, "flush_interval": FLUSH_INTERVAL, **_stats}
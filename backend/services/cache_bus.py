@@ -0,0 +1,161 @@
+"""Cache Bus - Cross-worker invalidation of in-process caches via MongoDB change streams, with a TTL fallback
+
+Each uvicorn worker tails one change stream over the watched collections and evicts matching keys
+from its own caches, so a write in any worker reaches all of them. Change streams need a replica set
+or sharded cluster; on a standalone mongod (or while the stream is down) every cache falls back to
+CACHE_TTL_FALLBACK seconds, which bounds staleness without any broadcast.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+WATCHED = ("organizations", "applications", "agent_rules", "integrations_config")
+TTL_STREAMING = float(os.environ.get("CACHE_TTL", "300"))         # safety net even with the stream up
+TTL_FALLBACK = float(os.environ.get("CACHE_TTL_FALLBACK", "5"))    # no change stream: short-lived entries only
+RETRY_SECONDS = float(os.environ.get("CHANGE_STREAM_RETRY", "60"))
+
+_db = None
+_task = None
+_caches = {}
+_subscribers = {collection: [] for collection in WATCHED}
+_state = {"mode": "ttl", "since": None, "events": 0, "reconnects": 0, "last_error": None}
+_resume_token = None
+
+
+def set_db(database):
+    global _db
+    _db = database
+
+
+def ttl() -> float:
+    return TTL_STREAMING if _state["mode"] == "streaming" else TTL_FALLBACK
+
+
+class LocalCache:
+    """Per-worker LRU whose entries live for the bus TTL (long while invalidations stream, short otherwise)."""
+
+    def __init__(self, name: str, max_entries: int = 1000):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[object, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        _caches[name] = self
+
+    def get(self, key):
+        """(hit, value); a cached None is a hit."""
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < ttl():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, entry[1]
+        if entry:
+            del self._entries[key]
+        self.stats["misses"] += 1
+        return False, None
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def evict(self, key):
+        if self._entries.pop(key, None) is not None:
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        self.stats["evictions"] += len(self._entries)
+        self._entries.clear()
+
+    def evictor(self, *fields):
+        """Change handler evicting the key built from these document fields; clears the cache when
+        the document is not available (deletes)."""
+        def handler(doc):
+            if doc is None:
+                self.clear()
+            else:
+                self.evict(doc.get(fields[0]) if len(fields) == 1 else tuple(doc.get(f) for f in fields))
+        return handler
+
+
+def subscribe(collection: str, handler):
+    """handler(doc) runs in every worker after a write to collection; doc is None when unknown (deletes)."""
+    _subscribers[collection].append(handler)
+
+
+def invalidate(collection: str, doc: dict = None):
+    """Apply a write to this worker's caches right away (the stream delivers it to the others,
+    and to this one again, shortly after)."""
+    for handler in _subscribers.get(collection, []):
+        try:
+            handler(doc)
+        except Exception as e:
+            logger.warning(f"Cache bus: handler for {collection} failed: {e}")
+
+
+def _dispatch(change: dict):
+    _state["events"] += 1
+    doc = change.get("fullDocument")
+    if doc is None and change.get("operationType") in ("drop", "rename", "dropDatabase", "invalidate"):
+        for cache in _caches.values():
+            cache.clear()
+        return
+    invalidate(change.get("ns", {}).get("coll"), doc)
+
+
+def _set_mode(mode: str, error: str = None):
+    if mode != _state["mode"]:
+        logger.info(f"Cache bus: {_state['mode']} -> {mode}" + (f" ({error})" if error else ""))
+        _state.update(mode=mode, since=time.time())
+    if error:
+        _state["last_error"] = error
+
+
+async def _tail():
+    global _resume_token
+    pipeline = [{"$match": {"ns.coll": {"$in": list(WATCHED)}}}]
+    while True:
+        try:
+            async with _db.watch(pipeline, full_document="updateLookup", resume_after=_resume_token) as stream:
+                if _resume_token is None:
+                    # Nothing to resume from: writes may have been missed while the stream was down
+                    for cache in _caches.values():
+                        cache.clear()
+                _set_mode("streaming")
+                async for change in stream:
+                    _resume_token = stream.resume_token
+                    _dispatch(change)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Standalone mongod ("only supported on replica sets"), lost connection or expired resume token
+            _set_mode("ttl", f"{type(e).__name__}: {str(e)[:200]}")
+            _resume_token = None
+            _state["reconnects"] += 1
+            await asyncio.sleep(RETRY_SECONDS)
+
+
+def start():
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_tail())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
+
+
+def get_stats() -> dict:
+    return {**_state, "ttl_seconds": ttl(), "watched": list(WATCHED),
+            "caches": {name: {**c.stats, "entries": len(c._entries)} for name, c in _caches.items()}}
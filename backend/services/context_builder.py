@@ -1,13 +1,78 @@
 """Project Context Builder - Builds complete context for all agents from all available data"""
+import os
+import copy
+import asyncio
+import logging
+from collections import OrderedDict
+from services import application_store, cache_bus
 
-async def build_full_context(app_id: str, db) -> dict:
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAX_ENTRIES = int(os.environ.get("CONTEXT_CACHE_SIZE", "128"))
+
+# app_id -> (context_version, context). Valid while the application's context_version is unchanged.
+_snapshots: "OrderedDict[str, tuple]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "bumps": 0}
+# Writes from other workers drop the snapshot here too (the version check still guards every hit)
+cache_bus.subscribe("applications", lambda doc: _snapshots.pop(doc.get("id"), None) if doc else _snapshots.clear())
+
+
+async def bump_context_version(db, app_id: str = None, company_id: str = None):
+    """Invalidate cached context snapshots. Call after any write to an application, to the
+    organization behind it, or to its compliance reports."""
+    if app_id:
+        await db.applications.update_one({"id": app_id}, {"$inc": {"context_version": 1}})
+        _snapshots.pop(app_id, None)
+    if company_id:
+        await db.applications.update_many({"company_id": company_id}, {"$inc": {"context_version": 1}})
+    _stats["bumps"] += 1
+
+
+def get_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {**_stats, "entries": len(_snapshots), "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0}
+
+
+async def build_full_context(app_id: str, db, use_cache: bool = True) -> dict:
     """
     Aggregates ALL available data for a project into a single context dict.
     Used by every agent to have complete awareness of the project state.
+
+    Snapshots are reused while the application's context_version is unchanged, so a
+    series of agent runs costs one version lookup each instead of a full rebuild.
     """
-    app = await db.applications.find_one({"id": app_id}, {"_id": 0})
+    if use_cache:
+        head = await db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1, "context_version": 1})
+        if not head:
+            return {}
+        entry = _snapshots.get(app_id)
+        if entry and entry[0] == head.get("context_version", 0):
+            _snapshots.move_to_end(app_id)
+            _stats["hits"] += 1
+            return copy.deepcopy(entry[1])
+    _stats["misses"] += 1
+    ctx = await _aggregate_context(app_id, db)
+    if ctx:
+        _snapshots[app_id] = (ctx["context_version"], ctx)
+        _snapshots.move_to_end(app_id)
+        while len(_snapshots) > SNAPSHOT_MAX_ENTRIES:
+            _snapshots.popitem(last=False)
+        ctx = copy.deepcopy(ctx)
+    return ctx
+
+
+async def _aggregate_context(app_id: str, db) -> dict:
+    app = await application_store.get_application(db, app_id)
     if not app:
         return {}
+    # Only the sub-collection fields the context reads; drafts are just counted
+    guide_assets, req_docs, uploaded_docs, part_counts = await asyncio.gather(
+        application_store.list_items(db, app_id, "guide_assets", projection={"_id": 0, "extracted_content": 1}),
+        application_store.list_items(db, app_id, "required_documents", projection={"_id": 0, "status": 1}),
+        application_store.list_items(db, app_id, "documents", projection={
+            "_id": 0, "filename": 1, "folder_group": 1, "tip_document": 1, "status": 1, "ocr_status": 1, "ocr_data.extracted_fields": 1}),
+        application_store.counts(db, app_id, ("drafts",)),
+    )
 
     org = await db.organizations.find_one({"id": app.get("company_id")}, {"_id": 0})
 
@@ -50,7 +115,6 @@ async def build_full_context(app_id: str, db) -> dict:
 
     # --- Guide extracted data ---
     guide_data = {}
-    guide_assets = app.get("guide_assets", [])
     for g in guide_assets:
         ec = g.get("extracted_content", {})
         if ec:
@@ -82,9 +146,6 @@ async def build_full_context(app_id: str, db) -> dict:
     }
 
     # --- Documents status ---
-    req_docs = app.get("required_documents", [])
-    uploaded_docs = app.get("documents", [])
-    drafts = app.get("drafts", [])
     achizitii = app.get("achizitii", [])
 
     docs_summary = {
@@ -92,7 +153,7 @@ async def build_full_context(app_id: str, db) -> dict:
         "total_incarcate": len(uploaded_docs),
         "total_lipsa": len([r for r in req_docs if r.get("status") == "missing"]),
         "checklist_frozen": app.get("checklist_frozen", False),
-        "drafturi_generate": len(drafts),
+        "drafturi_generate": part_counts["drafts"],
         "ghiduri_incarcate": len(guide_assets),
         "achizitii_count": len(achizitii),
         "achizitii_total": sum(a.get("cantitate", 1) * a.get("pret_unitar", 0) for a in achizitii),
@@ -111,6 +172,8 @@ async def build_full_context(app_id: str, db) -> dict:
     reports_summary = [{"type": r.get("type"), "date": r.get("created_at", "")[:10]} for r in reports]
 
     return {
+        "application_id": app_id,
+        "context_version": app.get("context_version", 0),
         "firma": firma,
         "program": program,
         "config": config,
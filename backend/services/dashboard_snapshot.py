@@ -0,0 +1,145 @@
+"""Dashboard Snapshot - Admin dashboard statistics from one $facet aggregation, refreshed in the background
+
+Every collection is reduced to {c: <name>, k: <grouped field>} rows and concatenated with $unionWith
+(MongoDB 4.4+), so a single $facet computes the totals, the per-state breakdowns and the recent audit
+entries server-side. Requests get the last snapshot; a background task rebuilds it every
+ADMIN_DASHBOARD_REFRESH seconds.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = float(os.environ.get("ADMIN_DASHBOARD_REFRESH", "60"))
+RECENT_AUDIT = 10
+
+# collection -> field counted per value (None: total only)
+COUNTED = {
+    "users": None,
+    "organizations": None,
+    "specialists": None,
+    "projects": "stare",
+    "documents": "ocr_status",
+    "applications": "status",
+}
+
+_db = None
+_task = None
+_snapshot = None
+
+
+def set_db(database):
+    global _db
+    _db = database
+
+
+def _rows(collection: str, field: str = None) -> list:
+    row = {"_id": 0, "c": {"$literal": collection}}
+    if field:
+        row["k"] = {"$ifNull": [f"${field}", "unknown"]}
+    return [{"$project": row}]
+
+
+def _pipeline(runs_since: str) -> list:
+    collections = list(COUNTED.items())
+    first, first_field = collections[0]
+    pipeline = _rows(first, first_field)
+    for collection, field in collections[1:]:
+        pipeline.append({"$unionWith": {"coll": collection, "pipeline": _rows(collection, field)}})
+    pipeline += [
+        {"$unionWith": {"coll": "agent_runs", "pipeline": [
+            {"$match": {"timestamp": {"$gte": runs_since}}},
+            *_rows("agent_runs", "agent_id"),
+        ]}},
+        {"$unionWith": {"coll": "audit_log", "pipeline": [
+            {"$sort": {"timestamp": -1}},
+            {"$limit": RECENT_AUDIT},
+            {"$project": {"_id": 0}},
+            {"$project": {"c": {"$literal": "recent_audit"}, "doc": "$$ROOT"}},
+        ]}},
+        {"$facet": {
+            "totals": [
+                {"$match": {"c": {"$in": list(COUNTED)}}},
+                {"$group": {"_id": "$c", "n": {"$sum": 1}}},
+            ],
+            "by_value": [
+                {"$match": {"k": {"$exists": True}}},
+                {"$group": {"_id": {"c": "$c", "k": "$k"}, "n": {"$sum": 1}}},
+            ],
+            "recent_audit": [
+                {"$match": {"c": "recent_audit"}},
+                {"$sort": {"doc.timestamp": -1}},
+                {"$replaceRoot": {"newRoot": "$doc"}},
+            ],
+        }},
+    ]
+    return pipeline
+
+
+async def refresh(db=None) -> dict:
+    global _snapshot
+    db = db or _db
+    started = time.monotonic()
+    now = datetime.now(timezone.utc)
+    result = (await db.users.aggregate(_pipeline((now - timedelta(hours=24)).isoformat())).to_list(1))[0]
+    totals = {row["_id"]: row["n"] for row in result["totals"]}
+    by_value = {}
+    for row in result["by_value"]:
+        by_value.setdefault(row["_id"]["c"], {})[str(row["_id"]["k"])] = row["n"]
+    _snapshot = {
+        "stats": {
+            "total_users": totals.get("users", 0),
+            "total_organizations": totals.get("organizations", 0),
+            "total_projects": totals.get("projects", 0),
+            "total_documents": totals.get("documents", 0),
+            "total_specialists": totals.get("specialists", 0),
+            "total_applications": totals.get("applications", 0),
+        },
+        "projects_by_state": by_value.get("projects", {}),
+        "applications_by_status": by_value.get("applications", {}),
+        "documents_by_ocr_status": by_value.get("documents", {}),
+        "agent_runs_24h": by_value.get("agent_runs", {}),
+        "recent_audit": result["recent_audit"],
+        "generated_at": now.isoformat(),
+        "refresh_ms": round((time.monotonic() - started) * 1000, 2),
+    }
+    return _snapshot
+
+
+async def get(db=None) -> dict:
+    """Last snapshot; built on the spot before the first refresh and whenever the task is disabled."""
+    if _snapshot is None or _task is None:
+        return await refresh(db)
+    return _snapshot
+
+
+async def _loop():
+    while True:
+        try:
+            await refresh()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Dashboard snapshot refresh failed: {e}")
+        await asyncio.sleep(REFRESH_SECONDS)
+
+
+def start():
+    global _task
+    if REFRESH_SECONDS > 0 and (_task is None or _task.done()):
+        _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
+
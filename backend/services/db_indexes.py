@@ -0,0 +1,172 @@
+"""DB Indexes - Declarative index registry applied at startup, plus an $indexStats health report"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from services import application_store
+
+logger = logging.getLogger(__name__)
+
+# collection -> list of (keys, options). Every hot lookup/sort must be covered here; creation is
+# idempotent, so adding an entry and restarting is all it takes. Paginated lists (services/pagination)
+# need their filter prefix followed by (created_at|timestamp, id).
+INDEXES = {
+    "users": [
+        ([("id", 1)], {"unique": True}),
+        ([("email", 1)], {"unique": True}),
+        ([("verification_token", 1)], {}),
+        ([("reset_token", 1)], {}),
+    ],
+    "organizations": [
+        ([("id", 1)], {"unique": True}),
+        ([("members.user_id", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("cui", 1)], {}),
+    ],
+    "applications": [
+        ([("id", 1)], {"unique": True}),
+        ([("created_by", 1), ("company_id", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("created_by", 1), ("created_at", -1), ("id", -1)], {}),
+    ],
+    "projects": [
+        ([("id", 1)], {"unique": True}),
+        ([("members.user_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ],
+    "documents": [
+        ([("id", 1)], {"unique": True}),
+        ([("project_id", 1)], {}),
+        ([("created_at", -1), ("id", -1)], {}),
+    ],
+    "specialists": [
+        ([("created_at", -1), ("id", -1)], {}),
+    ],
+    "agent_rules": [
+        ([("agent_id", 1), ("user_id", 1)], {}),
+        ([("user_id", 1)], {}),
+    ],
+    "compliance_reports": [
+        ([("application_id", 1), ("type", 1), ("created_at", -1)], {}),
+        ([("project_id", 1)], {}),
+    ],
+    "agent_runs": [
+        ([("agent_id", 1), ("application_id", 1), ("timestamp", -1), ("id", -1)], {}),
+        ([("agent_id", 1), ("timestamp", -1), ("id", -1)], {}),
+        ([("timestamp", 1)], {}),  # retention: oldest rows first
+    ],
+    "audit_log": [
+        ([("timestamp", -1), ("id", -1)], {}),
+        ([("user_id", 1), ("timestamp", -1), ("id", -1)], {}),
+    ],
+    "orchestrator_checks": [
+        ([("id", 1)], {"unique": True}),
+    ],
+    # Former embedded application arrays (services/application_store)
+    **{collection: [
+        ([("application_id", 1), ("seq", 1)], {}),
+        ([("application_id", 1), ("id", 1)], {}),
+    ] for collection in application_store.COLLECTIONS.values()},
+    # Service-owned collections
+    "llm_cache": [
+        ([("key", 1)], {"unique": True}),
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),  # MongoDB expires entries on its own
+    ],
+    "jobs": [
+        ([("id", 1)], {"unique": True}),
+        ([("status", 1), ("created_at", 1)], {}),
+    ],
+    "guide_chunks": [
+        ([("application_id", 1), ("asset_id", 1), ("ord", 1)], {}),
+    ],
+    "ocr_cache": [
+        ([("content_hash", 1), ("doc_type", 1)], {"unique": True}),
+    ],
+    "activity_rollups": [
+        ([("id", 1)], {"unique": True}),
+        ([("source", 1), ("granularity", 1), ("period", 1)], {}),
+    ],
+    "retention_state": [
+        ([("id", 1)], {"unique": True}),  # also what makes the retention lock exclusive
+    ],
+}
+
+_last_run = {"started_at": None, "finished_at": None, "created": 0, "failed": []}
+_task = None
+
+
+def index_name(keys: list) -> str:
+    """MongoDB's default name for a key pattern (field_1_other_-1)."""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+async def apply(db) -> dict:
+    """Create every registered index. Each one is tried on its own, so a conflict (e.g. duplicate
+    emails blocking a unique index) is logged without stopping the rest."""
+    _last_run.update(started_at=datetime.now(timezone.utc).isoformat(), finished_at=None, created=0, failed=[])
+    for collection, specs in INDEXES.items():
+        for keys, options in specs:
+            try:
+                await db[collection].create_index(keys, **options)
+                _last_run["created"] += 1
+            except Exception as e:
+                _last_run["failed"].append({"collection": collection, "index": index_name(keys), "error": str(e)[:300]})
+                logger.warning(f"Index {collection}.{index_name(keys)} not created: {e}")
+    _last_run["finished_at"] = datetime.now(timezone.utc).isoformat()
+    logger.info(f"Index bootstrap: {_last_run['created']} ensured, {len(_last_run['failed'])} failed")
+    return dict(_last_run)
+
+
+def start(db):
+    """Run apply() in the background: index builds on a large collection must not hold up startup."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(apply(db))
+
+
+async def stop():
+    """Cancel a bootstrap still running at shutdown (builds already sent continue on the server)."""
+    global _task
+    if _task is None:
+        return
+    task, _task = _task, None
+    if not task.done():
+        task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.warning("Index bootstrap cancelled at shutdown")
+    except Exception as e:
+        logger.error(f"Index bootstrap failed: {e}")
+
+
+async def _usage(coll) -> dict:
+    """index name -> {ops, since} from $indexStats; None when the server does not support it."""
+    try:
+        stats = await coll.aggregate([{"$indexStats": {}}]).to_list(None)
+    except Exception:
+        return None
+    return {s["name"]: {"ops": s.get("accesses", {}).get("ops", 0), "since": str(s.get("accesses", {}).get("since", ""))} for s in stats}
+
+
+async def report(db) -> dict:
+    """Per collection: declared indexes that are missing, indexes present but not declared, and
+    indexes with zero recorded accesses since the server (re)started."""
+    collections = []
+    totals = {"missing": 0, "undeclared": 0, "unused": 0}
+    names = set(INDEXES) | set(await db.list_collection_names())
+    for collection in sorted(names):
+        coll = db[collection]
+        present = {}
+        async for ix in coll.list_indexes():
+            present[ix["name"]] = list(ix["key"].items())
+        declared = {index_name(keys) for keys, _ in INDEXES.get(collection, [])}
+        usage = await _usage(coll)
+        entry = {
+            "collection": collection,
+            "missing": sorted(declared - set(present)),
+            "undeclared": sorted(n for n in present if n != "_id_" and n not in declared),
+            "unused": sorted(n for n, u in usage.items() if n != "_id_" and not u["ops"]) if usage is not None else None,
+            "usage": usage,
+        }
+        for key in totals:
+            totals[key] += len(entry[key] or [])
+        collections.append(entry)
+    return {"totals": totals, "last_bootstrap": dict(_last_run), "index_stats_available": any(c["usage"] is not None for c in collections),
+            "collections": collections}
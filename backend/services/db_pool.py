@@ -0,0 +1,130 @@
+"""DB Pool - Environment-driven Motor client settings and connection-pool (CMAP) instrumentation"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import importlib.util
+from collections import deque
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# env var -> MongoClient option; unset vars keep the driver default
+_INT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+# Compressors need their Python package; zlib is always available
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+WAIT_SAMPLES = 1000
+PING_TIMEOUT = float(os.environ.get("HEALTH_DB_TIMEOUT", "2"))
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """Checkout waits and connection counts per server. pymongo emits checkout-started and
+    checked-out/failed on the same thread, so a thread-local start time pairs them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.servers = {}
+
+    def _server(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}" if address else "unknown"
+        if key not in self.servers:
+            self.servers[key] = {"open": 0, "in_use": 0, "max_in_use": 0, "checkouts": 0, "checkout_failed": {},
+                                 "pool_cleared": 0, "waits": deque(maxlen=WAIT_SAMPLES)}
+        return self.servers[key]
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._server(event.address)["pool_cleared"] += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self._server(event.address)["open"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._server(event.address)["open"] -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            failed = self._server(event.address)["checkout_failed"]
+            failed[str(event.reason)] = failed.get(str(event.reason), 0) + 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        with self._lock:
+            s = self._server(event.address)
+            s["checkouts"] += 1
+            s["in_use"] += 1
+            s["max_in_use"] = max(s["max_in_use"], s["in_use"])
+            if started is not None:
+                s["waits"].append(time.monotonic() - started)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._server(event.address)["in_use"] -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for key, s in self.servers.items():
+                waits = sorted(s["waits"])
+                p = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 2) if waits else 0.0
+                result[key] = {k: v for k, v in s.items() if k != "waits"}
+                result[key]["checkout_wait_ms"] = {"p50": p(0.5), "p95": p(0.95), "max": round(waits[-1] * 1000, 2) if waits else 0.0}
+            return result
+
+
+pool_listener = PoolListener()
+
+
+def _compressors(raw: str) -> list:
+    available = []
+    for name in [c.strip().lower() for c in raw.split(",") if c.strip()]:
+        module = _COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module):
+            available.append(name)
+        else:
+            logger.warning(f"MONGO_COMPRESSORS: {name} skipped ({module or 'unknown compressor'} not installed)")
+    return available
+
+
+def client_options() -> dict:
+    """MongoClient keyword arguments from the environment (plus the pool listener)."""
+    options = {option: int(os.environ[env_name]) for env_name, option in _INT_OPTIONS.items() if os.environ.get(env_name)}
+    compressors = _compressors(os.environ.get("MONGO_COMPRESSORS", ""))
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    if os.environ.get("MONGO_READ_PREFERENCE"):
+        options["readPreference"] = os.environ["MONGO_READ_PREFERENCE"]  # primary | primaryPreferred | secondaryPreferred | ...
+    options["appname"] = os.environ.get("MONGO_APP_NAME", "grantflow")  # shows up in server logs and currentOp
+    options["event_listeners"] = [pool_listener]
+    return options
+
+
+def describe(options: dict) -> dict:
+    return {k: v for k, v in options.items() if k != "event_listeners"}
+
+
+async def ping(db) -> dict:
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(db.command("ping"), PING_TIMEOUT)
+        return {"ok": True, "ping_ms": round((time.monotonic() - started) * 1000, 2)}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {str(e)[:200]}", "ping_ms": round((time.monotonic() - started) * 1000, 2)}
@@ -0,0 +1,161 @@
+"""Guide Index - Chunked BM25 retrieval over the applicant guides of an application"""
+import os
+import re
+import math
+import uuid
+import logging
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+CHUNK_WORDS = int(os.environ.get("GUIDE_CHUNK_WORDS", "220"))
+CHUNK_OVERLAP = int(os.environ.get("GUIDE_CHUNK_OVERLAP", "40"))
+TOP_K = int(os.environ.get("GUIDE_TOP_K", "5"))
+INDEX_CACHE_SIZE = int(os.environ.get("GUIDE_INDEX_CACHE_SIZE", "32"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "si", "sau", "de", "la", "in", "din", "pe", "cu", "pentru", "care", "ce", "este", "sunt", "fi", "un", "o",
+    "al", "ale", "ai", "a", "nu", "se", "sa", "prin", "cat", "mai", "fie", "acest", "aceasta", "acestea",
+    "catre", "dupa", "daca", "iar", "ca", "cum", "lor", "sale", "fara", "intre", "conform",
+}
+
+_PAGE_RE = re.compile(r"^--- Pagina (\d+) ---$", re.MULTILINE)
+_TOKEN_RE = re.compile(r"\w+")
+
+_db = None
+# application_id -> (guide_index_version, _Bm25)
+_indexes: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def set_db(database):
+    global _db
+    _db = database
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, fold Romanian diacritics (ș→s, ă→a), drop stopwords and 1-char tokens."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return [t for t in _TOKEN_RE.findall(folded) if len(t) > 1 and t not in STOPWORDS]
+
+
+def chunk_text(text: str) -> list:
+    """Split into ~CHUNK_WORDS-word windows with overlap, keeping the source page when the text
+    carries `--- Pagina N ---` markers (as produced by pdf_text.analyse_pdf)."""
+    pages = []
+    marks = list(_PAGE_RE.finditer(text))
+    if marks:
+        for i, m in enumerate(marks):
+            end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+            pages.append((int(m.group(1)), text[m.end():end]))
+    else:
+        pages.append((None, text))
+
+    chunks = []
+    step = max(1, CHUNK_WORDS - CHUNK_OVERLAP)
+    for page, body in pages:
+        words = body.split()
+        for start in range(0, len(words), step):
+            window = words[start:start + CHUNK_WORDS]
+            if len(window) < 8 and start > 0:
+                break  # tail already covered by the overlap of the previous window
+            chunks.append({"page": page, "text": " ".join(window)})
+    return chunks
+
+
+class _Bm25:
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+        self.postings = defaultdict(list)
+        total = 0
+        for i, c in enumerate(chunks):
+            total += c["length"]
+            for term, tf in c["tf"].items():
+                self.postings[term].append((i, tf))
+        self.n = len(chunks)
+        self.avgdl = total / self.n if self.n else 0.0
+
+    def search(self, query: str, k: int) -> list:
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (self.n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                dl = self.chunks[i]["length"]
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / self.avgdl))
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [{**{f: self.chunks[i][f] for f in ("asset_id", "filename", "page", "text")}, "score": round(s, 3)} for i, s in best]
+
+
+async def index_guide(app_id: str, asset: dict, text: str) -> int:
+    """(Re)index one guide asset. Returns the number of chunks stored."""
+    await _db.guide_chunks.delete_many({"application_id": app_id, "asset_id": asset["id"]})
+    docs = []
+    for n, c in enumerate(chunk_text(text or "")):
+        tf = Counter(tokenize(c["text"]))
+        if not tf:
+            continue
+        docs.append({
+            "id": str(uuid.uuid4()), "application_id": app_id, "asset_id": asset["id"],
+            "filename": asset.get("filename"), "ord": n, "page": c["page"], "text": c["text"],
+            "tf": dict(tf), "length": sum(tf.values()), "created_at": datetime.now(timezone.utc).isoformat()
+        })
+    if docs:
+        await _db.guide_chunks.insert_many(docs)
+    await _db.applications.update_one({"id": app_id}, {"$inc": {"guide_index_version": 1}})
+    logger.info(f"Guide index: {len(docs)} chunks for asset {asset['id']} of application {app_id}")
+    return len(docs)
+
+
+async def remove_guide(app_id: str, asset_id: str):
+    await _db.guide_chunks.delete_many({"application_id": app_id, "asset_id": asset_id})
+    await _db.applications.update_one({"id": app_id}, {"$inc": {"guide_index_version": 1}})
+
+
+async def _load(app_id: str):
+    head = await _db.applications.find_one({"id": app_id}, {"_id": 0, "id": 1, "guide_index_version": 1})
+    if not head:
+        return None
+    version = head.get("guide_index_version", 0)
+    cached = _indexes.get(app_id)
+    if cached and cached[0] == version:
+        _indexes.move_to_end(app_id)
+        return cached[1]
+    chunks = await _db.guide_chunks.find(
+        {"application_id": app_id}, {"_id": 0, "asset_id": 1, "filename": 1, "page": 1, "text": 1, "tf": 1, "length": 1}
+    ).sort([("asset_id", 1), ("ord", 1)]).to_list(None)
+    index = _Bm25(chunks)
+    _indexes[app_id] = (version, index)
+    _indexes.move_to_end(app_id)
+    while len(_indexes) > INDEX_CACHE_SIZE:
+        _indexes.popitem(last=False)
+    return index
+
+
+async def retrieve(app_id: str, query: str, k: int = TOP_K) -> list:
+    """Top-k guide chunks for the query; [] when the application has no indexed guides."""
+    if _db is None or not app_id or not query:
+        return []
+    try:
+        index = await _load(app_id)
+    except Exception as e:
+        logger.warning(f"Guide index unavailable for {app_id}: {e}")
+        return []
+    if not index or not index.n:
+        return []
+    return index.search(query, k)
+
+
+def format_chunks(chunks: list) -> str:
+    lines = ["## Fragmente relevante din ghid"]
+    for c in chunks:
+        where = f"{c.get('filename') or 'ghid'}" + (f", p. {c['page']}" if c.get("page") else "")
+        lines.append(f"> [{where}] {c['text']}")
+    return "\n".join(lines)
+
@@ -0,0 +1,293 @@
+"""Guide Service - Parses applicant guides (Agent Parser) and applies the auto-actions on the application"""
+import os
+import uuid
+import json
+import asyncio
+import logging
+from datetime import datetime, timezone
+from services import llm_gateway, pdf_text, guide_index, application_store, audit_sink, agent_rules
+from services.update_builder import UpdateBuilder
+from services.ocr_service import build_document_message
+from services.funding_service import APPLICATION_STATE_LABELS
+
+logger = logging.getLogger(__name__)
+
+GUIDE_JOB = "guide_parse"
+GUIDE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "guides")
+
+EXTRACT_PROMPT = (
+    "Analizează acest document (ghid solicitant / anexă / procedură de evaluare) și extrage TOATE informațiile relevante.\n"
+    "Returnează un JSON STRICT cu aceste câmpuri:\n"
+    '{\n'
+    '  "tip_document": "ghid_solicitant / procedura_evaluare / anexa / grila_conformitate / altul",\n'
+    '  "program": "numele programului",\n'
+    '  "masura": "codul și numele măsurii",\n'
+    '  "sesiune": "numele sesiunii/apelului",\n'
+    '  "buget_total": "number sau null",\n'
+    '  "valoare_min_proiect": "number sau null",\n'
+    '  "valoare_max_proiect": "number sau null",\n'
+    '  "beneficiari_eligibili": ["lista tipurilor de beneficiari"],\n'
+    '  "criterii_eligibilitate": ["lista criteriilor de eligibilitate"],\n'
+    '  "documente_obligatorii": [{"nume": "string", "obligatoriu": true/false}],\n'
+    '  "grila_conformitate": [{"criteriu": "string", "punctaj_max": "number sau null"}],\n'
+    '  "termene": {"data_start": "string", "data_sfarsit": "string"},\n'
+    '  "activitati_eligibile": ["lista activităților eligibile"],\n'
+    '  "cheltuieli_eligibile": ["lista cheltuielilor eligibile"],\n'
+    '  "rezumat": "rezumat 3-5 propoziții"\n'
+    '}\n'
+    "IMPORTANT: Returnează DOAR JSON-ul valid. Dacă un câmp nu e disponibil, pune null."
+)
+
+_db = None
+
+
+def set_db(database):
+    global _db
+    _db = database
+
+
+def _parse_extraction(response: str) -> dict:
+    clean = response.strip()
+    if clean.startswith("```"): clean = clean.split("\n", 1)[1] if "\n" in clean else clean[3:]
+    if clean.endswith("```"): clean = clean[:-3]
+    if clean.startswith("json"): clean = clean[4:]
+    clean = clean.strip()
+    start = clean.find("{")
+    end = clean.rfind("}") + 1
+    if start >= 0 and end > start:
+        try:
+            return json.loads(clean[start:end])
+        except Exception:
+            pass
+    return {}
+
+
+def _local_text(raw_content: bytes, ext: str, analysis: dict = None) -> str:
+    """Text for the retrieval index, read without the model."""
+    if analysis is not None:
+        return analysis["text"]
+    if ext.lower() in (".txt", ".md", ".csv", ".htm", ".html"):
+        return raw_content.decode("utf-8", errors="replace")
+    return ""  # image, office file or scanned-only guide: nothing to index locally
+
+
+async def _extract_guide(raw_content: bytes, ext: str, user_id: str) -> tuple:
+    """Returns (extracted fields, page_stats, plain text for the retrieval index).
+    Born-digital PDF pages are read locally, only scanned pages go to Vision."""
+    ct_map = {".pdf": "application/pdf", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+    content_type = ct_map.get(ext.lower())
+
+    # Load custom rules for parser agent
+    parser_rules = await agent_rules.get(_db, "parser", user_id)
+    parser_extra = "\n".join(parser_rules.get("reguli", [])) if parser_rules else ""
+
+    chat = llm_gateway.new_chat(
+        "Ești expert în analiză ghiduri de finanțare din România. Extrage informații structurate." + (f"\nReguli suplimentare: {parser_extra}" if parser_extra else ""),
+        "openai", "gpt-5.2")
+
+    analysis = None
+    if content_type == "application/pdf" and pdf_text.available():
+        try:
+            analysis = await asyncio.to_thread(pdf_text.analyse_pdf, raw_content)
+        except Exception as e:
+            logger.warning(f"Guide PDF text layer unreadable: {e}")
+    text = _local_text(raw_content, ext, analysis)
+
+    msg, page_stats, _ = await build_document_message(EXTRACT_PROMPT, raw_content, content_type, analysis=analysis)
+    response = await llm_gateway.send(chat, msg, "openai", llm_gateway.PRIORITY_BATCH)
+    return _parse_extraction(response), page_stats, text
+
+
+async def process_guide(payload: dict, progress) -> dict:
+    """Job handler: parse the stored guide file, apply auto-actions, attach the asset, log agent runs."""
+    app_id = payload["application_id"]
+    asset = payload["asset"]
+    user_id = payload["user_id"]
+    agent_actions = []
+    # Every change to the application head below is collected here and written once at the end
+    head = UpdateBuilder()
+    app = None
+    app_fields = {"_id": 0, "id": 1, "status": 1, "program_name": 1, "measure_name": 1, "call_name": 1, "budget_estimated": 1, "checklist_frozen": 1}
+
+    raw_content = await asyncio.to_thread(_read_file, payload["file_path"])
+    ext = os.path.splitext(asset["stored_name"])[1]
+
+    # === AGENT PARSER: Extract text content from guide ===
+    try:
+        await progress.update(10, "parsing")
+        extracted, page_stats, guide_text = await _extract_guide(raw_content, ext, user_id)
+
+        asset["extracted_content"] = extracted
+        if page_stats:
+            asset["page_stats"] = page_stats
+        asset["extraction_status"] = "completed" if extracted else "failed"
+        agent_actions.append(f"Parser: Document analizat, {len(extracted)} câmpuri extrase")
+        if guide_text:
+            asset["indexed_chunks"] = await guide_index.index_guide(app_id, asset, guide_text)
+
+        # === AUTO-ACTIONS based on extracted content ===
+        await progress.update(70, "applying")
+        app = await _db.applications.find_one({"id": app_id}, app_fields)
+
+        # 1. Update program/session info if missing
+        if extracted and app:
+            updates = {}
+            if extracted.get("program") and not app.get("program_name"):
+                updates["program_name"] = extracted["program"]
+            if extracted.get("masura") and not app.get("measure_name"):
+                updates["measure_name"] = extracted["masura"]
+            if extracted.get("sesiune") and (not app.get("call_name") or app.get("call_name") == "Sesiune custom"):
+                updates["call_name"] = extracted["sesiune"]
+            if extracted.get("valoare_max_proiect") and not app.get("budget_estimated"):
+                try:
+                    updates["budget_estimated"] = float(extracted["valoare_max_proiect"])
+                    updates["call_value_max"] = float(extracted["valoare_max_proiect"])
+                except (ValueError, TypeError): pass
+            if extracted.get("valoare_min_proiect"):
+                try: updates["call_value_min"] = float(extracted["valoare_min_proiect"])
+                except (ValueError, TypeError): pass
+            if extracted.get("buget_total"):
+                try: updates["call_budget"] = float(extracted["buget_total"])
+                except (ValueError, TypeError): pass
+            if extracted.get("beneficiari_eligibili"):
+                updates["call_beneficiaries"] = extracted["beneficiari_eligibili"]
+            if updates:
+                head.set_many(updates)
+                agent_actions.append(f"Colector: Actualizate {', '.join(updates.keys())}")
+
+        # 2. Auto-propose required documents from guide
+        if extracted.get("documente_obligatorii") and app and not app.get("checklist_frozen"):
+            existing = await application_store.list_items(_db, app_id, "required_documents", projection={"_id": 0, "official_name": 1})
+            existing_names = [r.get("official_name", "").lower() for r in existing]
+            new_docs = []
+            for i, doc_req in enumerate(extracted["documente_obligatorii"]):
+                name = doc_req.get("nume", "") if isinstance(doc_req, dict) else str(doc_req)
+                if name and name.lower() not in existing_names:
+                    new_docs.append({
+                        "id": str(uuid.uuid4()), "order_index": len(existing_names) + len(new_docs) + 1,
+                        "official_name": name, "required": doc_req.get("obligatoriu", True) if isinstance(doc_req, dict) else True,
+                        "folder_group": "depunere", "status": "missing", "source": "ghid_auto"
+                    })
+            if new_docs:
+                await application_store.add(_db, app_id, "required_documents", new_docs, head)
+                agent_actions.append(f"Checklist: {len(new_docs)} documente cerute adăugate automat din ghid")
+
+        # 3. Store eligibility criteria for later use
+        if extracted.get("criterii_eligibilitate"):
+            head.set("criterii_eligibilitate_ghid", extracted["criterii_eligibilitate"])
+            agent_actions.append(f"Eligibilitate: {len(extracted['criterii_eligibilitate'])} criterii extrase din ghid")
+
+        # 4. Store conformity grid
+        if extracted.get("grila_conformitate"):
+            head.set("grila_conformitate_ghid", extracted["grila_conformitate"])
+            agent_actions.append(f"Evaluator: Grilă conformitate cu {len(extracted['grila_conformitate'])} criterii extrasă")
+
+        # 5. Store eligible activities/expenses
+        if extracted.get("activitati_eligibile"):
+            head.set("activitati_eligibile", extracted["activitati_eligibile"])
+        if extracted.get("cheltuieli_eligibile"):
+            head.set("cheltuieli_eligibile", extracted["cheltuieli_eligibile"])
+
+    except Exception as e:
+        if llm_gateway.is_transient(e) and not progress.final_attempt:
+            logger.warning(f"Guide extraction attempt {progress.attempt} failed, will retry: {e}")
+            raise
+        logger.error(f"Guide extraction failed: {e}")
+        asset["extraction_status"] = "error"
+        asset["extraction_error"] = str(e)[:200]
+        agent_actions.append(f"Eroare parsare ghid: {str(e)[:100]}")
+
+    # Replace the placeholder asset pushed at upload time with the extraction results
+    await progress.update(90, "saving")
+    if not await application_store.replace_item(_db, app_id, "guide_assets", asset, head):
+        raise LookupError(f"Ghidul {asset['id']} nu există în dosarul {app_id}")
+
+    # Auto-transition to guide_ready
+    if app is None:  # parsing failed before the auto-actions read it
+        app = await _db.applications.find_one({"id": app_id}, app_fields)
+    if app and app["status"] == "call_selected":
+        await application_store.add_event(_db, app_id, {"from": "call_selected", "to": "guide_ready", "at": datetime.now(timezone.utc).isoformat(), "by": "orchestrator", "reason": "Ghid procesat automat"}, head)
+        head.set_many({"status": "guide_ready", "status_label": APPLICATION_STATE_LABELS["guide_ready"]})
+
+    head.set("updated_at", datetime.now(timezone.utc).isoformat())
+    app = await head.commit(_db.applications, {"id": app_id}, {"_id": 0, "id": 1, "status": 1})
+
+    # Log all agent runs
+    for action in agent_actions:
+        agent_name = action.split(":")[0].strip().lower()
+        await audit_sink.agent_run({
+            "id": str(uuid.uuid4()), "agent_id": agent_name if agent_name in ["parser", "colector", "eligibilitate", "evaluator", "checklist"] else "orchestrator",
+            "application_id": app_id, "action": "guide_upload_processing",
+            "input": {"filename": asset["filename"], "tip": asset["tip"]},
+            "output": {"action": action},
+            "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": user_id
+        })
+
+    await audit_sink.audit({
+        "id": str(uuid.uuid4()), "action": "guide.uploaded_and_processed",
+        "entity_type": "application", "entity_id": app_id,
+        "user_id": user_id,
+        "details": {"filename": asset["filename"], "actions": agent_actions, "status": (app or {}).get("status")},
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    })
+
+    asset["agent_actions"] = agent_actions
+    return asset
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def backfill_index(db=None) -> dict:
+    """Index guide assets uploaded before retrieval existed (no indexed_chunks yet) from their stored
+    files and the local text layer; no model calls. Idempotent: assets with nothing to index get 0."""
+    db = db or _db
+    stats = {"applications": 0, "assets": 0, "chunks": 0, "missing_files": 0, "failed": []}
+    app_ids = [a["id"] async for a in db.applications.find({}, {"_id": 0, "id": 1})]
+    for app_id in app_ids:
+        await application_store.ensure_migrated(db, app_id)
+        assets = await application_store.list_items(db, app_id, "guide_assets", {"indexed_chunks": {"$exists": False}})
+        if assets:
+            stats["applications"] += 1
+        for asset in assets:
+            path = os.path.join(GUIDE_DIR, asset.get("stored_name") or "")
+            if not asset.get("stored_name") or not os.path.exists(path):
+                stats["missing_files"] += 1
+                continue
+            try:
+                raw_content = await asyncio.to_thread(_read_file, path)
+                ext = os.path.splitext(asset["stored_name"])[1]
+                analysis = None
+                if ext.lower() == ".pdf" and pdf_text.available():
+                    analysis = await asyncio.to_thread(pdf_text.analyse_pdf, raw_content)
+                text = _local_text(raw_content, ext, analysis)
+                chunks = await guide_index.index_guide(app_id, asset, text) if text else 0
+                await application_store.update_item(db, app_id, "guide_assets", asset["id"], {"indexed_chunks": chunks})
+                stats["assets"] += 1
+                stats["chunks"] += chunks
+            except Exception as e:
+                logger.error(f"Guide index backfill failed for asset {asset['id']} of application {app_id}: {e}")
+                stats["failed"].append({"application_id": app_id, "asset_id": asset["id"], "error": str(e)[:200]})
+    return stats
+
+
+if __name__ == "__main__":
+    # One-off retrieval backfill: python -m services.guide_service (from backend/, reads MONGO_URL / DB_NAME)
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent.parent / ".env")
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        database = client[os.environ["DB_NAME"]]
+        set_db(database)
+        guide_index.set_db(database)
+        logger.info(f"Guide index backfill finished: {await backfill_index(database)}")
+        client.close()
+
+    asyncio.run(_main())
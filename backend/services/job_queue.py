@@ -0,0 +1,171 @@
+"""Job Queue - Durable MongoDB-backed background jobs with an asyncio worker pool"""
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "120"))
+POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+_db = None
+_handlers = {}
+_workers = []
+_wakeup = asyncio.Event()
+_instance = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def set_db(database):
+    global _db
+    _db = database
+
+
+def register_handler(kind: str, handler):
+    """handler(payload: dict, progress: JobProgress) -> dict (stored as the job result)."""
+    _handlers[kind] = handler
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobProgress:
+    """Handed to handlers so they can report progress and keep their lease alive."""
+
+    def __init__(self, job_id: str, worker_id: str, attempt: int = 1):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.attempt = attempt
+
+    @property
+    def final_attempt(self) -> bool:
+        """A handler should only give up on transient errors (and record them as final) on its last try."""
+        return self.attempt >= MAX_ATTEMPTS
+
+    async def update(self, percent: int, stage: str):
+        await _db.jobs.update_one({"id": self.job_id, "worker_id": self.worker_id}, {"$set": {
+            "progress": {"percent": percent, "stage": stage},
+            "lease_expires_at": _now() + timedelta(seconds=LEASE_SECONDS),
+            "updated_at": _now().isoformat()
+        }})
+
+
+async def enqueue(kind: str, payload: dict, user_id: str = None, entity_id: str = None, job_id: str = None) -> dict:
+    """Queue a job and wake a worker. Pass job_id when the caller must reference the job in its own
+    records: write those first, the job may start before enqueue() returns."""
+    job = {
+        "id": job_id or str(uuid.uuid4()), "kind": kind, "payload": payload,
+        "status": "queued", "attempts": 0, "progress": {"percent": 0, "stage": "queued"},
+        "result": None, "error": None, "worker_id": None, "lease_expires_at": None,
+        "entity_id": entity_id, "user_id": user_id,
+        "created_at": _now().isoformat(), "updated_at": _now().isoformat()
+    }
+    await _db.jobs.insert_one(job)
+    job.pop("_id", None)
+    _wakeup.set()
+    return job
+
+
+async def get_job(job_id: str) -> dict:
+    return await _db.jobs.find_one({"id": job_id}, {"_id": 0, "payload": 0, "lease_expires_at": 0})
+
+
+async def _claim(worker_id: str):
+    """Atomically take the oldest queued job, or one whose lease expired (its worker died)."""
+    now = _now()
+    job = await _db.jobs.find_one_and_update(
+        {"kind": {"$in": list(_handlers.keys())}, "attempts": {"$lt": MAX_ATTEMPTS}, "$or": [
+            {"status": "queued"},
+            {"status": "running", "lease_expires_at": {"$lt": now}},
+        ]},
+        {"$set": {"status": "running", "worker_id": worker_id, "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS),
+                  "started_at": now.isoformat(), "updated_at": now.isoformat()},
+         "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)], return_document=ReturnDocument.AFTER
+    )
+    if job:
+        job.pop("_id", None)
+    return job
+
+
+async def _fail_exhausted():
+    """Running jobs whose lease expired after the last allowed attempt will never be claimed again."""
+    await _db.jobs.update_many(
+        {"status": "running", "attempts": {"$gte": MAX_ATTEMPTS}, "lease_expires_at": {"$lt": _now()}},
+        {"$set": {"status": "failed", "error": "Lease expirat după numărul maxim de încercări", "updated_at": _now().isoformat()}}
+    )
+
+
+async def _keep_lease(job_id: str, worker_id: str):
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        await _db.jobs.update_one({"id": job_id, "worker_id": worker_id}, {"$set": {"lease_expires_at": _now() + timedelta(seconds=LEASE_SECONDS)}})
+
+
+async def _run_job(job: dict, worker_id: str):
+    handler = _handlers[job["kind"]]
+    lease = asyncio.create_task(_keep_lease(job["id"], worker_id))
+    try:
+        result = await handler(job["payload"], JobProgress(job["id"], worker_id, job["attempts"]))
+        await _db.jobs.update_one({"id": job["id"], "worker_id": worker_id}, {"$set": {
+            "status": "completed", "result": result, "progress": {"percent": 100, "stage": "completed"},
+            "finished_at": _now().isoformat(), "updated_at": _now().isoformat()
+        }})
+    except Exception as e:
+        logger.error(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed: {e}")
+        retry = job["attempts"] < MAX_ATTEMPTS
+        await _db.jobs.update_one({"id": job["id"], "worker_id": worker_id}, {"$set": {
+            "status": "queued" if retry else "failed", "error": str(e)[:300],
+            "worker_id": None, "lease_expires_at": None, "updated_at": _now().isoformat()
+        }})
+    finally:
+        lease.cancel()
+
+
+async def _worker_loop(worker_id: str):
+    while True:
+        try:
+            # Cleared before claiming: an enqueue() that lands after an empty claim still wakes us
+            _wakeup.clear()
+            job = await _claim(worker_id)
+            if not job:
+                await _fail_exhausted()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            logger.info(f"Worker {worker_id} claimed job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+            await _run_job(job, worker_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job worker {worker_id} error: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+def start_workers(concurrency: int = JOB_WORKERS):
+    for i in range(concurrency):
+        _workers.append(asyncio.create_task(_worker_loop(f"{_instance}#{i}")))
+    logger.info(f"Started {concurrency} job workers")
+
+
+async def stop_workers():
+    """Cancel workers and hand their jobs back to the queue. After a crash the same happens
+    once the lease expires."""
+    worker_ids = [f"{_instance}#{i}" for i in range(len(_workers))]
+    for w in _workers:
+        w.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    if worker_ids:
+        await _db.jobs.update_many({"status": "running", "worker_id": {"$in": worker_ids}}, {
+            "$set": {"status": "queued", "worker_id": None, "lease_expires_at": None, "updated_at": _now().isoformat()},
+            "$inc": {"attempts": -1}
+        })
@@ -0,0 +1,235 @@
+"""LLM Backends - Pluggable chat clients behind the gateway: the Emergent provider or a local fake for load tests"""
+import os
+import re
+import json
+import random
+import hashlib
+import asyncio
+import logging
+from collections import OrderedDict
+from emergentintegrations.llm.chat import LlmChat
+from services.prompt_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# emergent = real provider (needs EMERGENT_LLM_KEY + network); fake = local stand-in, no network
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "emergent").lower()
+
+# Fake provider knobs. Latency is time-to-first-token; generation time is added from the throughput.
+FAKE_LATENCY_DIST = os.environ.get("FAKE_LLM_LATENCY_DIST", "lognormal").lower()  # fixed | uniform | lognormal
+FAKE_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "800"))  # fixed value, uniform mean, lognormal median
+FAKE_LATENCY_SPREAD = float(os.environ.get("FAKE_LLM_LATENCY_SPREAD", "0.5"))  # uniform: ±fraction, lognormal: sigma
+FAKE_TOKENS_PER_SEC = float(os.environ.get("FAKE_LLM_TOKENS_PER_SEC", "80"))  # 0 = whole answer at once
+FAKE_ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_RESPONSE_WORDS = int(os.environ.get("FAKE_LLM_RESPONSE_WORDS", "300"))
+FAKE_RESPONSES_FILE = os.environ.get("FAKE_LLM_RESPONSES", "")  # JSON list of {"contains", "response"}
+FAKE_SEED = os.environ.get("FAKE_LLM_SEED")
+# Simulated provider prefix cache: prefixes are matched on PREFIX_BLOCK_CHARS boundaries and count
+# only from FAKE_CACHE_MIN_TOKENS on (OpenAI caches prompts of 1024+ tokens)
+FAKE_CACHE_MIN_TOKENS = int(os.environ.get("FAKE_LLM_CACHE_MIN_TOKENS", "1024"))
+PREFIX_BLOCK_CHARS = 512
+PREFIX_CACHE_SIZE = 20000
+
+_rng = random.Random(int(FAKE_SEED) if FAKE_SEED else None)
+_canned = None
+_prefixes: "OrderedDict[str, None]" = OrderedDict()
+
+# Valid OCR payloads per document family, matched to ocr_service.PROMPT_MAP by prompt
+OCR_FIXTURES = {
+    "ci": {
+        "serie": "RX", "numar": "123456", "cnp": "1850101400011", "nume": "POPESCU", "prenume": "ION",
+        "data_nastere": "1985-01-01", "sex": "M", "cetatenie": "Română", "localitate": "București",
+        "adresa": "Str. Exemplu nr. 1, Sector 1, București", "judet": "București", "emis_de": "SPCEP S1",
+        "data_emitere": "2020-03-15", "data_expirare": "2030-01-01"
+    },
+    "certificat": {
+        "cui": "12345678", "denumire": "EXEMPLU CONSULTING SRL", "forma_juridica": "SRL", "nr_reg_com": "J40/1234/2015",
+        "adresa": "Str. Exemplu nr. 1, Sector 1, București", "judet": "București", "localitate": "București",
+        "cod_postal": "010101", "telefon": None, "data_infiintare": "2015-06-01",
+        "caen_principal": {"cod": "6201", "descriere": "Activități de realizare a soft-ului la comandă"},
+        "caen_secundare": [{"cod": "6202", "descriere": "Activități de consultanță în tehnologia informației"}],
+        "capital_social": 200, "administratori": [{"nume": "POPESCU ION", "functie": "Administrator"}],
+        "asociati": [{"nume": "POPESCU ION", "procent": 100}], "stare": "ACTIVA",
+        "obiect_activitate": "Realizare soft la comandă"
+    },
+    "factura": {
+        "numar_factura": "EX0001", "data_factura": "2026-02-10", "furnizor": "FURNIZOR TEHNIC SRL",
+        "cui_furnizor": "87654321", "client": "EXEMPLU CONSULTING SRL", "cui_client": "12345678",
+        "produse": "Echipamente IT (3 laptopuri)", "valoare_fara_tva": 15000, "tva": 2850, "total": 17850, "moneda": "RON"
+    },
+    "contract": {
+        "numar_contract": "12/2026", "data_contract": "2026-01-20", "parte_1": "EXEMPLU CONSULTING SRL",
+        "cui_parte_1": "12345678", "parte_2": "FURNIZOR TEHNIC SRL", "cui_parte_2": "87654321",
+        "obiect": "Furnizare echipamente IT", "valoare": 17850, "moneda": "RON", "durata": "6 luni",
+        "data_start": "2026-02-01", "data_sfarsit": "2026-07-31"
+    },
+    "bilant": {
+        "an_fiscal": "2025", "cui_firma": "12345678", "denumire_firma": "EXEMPLU CONSULTING SRL",
+        "cifra_afaceri": 850000, "profit_net": 120000, "active_totale": 640000, "datorii_totale": 210000,
+        "capitaluri_proprii": 430000, "numar_angajati": 9
+    },
+}
+
+_SCHEMA_LINE_RE = re.compile(r'^[ ]{0,2}"(\w+)":\s*(.+?),?\s*$', re.MULTILINE)
+_FILLER = ("Proiectul răspunde direct obiectivelor programului și criteriilor de eligibilitate din ghid. "
+           "Bugetul este corelat cu activitățile propuse, iar indicatorii sunt măsurabili și realiști. ")
+
+
+class FakeLlmError(Exception):
+    """Injected failure (FAKE_LLM_ERROR_RATE)."""
+
+
+def _latency() -> float:
+    base = FAKE_LATENCY_MS / 1000
+    if FAKE_LATENCY_DIST == "fixed":
+        return base
+    if FAKE_LATENCY_DIST == "uniform":
+        return max(0.0, _rng.uniform(base * (1 - FAKE_LATENCY_SPREAD), base * (1 + FAKE_LATENCY_SPREAD)))
+    return _rng.lognormvariate(0, FAKE_LATENCY_SPREAD) * base  # heavy right tail, like real providers
+
+
+def _load_canned() -> list:
+    global _canned
+    if _canned is None:
+        _canned = []
+        if FAKE_RESPONSES_FILE:
+            try:
+                with open(FAKE_RESPONSES_FILE, encoding="utf-8") as f:
+                    _canned = json.load(f)
+            except Exception as e:
+                logger.warning(f"Fake LLM: canned responses not loaded from {FAKE_RESPONSES_FILE}: {e}")
+    return _canned
+
+
+def _ocr_fixture(text: str):
+    from services.ocr_service import PROMPT_MAP, CI_PROMPT, ONRC_PROMPT, FACTURA_PROMPT, CONTRACT_PROMPT, BILANT_PROMPT
+    families = {CI_PROMPT: "ci", ONRC_PROMPT: "certificat", FACTURA_PROMPT: "factura", CONTRACT_PROMPT: "contract", BILANT_PROMPT: "bilant"}
+    for prompt in set(PROMPT_MAP.values()):
+        if text.startswith(prompt):
+            return OCR_FIXTURES[families[prompt]]
+    return None
+
+
+def _from_schema(text: str):
+    """Fill the JSON template a prompt asks for ("key": "number sau null", "key": [...], ...)."""
+    start = text.find("{\n")
+    end = text.find("\n}", start)
+    if start < 0 or end < 0:
+        return None
+    result = {}
+    for key, hint in _SCHEMA_LINE_RE.findall(text[start:end + 2]):
+        if hint.startswith("["):
+            result[key] = []
+        elif hint.startswith("{"):
+            result[key] = {}
+        elif "number" in hint:
+            result[key] = _rng.randint(1, 100) * 1000
+        else:
+            result[key] = f"{key} (simulat)"
+    return result or None
+
+
+def fake_response(text: str) -> str:
+    for entry in _load_canned():
+        if entry.get("contains", "") in text:
+            return entry["response"]
+    fixture = _ocr_fixture(text)
+    if fixture is not None:
+        return json.dumps(fixture, ensure_ascii=False)
+    if "JSON" in text:
+        filled = _from_schema(text)
+        if filled is not None:
+            return json.dumps(filled, ensure_ascii=False)
+        return json.dumps({"continut": text.split("\n", 1)[0][:200]}, ensure_ascii=False)
+    words = []
+    while len(words) < FAKE_RESPONSE_WORDS:
+        words.extend(_FILLER.split())
+    first_line = text.strip().split("\n", 1)[0][:120]
+    return f"## Răspuns simulat\n\n> {first_line}\n\n{' '.join(words[:FAKE_RESPONSE_WORDS])}\n\n- **Notă:** generat local (LLM_BACKEND=fake)"
+
+
+def _simulate_usage(prompt: str) -> dict:
+    """Usage in the OpenAI shape, with cached_tokens for the longest prefix seen before."""
+    boundaries = list(range(PREFIX_BLOCK_CHARS, len(prompt) + 1, PREFIX_BLOCK_CHARS))
+    hashes = [hashlib.sha1(prompt[:b].encode("utf-8")).hexdigest() for b in boundaries]
+    hit = 0
+    for b, h in zip(boundaries, hashes):
+        if h not in _prefixes:
+            break
+        _prefixes.move_to_end(h)
+        hit = b
+    for h in hashes:
+        _prefixes[h] = None
+    while len(_prefixes) > PREFIX_CACHE_SIZE:
+        _prefixes.popitem(last=False)
+    cached = count_tokens(prompt[:hit]) if hit else 0
+    return {"prompt_tokens": count_tokens(prompt),
+            "prompt_tokens_details": {"cached_tokens": cached if cached >= FAKE_CACHE_MIN_TOKENS else 0}}
+
+
+class FakeLlmChat:
+    """Drop-in for LlmChat: same constructor, with_model(), with_params() and send_message(), plus stream_message()."""
+
+    def __init__(self, api_key: str = "", session_id: str = "", system_message: str = ""):
+        self.session_id = session_id
+        self.system_message = system_message
+        self.provider = self.model = None
+        self.last_usage = None
+        self.params = {}
+
+    def with_model(self, provider: str, model: str):
+        self.provider, self.model = provider, model
+        return self
+
+    def with_params(self, **params):
+        self.params = params
+        return self
+
+    async def _respond(self, message) -> str:
+        await asyncio.sleep(_latency())
+        if FAKE_ERROR_RATE and _rng.random() < FAKE_ERROR_RATE:
+            raise FakeLlmError("Eroare simulată LLM (FAKE_LLM_ERROR_RATE)")
+        text = getattr(message, "text", "") or ""
+        self.last_usage = _simulate_usage(f"{self.system_message}\x00{text}")
+        return fake_response(text)
+
+    async def send_message(self, message) -> str:
+        response = await self._respond(message)
+        if FAKE_TOKENS_PER_SEC > 0:
+            await asyncio.sleep(count_tokens(response) / FAKE_TOKENS_PER_SEC)
+        return response
+
+    async def stream_message(self, message):
+        """Yield the answer in small chunks, paced at FAKE_LLM_TOKENS_PER_SEC after the first-token latency."""
+        response = await self._respond(message)
+        if FAKE_TOKENS_PER_SEC <= 0:
+            yield response
+            return
+        for chunk in re.findall(r"\S+\s*|\s+", response):
+            yield chunk
+            await asyncio.sleep(count_tokens(chunk) / FAKE_TOKENS_PER_SEC)
+
+
+def can_stream() -> bool:
+    """Whether the configured client yields partial output (an async stream_message(message))."""
+    return callable(getattr(chat_class(), "stream_message", None))
+
+
+def chat_class():
+    if LLM_BACKEND == "fake":
+        return FakeLlmChat
+    return LlmChat
+
+
+def describe() -> dict:
+    if LLM_BACKEND != "fake":
+        return {"backend": LLM_BACKEND, "streaming": can_stream()}
+    return {
+        "backend": "fake", "latency_dist": FAKE_LATENCY_DIST, "latency_ms": FAKE_LATENCY_MS,
+        "latency_spread": FAKE_LATENCY_SPREAD, "tokens_per_sec": FAKE_TOKENS_PER_SEC,
+        "error_rate": FAKE_ERROR_RATE, "canned_responses": len(_load_canned()), "streaming": True,
+    }
+
+
+if LLM_BACKEND == "fake":
+    logger.warning(f"LLM_BACKEND=fake: model calls are simulated locally ({describe()})")
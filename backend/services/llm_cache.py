@@ -0,0 +1,128 @@
+"""LLM Response Cache - Two-tier (in-process LRU + MongoDB TTL) cache for agent responses"""
+import os
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+LRU_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_LRU_SIZE", "256"))
+DEFAULT_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL", "900"))
+
+# Per-agent TTL (seconds). Reports depend on slowly-changing project data; the navigator is conversational.
+AGENT_TTLS = {
+    "eligibilitate": 3600,
+    "validator": 1800,
+    "redactor": 1800,
+    "navigator": 300,
+}
+
+_db = None
+_lru: "OrderedDict[str, tuple]" = OrderedDict()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "bypassed": 0}
+
+
+def set_cache_db(database):
+    global _db
+    _db = database
+
+
+def make_key(model: str, system_message: str, extra_rules: str, prompt: str) -> str:
+    """Content-addressed key: identical model + system + rules + prompt → identical key."""
+    h = hashlib.sha256()
+    for part in (model, system_message, extra_rules or "", prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def ttl_for(agent: str) -> int:
+    return AGENT_TTLS.get(agent, DEFAULT_TTL_SECONDS)
+
+
+def _lru_get(key: str) -> Optional[str]:
+    entry = _lru.get(key)
+    if not entry:
+        return None
+    expires, value = entry
+    if expires < time.monotonic():
+        _lru.pop(key, None)
+        return None
+    _lru.move_to_end(key)
+    return value
+
+
+def _lru_put(key: str, value: str, ttl: int):
+    _lru[key] = (time.monotonic() + ttl, value)
+    _lru.move_to_end(key)
+    while len(_lru) > LRU_MAX_ENTRIES:
+        _lru.popitem(last=False)
+
+
+async def get(key: str, agent: str) -> Optional[str]:
+    """Look up a cached response: memory first, then MongoDB (promoting hits to memory)."""
+    if not CACHE_ENABLED:
+        return None
+    value = _lru_get(key)
+    if value is not None:
+        _stats["memory_hits"] += 1
+        return value
+    if _db is not None:
+        try:
+            doc = await _db.llm_cache.find_one(
+                {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                {"_id": 0, "response": 1, "expires_at": 1}
+            )
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+            doc = None
+        if doc:
+            _stats["db_hits"] += 1
+            expires_at = doc["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            remaining = int((expires_at - datetime.now(timezone.utc)).total_seconds())
+            _lru_put(key, doc["response"], max(remaining, 1))
+            return doc["response"]
+    _stats["misses"] += 1
+    return None
+
+
+async def put(key: str, agent: str, model: str, response: str):
+    """Store a response in both tiers with the agent's TTL."""
+    if not CACHE_ENABLED or not response:
+        return
+    ttl = ttl_for(agent)
+    _lru_put(key, response, ttl)
+    _stats["stores"] += 1
+    if _db is None:
+        return
+    now = datetime.now(timezone.utc)
+    try:
+        await _db.llm_cache.update_one({"key": key}, {"$set": {
+            "key": key, "agent": agent, "model": model, "response": response,
+            "created_at": now.isoformat(), "expires_at": now + timedelta(seconds=ttl)
+        }}, upsert=True)
+    except Exception as e:
+        logger.warning(f"LLM cache store failed: {e}")
+
+
+def record_bypass():
+    _stats["bypassed"] += 1
+
+
+def get_stats() -> dict:
+    hits = _stats["memory_hits"] + _stats["db_hits"]
+    lookups = hits + _stats["misses"]
+    return {
+        **_stats,
+        "hits": hits,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "memory_entries": len(_lru),
+        "enabled": CACHE_ENABLED,
+        "agent_ttls": {**AGENT_TTLS, "default": DEFAULT_TTL_SECONDS},
+    }
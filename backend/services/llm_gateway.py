@@ -0,0 +1,228 @@
+"""LLM Gateway - Process-wide admission control for every model call (agents, OCR, guide parsing, orchestrator)"""
+import os
+import time
+import uuid
+import heapq
+import hashlib
+import asyncio
+import itertools
+import logging
+from typing import AsyncIterator
+from collections import deque
+from emergentintegrations.llm.chat import LlmChat
+from services import llm_backends
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first when a provider is saturated
+PRIORITY_INTERACTIVE = 0   # navigator / chat the user is waiting on
+PRIORITY_DEFAULT = 5       # agent reports, drafts, orchestrator
+PRIORITY_BATCH = 10        # OCR, guide parsing
+
+DEFAULT_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+DEADLINES = {
+    PRIORITY_INTERACTIVE: float(os.environ.get("LLM_DEADLINE_INTERACTIVE", "60")),
+    PRIORITY_DEFAULT: float(os.environ.get("LLM_DEADLINE_DEFAULT", "180")),
+    PRIORITY_BATCH: float(os.environ.get("LLM_DEADLINE_BATCH", "300")),
+}
+WAIT_SAMPLES = 500
+
+
+class LlmDeadlineExceeded(Exception):
+    """Raised when a request cannot be admitted or completed within its deadline."""
+
+
+# Provider answers worth retrying later: rate limited, overloaded or briefly unavailable
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504, 529}
+_TRANSIENT_MARKERS = ("rate limit", "rate_limit", "ratelimit", "too many requests", "overloaded", "timeout", "timed out",
+                      "temporarily unavailable", "service unavailable", "connection")
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failed model call may succeed if retried (queue deadline, timeout, 429/5xx, dropped connection)."""
+    if isinstance(exc, (LlmDeadlineExceeded, asyncio.TimeoutError, ConnectionError, llm_backends.FakeLlmError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS
+    message = f"{type(exc).__name__}: {exc}".lower()
+    return any(marker in message for marker in _TRANSIENT_MARKERS) or any(f" {code}" in message for code in ("429", "503", "502", "504"))
+
+
+class _PrioritySemaphore:
+    """Semaphore whose waiters are woken lowest-priority-value first, FIFO within a priority."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int, timeout: float):
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except BaseException:
+            # A slot may have been handed over just as we timed out or got cancelled
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)  # hand the slot over; active count unchanged
+                return
+        self.active -= 1
+
+
+class _ProviderGate:
+    def __init__(self, provider: str, limit: int):
+        self.provider = provider
+        self.sem = _PrioritySemaphore(limit)
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.deadline_exceeded = 0
+        self.usage_reports = 0   # calls whose client returned usage (the Emergent client returns text only)
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def snapshot(self) -> dict:
+        waits = sorted(self.waits)
+        p = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 1) if waits else 0.0
+        return {
+            "limit": self.sem.limit, "in_flight": self.sem.active, "queue_depth": self.sem.queued,
+            "requests": self.requests, "completed": self.completed, "failed": self.failed,
+            "deadline_exceeded": self.deadline_exceeded,
+            # None when no client reported usage: nothing is known about provider-side cache hits
+            "prompt_cache": {"calls": self.usage_reports, "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens,
+                             "hit_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0} if self.usage_reports else None,
+            "wait_ms": {"p50": p(0.5), "p95": p(0.95), "max": round(waits[-1] * 1000, 1) if waits else 0.0},
+        }
+
+
+_gates = {}
+
+
+def _gate(provider: str) -> _ProviderGate:
+    if provider not in _gates:
+        limit = int(os.environ.get(f"LLM_MAX_CONCURRENCY_{provider.upper()}", DEFAULT_CONCURRENCY))
+        _gates[provider] = _ProviderGate(provider, limit)
+    return _gates[provider]
+
+
+def prompt_cache_key(system_message: str, provider: str, model: str) -> str:
+    """Routing hint: requests with the same system prompt and model share a key, so the provider can
+    send them to the replica holding their cached prefix. Carries no conversation state."""
+    return "gf-" + hashlib.sha256(f"{provider}/{model}\x00{system_message}".encode("utf-8")).hexdigest()[:24]
+
+
+def new_chat(system_message: str, provider: str = "openai", model: str = "gpt-5.2") -> LlmChat:
+    """Chat client from the configured backend (LLM_BACKEND=emergent | fake). Every request gets its
+    own session: the session id names a conversation, so sharing one would share its history."""
+    chat_cls = llm_backends.chat_class()
+    chat = chat_cls(api_key=os.environ.get("EMERGENT_LLM_KEY", ""), session_id=str(uuid.uuid4()), system_message=system_message)
+    chat.with_model(provider, model)
+    if provider == "openai" and callable(getattr(chat, "with_params", None)):
+        chat.with_params(prompt_cache_key=prompt_cache_key(system_message, provider, model))
+    return chat
+
+
+async def _admit(gate: _ProviderGate, priority: int, deadline: float) -> float:
+    """Wait for a slot under the provider's limit; returns the seconds spent queueing."""
+    gate.requests += 1
+    started = time.monotonic()
+    try:
+        await gate.sem.acquire(priority, deadline)
+    except asyncio.TimeoutError:
+        gate.deadline_exceeded += 1
+        logger.warning(f"LLM gateway: {gate.provider} request not admitted within {deadline:.0f}s (queue={gate.sem.queued})")
+        raise LlmDeadlineExceeded(f"Coada LLM ({gate.provider}) plină - încercați din nou")
+    waited = time.monotonic() - started
+    gate.waits.append(waited)
+    return waited
+
+
+async def send(chat: LlmChat, message, provider: str = "openai", priority: int = PRIORITY_DEFAULT, deadline: float = None) -> str:
+    """Admit the request under the provider's concurrency limit, then send it.
+    The deadline covers queueing and the call itself; exceeding it raises LlmDeadlineExceeded."""
+    gate = _gate(provider)
+    deadline = deadline or DEADLINES.get(priority, DEADLINES[PRIORITY_DEFAULT])
+    waited = await _admit(gate, priority, deadline)
+    try:
+        response = await asyncio.wait_for(chat.send_message(message), timeout=max(deadline - waited, 1))
+        gate.completed += 1
+        _record_usage(gate, chat, response)
+        return response
+    except asyncio.TimeoutError:
+        gate.deadline_exceeded += 1
+        raise LlmDeadlineExceeded(f"Răspunsul LLM ({provider}) a depășit {deadline:.0f}s")
+    except Exception:
+        gate.failed += 1
+        raise
+    finally:
+        gate.sem.release()
+
+
+async def stream(chat, message, provider: str = "openai", priority: int = PRIORITY_DEFAULT, deadline: float = None) -> AsyncIterator[str]:
+    """Streaming form of send() for clients with stream_message() (see llm_backends.can_stream):
+    same admission and deadline, chunks are yielded as the provider emits them. The slot is held
+    until the stream ends or the consumer stops reading."""
+    gate = _gate(provider)
+    deadline = deadline or DEADLINES.get(priority, DEADLINES[PRIORITY_DEFAULT])
+    started = time.monotonic()
+    await _admit(gate, priority, deadline)
+    try:
+        chunks = chat.stream_message(message).__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - (time.monotonic() - started), 1))
+            except StopAsyncIteration:
+                break
+            yield chunk
+        gate.completed += 1
+        _record_usage(gate, chat, None)
+    except asyncio.TimeoutError:
+        gate.deadline_exceeded += 1
+        raise LlmDeadlineExceeded(f"Răspunsul LLM ({provider}) a depășit {deadline:.0f}s")
+    except Exception:
+        gate.failed += 1
+        raise
+    finally:
+        gate.sem.release()
+
+
+def _field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _record_usage(gate: _ProviderGate, chat, response):
+    """Log provider prompt-cache hits when the client exposes usage (OpenAI prompt_tokens_details.cached_tokens,
+    Anthropic cache_read_input_tokens). The Emergent LlmChat returns plain text, so in production this only
+    records anything for clients that set last_usage (the fake backend)."""
+    usage = _field(response, "usage") or getattr(chat, "last_usage", None)
+    if not usage:
+        return
+    prompt_tokens = _field(usage, "prompt_tokens") or _field(usage, "input_tokens") or 0
+    details = _field(usage, "prompt_tokens_details")
+    cached = (_field(details, "cached_tokens") if details else None) or _field(usage, "cache_read_input_tokens") or 0
+    gate.usage_reports += 1
+    gate.prompt_tokens += prompt_tokens
+    gate.cached_tokens += cached
+    if cached:
+        logger.info(f"LLM prompt cache: {gate.provider} served {cached}/{prompt_tokens} prompt tokens from cache")
+
+
+def get_stats() -> dict:
+    return {provider: gate.snapshot() for provider, gate in _gates.items()}
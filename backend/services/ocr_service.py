@@ -3,20 +3,62 @@ import os
 import uuid
 import json
 import base64
+import asyncio
+import hashlib
 import logging
 from datetime import datetime, timezone
 from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContent
+from services import llm_gateway, pdf_text, audit_sink
 
 logger = logging.getLogger(__name__)
 
+# Text-layer characters sent to the model per document (born-digital PDFs); longer documents go to Vision whole
+PDF_TEXT_MAX_CHARS = int(os.environ.get("PDF_TEXT_MAX_CHARS", "40000"))
+
 def _get_vision_chat(system_message: str) -> LlmChat:
-    chat = LlmChat(
-        api_key=os.environ["EMERGENT_LLM_KEY"],
-        session_id=str(uuid.uuid4()),
-        system_message=system_message
-    )
-    chat.with_model("openai", "gpt-5.2")
-    return chat
+    return llm_gateway.new_chat(system_message, "openai", "gpt-5.2")
+
+
+async def build_document_message(prompt: str, file_bytes: bytes, content_type: str, text_limit: int = 8000, analysis: dict = None) -> tuple:
+    """Build the model message for a document file.
+
+    PDFs go through the local text layer first: born-digital pages are sent as text and only
+    scanned pages are attached (as a smaller PDF) for Vision. Returns (message, page_stats, engine);
+    page_stats is None for non-PDF files or when the PDF cannot be read locally. Callers that
+    already ran pdf_text.analyse_pdf() can pass its result as `analysis`.
+    """
+    stats = None
+    if content_type == "application/pdf" and pdf_text.available():
+        if analysis is None:
+            try:
+                analysis = await asyncio.to_thread(pdf_text.analyse_pdf, file_bytes)
+            except Exception as e:
+                logger.warning(f"PDF text layer unreadable, sending whole file to Vision: {e}")
+        if analysis:
+            stats = pdf_text.page_stats(analysis, PDF_TEXT_MAX_CHARS)
+            if stats["text_over_budget"]:
+                # Cutting the text would silently drop pages: the whole file goes to Vision instead
+                logger.warning(f"PDF text layer ({stats['text_chars']} chars) over PDF_TEXT_MAX_CHARS={PDF_TEXT_MAX_CHARS}, sending whole file to Vision")
+        if analysis and analysis["text_pages"] and not stats["text_over_budget"]:
+            text = f"{prompt}\n\nCONȚINUT DOCUMENT (text extras din PDF):\n{analysis['text']}"
+            if not analysis["scanned_pages"]:
+                return UserMessage(text=text), stats, "PDF text layer + GPT-5.2"
+            scanned = await asyncio.to_thread(pdf_text.extract_pages, file_bytes, analysis["scanned_pages"])
+            text += f"\n\nPaginile scanate ({', '.join(str(n) for n in analysis['scanned_pages'])}) sunt atașate separat."
+            attachment = FileContent(content_type=content_type, file_content_base64=base64.b64encode(scanned).decode("utf-8"))
+            return UserMessage(text=text, file_contents=[attachment]), stats, "PDF text layer + GPT-5.2 Vision"
+
+    if content_type in ["image/jpeg", "image/png", "application/pdf"]:
+        # Image/scanned PDF: send as file attachment
+        attachment = FileContent(content_type=content_type, file_content_base64=base64.b64encode(file_bytes).decode("utf-8"))
+        return UserMessage(text=prompt, file_contents=[attachment]), stats, "GPT-5.2 Vision"
+
+    # Text/other: read content and send as text
+    try:
+        text_content = file_bytes.decode("utf-8", errors="replace")
+    except Exception:
+        text_content = file_bytes.decode("latin-1", errors="replace")
+    return UserMessage(text=f"{prompt}\n\nCONȚINUT DOCUMENT:\n{text_content[:text_limit]}"), stats, "GPT-5.2 Vision"
 
 
 ONRC_PROMPT = """Analizează acest document ONRC / Certificat Constatator al unei firme din România.
@@ -135,8 +177,40 @@ PROMPT_MAP = {
 }
 
 
-async def process_ocr(doc_id: str, doc_type: str, filename: str, db, file_path: str = None) -> dict:
-    """Process a document using GPT-5.2 Vision for real OCR extraction."""
+async def _cached_ocr(db, content_hash: str, doc_type: str):
+    try:
+        return await db.ocr_cache.find_one_and_update(
+            {"content_hash": content_hash, "doc_type": doc_type},
+            {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0}
+        )
+    except Exception as e:
+        logger.warning(f"OCR cache lookup failed: {e}")
+        return None
+
+
+async def _store_ocr(db, content_hash: str, doc_type: str, ocr_result: dict):
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        await db.ocr_cache.update_one({"content_hash": content_hash, "doc_type": doc_type}, {
+            "$set": {
+                "extracted_fields": ocr_result["extracted_fields"],
+                "field_confidences": ocr_result["field_confidences"],
+                "overall_confidence": ocr_result["overall_confidence"],
+                "engine": ocr_result.get("engine"), "page_stats": ocr_result.get("page_stats"),
+                "source_doc_id": ocr_result["doc_id"], "updated_at": now
+            },
+            "$setOnInsert": {"content_hash": content_hash, "doc_type": doc_type, "hits": 0, "created_at": now}
+        }, upsert=True)
+    except Exception as e:
+        logger.warning(f"OCR cache store failed: {e}")
+
+
+async def process_ocr(doc_id: str, doc_type: str, filename: str, db, file_path: str = None, force_refresh: bool = False) -> dict:
+    """Process a document using GPT-5.2 Vision for real OCR extraction.
+
+    Results are shared by content: an identical file (SHA-256) of the same doc_type reuses the
+    stored extracted_fields, including human corrections, unless force_refresh is set."""
     logger.info(f"OCR processing: doc_id={doc_id}, type={doc_type}, file={filename}")
 
     # Find the actual file
@@ -157,10 +231,35 @@ async def process_ocr(doc_id: str, doc_type: str, filename: str, db, file_path:
         logger.warning(f"File not found for {doc_id}, using fallback extraction")
         return _fallback_result(doc_id, doc_type)
 
-    # Read and encode file
+    # Read file
     with open(file_path, "rb") as f:
         file_bytes = f.read()
-    file_b64 = base64.b64encode(file_bytes).decode("utf-8")
+    content_hash = hashlib.sha256(file_bytes).hexdigest()
+
+    cached = None if force_refresh else await _cached_ocr(db, content_hash, doc_type)
+    if cached:
+        ocr_result = {
+            "id": str(uuid.uuid4()),
+            "doc_id": doc_id,
+            "status": "completed",
+            "overall_confidence": cached.get("overall_confidence", 0.95),
+            "extracted_fields": cached.get("extracted_fields", {}),
+            "field_confidences": cached.get("field_confidences", {}),
+            "low_confidence_fields": [],
+            "needs_human_review": False,
+            "processing_time_ms": 0,
+            "engine": cached.get("engine"),
+            "page_stats": cached.get("page_stats"),
+            "content_hash": content_hash,
+            "doc_type": doc_type,
+            "cache_hit": True,
+            "processed_at": datetime.now(timezone.utc).isoformat()
+        }
+        await db.documents.update_one({"id": doc_id}, {"$set": {
+            "ocr_status": ocr_result["status"], "ocr_data": ocr_result, "updated_at": datetime.now(timezone.utc).isoformat()
+        }})
+        logger.info(f"OCR cache hit: doc_id={doc_id}, type={doc_type}, hash={content_hash[:12]}")
+        return ocr_result
 
     # Determine content type
     ext = os.path.splitext(file_path)[1].lower()
@@ -172,22 +271,9 @@ async def process_ocr(doc_id: str, doc_type: str, filename: str, db, file_path:
 
     try:
         chat = _get_vision_chat("Ești un expert OCR specializat pe documente oficiale românești. Extragi date structurate din imagini/PDF-uri.")
+        message, page_stats, engine = await build_document_message(prompt, file_bytes, content_type)
 
-        if content_type in ["image/jpeg", "image/png", "application/pdf"]:
-            # Image/PDF: send as file attachment
-            message = UserMessage(
-                text=prompt,
-                file_contents=[FileContent(content_type=content_type, file_content_base64=file_b64)]
-            )
-        else:
-            # Text/other: read content and send as text
-            try:
-                text_content = file_bytes.decode("utf-8", errors="replace")
-            except Exception:
-                text_content = file_bytes.decode("latin-1", errors="replace")
-            message = UserMessage(text=f"{prompt}\n\nCONȚINUT DOCUMENT:\n{text_content[:8000]}")
-
-        response = await chat.send_message(message)
+        response = await llm_gateway.send(chat, message, "openai", llm_gateway.PRIORITY_BATCH)
 
         # Parse JSON from response
         extracted = _parse_json_response(response)
@@ -203,19 +289,27 @@ async def process_ocr(doc_id: str, doc_type: str, filename: str, db, file_path:
                 "low_confidence_fields": [],
                 "needs_human_review": False,
                 "processing_time_ms": 0,
-                "engine": "GPT-5.2 Vision",
+                "engine": engine,
+                "page_stats": page_stats,
+                "content_hash": content_hash,
+                "doc_type": doc_type,
+                "cache_hit": False,
                 "processed_at": datetime.now(timezone.utc).isoformat()
             }
         else:
             logger.warning(f"Could not parse JSON from GPT response for {doc_id}")
             ocr_result = _fallback_result(doc_id, doc_type)
             ocr_result["raw_response"] = response[:500]
+            ocr_result["page_stats"] = page_stats
 
     except Exception as e:
         logger.error(f"GPT Vision OCR failed for {doc_id}: {e}")
         ocr_result = _fallback_result(doc_id, doc_type)
         ocr_result["error"] = str(e)
 
+    if ocr_result["status"] == "completed":
+        await _store_ocr(db, content_hash, doc_type, ocr_result)
+
     # Update document in DB
     await db.documents.update_one({"id": doc_id}, {
         "$set": {
@@ -293,7 +387,16 @@ async def correct_ocr_field(doc_id: str, field_name: str, corrected_value: str,
         "$set": {"ocr_data": ocr_data, "updated_at": datetime.now(timezone.utc).isoformat()}
     })
 
-    await db.audit_log.insert_one({
+    # Propagate to the shared cache entry so later uploads of the same file get the corrected value
+    if ocr_data.get("content_hash") and not any(c in field_name for c in ".$"):
+        await db.ocr_cache.update_one(
+            {"content_hash": ocr_data["content_hash"], "doc_type": ocr_data.get("doc_type", doc.get("tip"))},
+            {"$set": {f"extracted_fields.{field_name}": corrected_value, f"field_confidences.{field_name}": 1.0,
+                      "updated_at": datetime.now(timezone.utc).isoformat()},
+             "$push": {"corrections": {"field": field_name, "value": corrected_value, "by": user_id, "at": datetime.now(timezone.utc).isoformat()}}}
+        )
+
+    await audit_sink.audit({
         "id": str(uuid.uuid4()),
         "action": "ocr.field_corrected",
         "entity_type": "document",
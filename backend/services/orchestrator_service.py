@@ -1,44 +1,56 @@
 """Orchestrator Agent - Coordinates all AI agents for Application (Dosar) workflow"""
-import os
 import uuid
 import logging
 from datetime import datetime, timezone
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from services import llm_gateway, job_queue, application_store, audit_sink
+from services.context_builder import bump_context_version
 
 logger = logging.getLogger(__name__)
 
+_db = None
+
+
+def set_db(database):
+    global _db
+    _db = database
+
 MARKDOWN_INSTRUCTION = (
     "\n\nRăspunde ÎNTOTDEAUNA în Markdown structurat cu ## headings, **bold**, liste, > blockquote."
     "\nLimba: română."
 )
 
 def _get_chat(system_message: str) -> LlmChat:
-    chat = LlmChat(
-        api_key=os.environ["EMERGENT_LLM_KEY"],
-        session_id=str(uuid.uuid4()),
-        system_message=system_message + MARKDOWN_INSTRUCTION
-    )
-    chat.with_model("openai", "gpt-5.2")
-    return chat
+    return llm_gateway.new_chat(system_message + MARKDOWN_INSTRUCTION, "openai", "gpt-5.2")
+
 
+NARRATIVE_JOB = "orchestrator_narrative"
 
-async def run_orchestrator_check(app: dict, org: dict, db, user_id: str = None) -> dict:
-    """Analyze application state and determine what each agent should do next."""
 
-    # Load custom rules for all agents
-    all_rules = {}
-    async for rule_doc in db.agent_rules.find({}, {"_id": 0}):
-        aid = rule_doc.get("agent_id")
-        all_rules.setdefault(aid, []).extend(rule_doc.get("reguli", []))
+async def _load_rules(db, user_id: str) -> dict:
+    """Custom rules of the requesting user, grouped per agent."""
+    rules = {}
+    if not user_id:
+        return rules
+    async for rule_doc in db.agent_rules.find({"user_id": user_id}, {"_id": 0, "agent_id": 1, "reguli": 1}):
+        rules.setdefault(rule_doc.get("agent_id"), []).extend(rule_doc.get("reguli", []))
+    return rules
 
-    orchestrator_rules = all_rules.get("orchestrator", [])
-    extra_rules = "\n".join(orchestrator_rules)
 
-    guide_assets = app.get("guide_assets", [])
-    req_docs = app.get("required_documents", [])
-    docs = app.get("documents", [])
-    drafts = app.get("drafts", [])
-    status = app.get("status", "draft")
+async def _report_counts(db, app_id: str) -> dict:
+    """Validation and evaluation report counts in one aggregation."""
+    counts = {"validation": 0, "evaluation": 0}
+    async for row in db.compliance_reports.aggregate([
+        {"$match": {"application_id": app_id, "type": {"$in": list(counts)}}},
+        {"$group": {"_id": "$type", "n": {"$sum": 1}}},
+    ]):
+        counts[row["_id"]] = row["n"]
+    return counts
+
+
+def _deterministic_checks(app: dict, org: dict, report_counts: dict, req_docs: list, part_counts: dict) -> list:
+    guide_count = part_counts["guide_assets"]
+    draft_count = part_counts["drafts"]
 
     checks = []
 
@@ -48,8 +60,8 @@ async def run_orchestrator_check(app: dict, org: dict, db, user_id: str = None)
                     "issues": [] if has_call else ["Sesiune de finanțare neselectată"]})
 
     # 2. Guide uploaded?
-    checks.append({"agent": "Ghid & Anexe", "status": "ok" if len(guide_assets) > 0 else "actiune_necesara",
-                    "issues": [] if guide_assets else ["Ghidul solicitantului nu este încărcat"]})
+    checks.append({"agent": "Ghid & Anexe", "status": "ok" if guide_count > 0 else "actiune_necesara",
+                    "issues": [] if guide_count else ["Ghidul solicitantului nu este încărcat"]})
 
     # 3. Checklist defined?
     frozen = app.get("checklist_frozen", False)
@@ -71,87 +83,139 @@ async def run_orchestrator_check(app: dict, org: dict, db, user_id: str = None)
                     "issues": [f"{len(missing_docs)} documente lipsă din {len(req_docs)} cerute ({doc_pct:.0f}% complet)"] if missing_docs else []})
 
     # 6. Redactor - drafts generated?
-    checks.append({"agent": "Redactor", "status": "ok" if len(drafts) >= 2 else "actiune_necesara",
-                    "issues": [f"Doar {len(drafts)} drafturi generate (recomandat: Cerere finanțare, Plan afaceri, Declarații)"] if len(drafts) < 2 else []})
+    checks.append({"agent": "Redactor", "status": "ok" if draft_count >= 2 else "actiune_necesara",
+                    "issues": [f"Doar {draft_count} drafturi generate (recomandat: Cerere finanțare, Plan afaceri, Declarații)"] if draft_count < 2 else []})
 
     # 7. Validator
-    val_reports = await db.compliance_reports.count_documents({"application_id": app["id"], "type": "validation"})
+    val_reports = report_counts.get("validation", 0)
     checks.append({"agent": "Validator", "status": "ok" if val_reports > 0 else "actiune_necesara",
                     "issues": ["Validare coerență neefectuată"] if val_reports == 0 else []})
 
     # 8. Eligibilitate
-    elig_reports = await db.compliance_reports.count_documents({"application_id": app["id"], "type": "evaluation"})
+    elig_reports = report_counts.get("evaluation", 0)
     checks.append({"agent": "Eligibilitate", "status": "ok" if elig_reports > 0 else "actiune_necesara",
                     "issues": ["Evaluare eligibilitate neefectuată"] if elig_reports == 0 else []})
 
-    all_issues = []
-    for c in checks: all_issues.extend(c.get("issues", []))
-    needs_action = any(c["status"] == "actiune_necesara" for c in checks)
+    return checks
+
 
-    # AI analysis
-    # Include all agent custom rules in orchestrator prompt
+def _narrative_request(app: dict, org: dict, checks: list, all_rules: dict, part_counts: dict) -> tuple:
+    extra_rules = "\n".join(all_rules.get("orchestrator", []))
+
+    # Include all agent custom rules in orchestrator prompt (sorted: same rules -> same prompt prefix)
     rules_section = ""
-    if all_rules:
-        rules_parts = []
-        for agent_name, agent_rules in all_rules.items():
-            if agent_rules:
-                rules_parts.append(f"**{agent_name}**: {'; '.join(agent_rules)}")
-        if rules_parts:
-            rules_section = "\n\n## Reguli custom active per agent:\n" + "\n".join(rules_parts)
-
-    chat = _get_chat(
+    rules_parts = [f"**{agent_name}**: {'; '.join(agent_rules)}" for agent_name, agent_rules in sorted(all_rules.items()) if agent_rules]
+    if rules_parts:
+        rules_section = "\n## Reguli custom active per agent:\n" + "\n".join(rules_parts) + "\n"
+
+    system_message = (
         "Ești Orchestratorul GrantFlow. Analizezi starea completă a unui dosar de finanțare "
         "și determini acțiunile prioritare per agent. Ții cont de regulile custom setate pentru fiecare agent. "
         "Oferă un raport structurat cu pași concreți."
         + (f"\nReguli orchestrator: {extra_rules}" if extra_rules else "")
     )
+    # Stable facts (firm, session, rules) first so repeat checks share a cached prefix; current state last
     prompt = (
-        f"**Dosar:** {app.get('title')} | Status: **{app.get('status_label')}**\n"
         f"**Firmă:** {org.get('denumire')} (CUI: {org.get('cui')})\n"
-        f"**Sesiune:** {app.get('call_name')} ({app.get('program_name')})\n\n"
-        f"**Stare agenți:**\n"
+        f"**Sesiune:** {app.get('call_name')} ({app.get('program_name')})\n"
+        f"**Dosar:** {app.get('title')}\n"
     )
+    prompt += rules_section
+    prompt += f"\n**Status:** **{app.get('status_label')}**\n\n**Stare agenți:**\n"
     for c in checks:
         icon = "OK" if c["status"] == "ok" else "ACȚIUNE" if c["status"] == "actiune_necesara" else "ATENȚIE"
         prompt += f"- **{c['agent']}**: {icon} {', '.join(c['issues']) if c['issues'] else 'în regulă'}\n"
-    prompt += f"\nGhid: {len(guide_assets)} fișiere | Documente: {len(docs)}/{len(req_docs)} | Drafturi: {len(drafts)}\n"
-    prompt += rules_section
+    prompt += f"\nGhid: {part_counts['guide_assets']} fișiere | Documente: {part_counts['documents']}/{part_counts['required_documents']} | Drafturi: {part_counts['drafts']}\n"
     prompt += "\nOferă raport cu prioritizare și pași concreți. Menționează regulile custom relevante."
+    return system_message, prompt
+
+
+NARRATIVE_ERROR = "Eroare la generarea analizei."
+
+
+async def _narrate(system_message: str, prompt: str) -> str:
+    return await llm_gateway.send(_get_chat(system_message), UserMessage(text=prompt), "openai", llm_gateway.PRIORITY_DEFAULT)
 
-    try:
-        ai_response = await chat.send_message(UserMessage(text=prompt))
-    except Exception as e:
-        logger.error(f"Orchestrator AI failed: {e}")
-        ai_response = "Eroare la generarea analizei."
+
+async def run_orchestrator_check(app: dict, org: dict, db, user_id: str = None, mode: str = "full") -> dict:
+    """Analyze application state and determine what each agent should do next.
+
+    mode="full" waits for the AI narrative. mode="fast" returns the deterministic checks right away
+    and queues the narrative; it is attached to the stored check (orchestrator_checks) when ready.
+    """
+    all_rules = await _load_rules(db, user_id)
+    part_counts = await application_store.counts(db, app["id"], ("guide_assets", "documents", "required_documents", "drafts"))
+    req_docs = await application_store.list_items(db, app["id"], "required_documents", projection={"_id": 0, "status": 1})
+    checks = _deterministic_checks(app, org, await _report_counts(db, app["id"]), req_docs, part_counts)
+
+    all_issues = []
+    for c in checks: all_issues.extend(c.get("issues", []))
+    needs_action = any(c["status"] == "actiune_necesara" for c in checks)
 
     result = {
         "id": str(uuid.uuid4()),
         "application_id": app["id"],
+        "mode": mode,
         "checks": checks,
         "needs_action": needs_action,
         "total_issues": len(all_issues),
-        "ai_analysis": ai_response,
+        "ai_analysis": None,
+        "ai_status": "pending",
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
-    await db.agent_runs.insert_one({
+    system_message, prompt = _narrative_request(app, org, checks, all_rules, part_counts)
+    if mode == "fast":
+        await db.orchestrator_checks.insert_one({**result, "user_id": user_id})
+        job = await job_queue.enqueue(NARRATIVE_JOB, {"check_id": result["id"], "system_message": system_message, "prompt": prompt},
+                                      user_id=user_id, entity_id=app["id"])
+        result["job_id"] = job["id"]
+    else:
+        try:
+            result["ai_analysis"] = await _narrate(system_message, prompt)
+            result["ai_status"] = "completed"
+        except Exception as e:
+            logger.error(f"Orchestrator AI failed: {e}")
+            result["ai_analysis"] = NARRATIVE_ERROR
+            result["ai_status"] = "failed"
+        await db.orchestrator_checks.insert_one({**result, "user_id": user_id})
+    result.pop("_id", None)
+
+    await audit_sink.agent_run({
         "id": str(uuid.uuid4()), "agent_id": "orchestrator",
         "application_id": app["id"], "action": "orchestrator_check",
-        "applied_rules": (custom_rules.get("reguli", []) if custom_rules else []),
-        "output": {"needs_action": needs_action, "total_issues": len(all_issues)},
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "applied_rules": all_rules.get("orchestrator", []),
+        "output": {"needs_action": needs_action, "total_issues": len(all_issues), "mode": mode},
+        "timestamp": datetime.now(timezone.utc).isoformat(), "user_id": user_id
     })
 
-    await db.audit_log.insert_one({
+    await audit_sink.audit({
         "id": str(uuid.uuid4()), "action": "orchestrator.check",
         "entity_type": "application", "entity_id": app["id"],
-        "user_id": "system", "details": {"needs_action": needs_action, "issues": len(all_issues)},
+        "user_id": "system", "details": {"needs_action": needs_action, "issues": len(all_issues), "mode": mode},
         "timestamp": datetime.now(timezone.utc).isoformat()
     })
 
     return result
 
 
+async def process_narrative(payload: dict, progress) -> dict:
+    """Job handler for fast-mode checks: write the AI narrative onto the stored check."""
+    await progress.update(10, "generating")
+    try:
+        ai_response, ai_status = await _narrate(payload["system_message"], payload["prompt"]), "completed"
+    except Exception as e:
+        # Transient failures go back to the queue; the check is marked failed only on the last attempt
+        if llm_gateway.is_transient(e) and not progress.final_attempt:
+            raise
+        logger.error(f"Orchestrator AI failed: {e}")
+        ai_response, ai_status = NARRATIVE_ERROR, "failed"
+    await _db.orchestrator_checks.update_one({"id": payload["check_id"]}, {"$set": {
+        "ai_analysis": ai_response, "ai_status": ai_status, "ai_completed_at": datetime.now(timezone.utc).isoformat()
+    }})
+    return {"check_id": payload["check_id"], "ai_status": ai_status}
+
+
 async def auto_process_upload(doc_id, doc_type, filename, org_id, project_id, db):
     """Auto-process uploaded document."""
     from services.ocr_service import process_ocr
@@ -161,12 +225,14 @@ async def auto_process_upload(doc_id, doc_type, filename, org_id, project_id, db
         fields = ocr_result["extracted_fields"]
         if doc_type in ["bilant", "balanta"] and org_id:
             await db.organizations.update_one({"id": org_id}, {"$set": {"date_financiare_ocr": fields, "updated_at": datetime.now(timezone.utc).isoformat()}})
+            await bump_context_version(db, company_id=org_id)
             actions.append("Date financiare extrase")
         if doc_type == "factura" and project_id:
             try:
                 total = float(str(fields.get("total", "0")).replace(",", ".").replace(" ", ""))
                 if total > 0:
                     await db.applications.update_one({"id": project_id}, {"$inc": {"expenses_total": total}})
+                    await bump_context_version(db, app_id=project_id)
                     actions.append(f"Cheltuială {total} RON detectată")
             except (ValueError, TypeError): pass
     return {"ocr_result": ocr_result, "actions_taken": actions, "auto_processed": True}
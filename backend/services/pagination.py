@@ -0,0 +1,59 @@
+"""Pagination - Keyset pagination on (created_at, id) with opaque cursors
+
+A page is the next `limit` documents after the cursor in (field desc, id desc) order, so every page
+costs one index range scan no matter how deep the client has paged. The cursor for the following
+page goes out in the X-Next-Cursor response header; list bodies keep their plain array shape.
+"""
+import os
+import json
+import base64
+
+NEXT_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = int(os.environ.get("PAGE_SIZE_MAX", "500"))
+
+
+class InvalidCursor(ValueError):
+    """Cursor that is malformed or was issued by a list sorted on another field."""
+
+
+def encode_cursor(field: str, value, item_id: str) -> str:
+    raw = json.dumps([field, value, item_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, field: str) -> tuple:
+    try:
+        cursor_field, value, item_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise InvalidCursor("Cursor invalid")
+    if cursor_field != field or not isinstance(item_id, str):
+        raise InvalidCursor("Cursor invalid pentru această listă")
+    return value, item_id
+
+
+def _after(field: str, value, item_id: str) -> dict:
+    """Everything strictly after (value, item_id) in descending order. Documents without the field
+    sort last, so they follow every valued page."""
+    if value is None:
+        return {field: None, "id": {"$lt": item_id}}
+    return {"$or": [{field: {"$lt": value}}, {field: value, "id": {"$lt": item_id}}, {field: None}]}
+
+
+async def page(coll, query: dict, projection: dict = None, cursor: str = None, limit: int = 100, field: str = "created_at") -> tuple:
+    """One page of coll matching query, newest first. Returns (items, next_cursor or None)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    projection = dict(projection or {"_id": 0})
+    if any(v == 1 for v in projection.values()):
+        projection.update({field: 1, "id": 1})
+    if cursor:
+        query = {"$and": [query, _after(field, *decode_cursor(cursor, field))]}
+    items = await coll.find(query, projection).sort([(field, -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(field, items[-1].get(field), items[-1]["id"])
+
+
+def set_next(response, next_cursor: str):
+    if next_cursor:
+        response.headers[NEXT_HEADER] = next_cursor
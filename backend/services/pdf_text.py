@@ -0,0 +1,84 @@
+"""PDF Text Layer - Local page-by-page text extraction and quality scoring ahead of Vision OCR"""
+import io
+import os
+import re
+import logging
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # fast path disabled: every PDF goes to Vision as before
+    PdfReader = PdfWriter = None
+
+logger = logging.getLogger(__name__)
+
+# A page counts as born-digital when its text layer has at least this many characters of this quality
+MIN_PAGE_CHARS = int(os.environ.get("PDF_TEXT_MIN_CHARS", "40"))
+MIN_PAGE_QUALITY = float(os.environ.get("PDF_TEXT_MIN_QUALITY", "0.75"))
+
+_CID_RE = re.compile(r"\(cid:\d+\)")
+
+
+def available() -> bool:
+    return PdfReader is not None
+
+
+def page_quality(text: str) -> float:
+    """Share of readable characters. Unmapped glyphs ((cid:N), U+FFFD) and control characters
+    (typical of broken font encodings or an OCR layer gone wrong) count against it."""
+    if not text:
+        return 0.0
+    total = len(text)
+    readable = sum(1 for ch in text if ch.isalnum() or ch.isspace() or ch in ".,;:!?%()[]-–—/\"'„”«»+*=&@#€$")
+    broken = text.count("�") + sum(len(m) for m in _CID_RE.findall(text))
+    broken += sum(1 for ch in text if ord(ch) < 32 and ch not in "\n\r\t")
+    return round(max(0.0, (readable - broken) / total), 3)
+
+
+def analyse_pdf(file_bytes: bytes) -> dict:
+    """Extract the text layer page by page and split pages into text-layer vs. scanned.
+
+    Returns {"pages": [{"page", "chars", "quality", "path"}], "text_pages": [...], "scanned_pages": [...],
+    "text": str (text-layer pages only, with page markers)}. Raises on unreadable PDFs.
+    """
+    reader = PdfReader(io.BytesIO(file_bytes))
+    pages, text_pages, scanned_pages, parts = [], [], [], []
+    for i, page in enumerate(reader.pages, start=1):
+        try:
+            text = (page.extract_text() or "").strip()
+        except Exception as e:
+            logger.warning(f"Text layer extraction failed on page {i}: {e}")
+            text = ""
+        quality = page_quality(text)
+        is_text = len(text) >= MIN_PAGE_CHARS and quality >= MIN_PAGE_QUALITY
+        pages.append({"page": i, "chars": len(text), "quality": quality, "path": "text_layer" if is_text else "vision"})
+        if is_text:
+            text_pages.append(i)
+            parts.append(f"--- Pagina {i} ---\n{text}")
+        else:
+            scanned_pages.append(i)
+    return {"pages": pages, "text_pages": text_pages, "scanned_pages": scanned_pages, "text": "\n\n".join(parts)}
+
+
+def extract_pages(file_bytes: bytes, page_numbers: list) -> bytes:
+    """Build a smaller PDF holding only the given (1-based) pages, for the Vision model."""
+    reader = PdfReader(io.BytesIO(file_bytes))
+    writer = PdfWriter()
+    for n in page_numbers:
+        writer.add_page(reader.pages[n - 1])
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def page_stats(analysis: dict, text_budget: int = None) -> dict:
+    """Per-document routing summary. When the text layer exceeds text_budget the whole file goes
+    to Vision instead, and the stats say so (text_over_budget)."""
+    over = text_budget is not None and len(analysis["text"]) > text_budget
+    return {
+        "total": len(analysis["pages"]),
+        "text_layer": 0 if over else len(analysis["text_pages"]),
+        "vision": len(analysis["pages"]) if over else len(analysis["scanned_pages"]),
+        "text_chars": len(analysis["text"]),
+        "text_over_budget": over,
+        "pages": [{**p, "path": "vision"} for p in analysis["pages"]] if over else analysis["pages"],
+    }
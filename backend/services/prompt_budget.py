@@ -0,0 +1,106 @@
+"""Prompt Budget - Token counting and priority-based trimming of prompt context blocks"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ENCODING = os.environ.get("PROMPT_TOKEN_ENCODING", "o200k_base")
+DEFAULT_BUDGET = int(os.environ.get("PROMPT_BUDGET_DEFAULT", "4000"))
+
+# Context tokens allowed per agent (override with PROMPT_BUDGET_<AGENT>). Reports read the whole
+# guide; the navigator answers one question and should stay fast.
+AGENT_BUDGETS = {
+    "eligibilitate": 6000,
+    "validator": 6000,
+    "redactor": 4000,
+    "navigator": 2500,
+}
+
+# Lower value = kept longest when the budget is tight
+PRIORITY_FIRM = 0
+PRIORITY_PROGRAM = 1
+PRIORITY_CRITERIA = 2
+PRIORITY_DOCS = 3
+PRIORITY_EXTRAS = 4
+
+_encoder = None
+_encoder_failed = False
+
+
+def _get_encoder():
+    """tiktoken loads its BPE files lazily (and may need network the first time); failures fall back to an estimate."""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            _encoder_failed = True
+            logger.warning(f"tiktoken unavailable ({e}); using character-based token estimate")
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return len(text) // 3 + 1  # Romanian text with diacritics averages ~3 chars/token
+
+
+def budget_for(agent: str) -> int:
+    return int(os.environ.get(f"PROMPT_BUDGET_{agent.upper()}", AGENT_BUDGETS.get(agent, DEFAULT_BUDGET)))
+
+
+def block(name: str, priority: int, text: str) -> dict:
+    """A context block: first line is its heading, every further line is a trimmable item."""
+    lines = text.split("\n")
+    # Sections are written with a leading blank line as separator; keep it attached to the heading
+    head = 0
+    while head < len(lines) - 1 and not lines[head].strip():
+        head += 1
+    return {"name": name, "priority": priority, "header": "\n".join(lines[:head + 1]), "lines": lines[head + 1:]}
+
+
+def _omitted_note(count: int) -> str:
+    return f"- … încă {count} rânduri omise (limită context)"
+
+
+def assemble(blocks: list, budget: int) -> tuple:
+    """Fit blocks into `budget` tokens. Higher-priority blocks are kept whole first; the rest keep as
+    many leading items as fit, with a note saying how many were left out. Output keeps the original
+    block order. Returns (text, stats)."""
+    kept = {}
+    trimmed, dropped = [], []
+    remaining = budget
+    for i in sorted(range(len(blocks)), key=lambda i: blocks[i]["priority"]):
+        b = blocks[i]
+        full_cost = count_tokens("\n".join([b["header"], *b["lines"]])) + 1
+        if full_cost <= remaining:
+            kept[i] = len(b["lines"])
+            remaining -= full_cost
+            continue
+        cost = count_tokens(b["header"]) + count_tokens(_omitted_note(len(b["lines"]))) + 2
+        n = 0
+        for line in b["lines"]:
+            line_cost = count_tokens(line) + 1
+            if cost + line_cost > remaining:
+                break
+            cost += line_cost
+            n += 1
+        if n == 0:
+            dropped.append(b["name"])
+            continue
+        kept[i] = n
+        remaining -= cost
+        trimmed.append(b["name"])
+
+    parts = []
+    for i, b in enumerate(blocks):
+        if i not in kept:
+            continue
+        n = kept[i]
+        parts.append("\n".join([b["header"], *b["lines"][:n]] + ([_omitted_note(len(b["lines"]) - n)] if n < len(b["lines"]) else [])))
+    text = "\n".join(parts)
+    return text, {"tokens": count_tokens(text), "budget": budget, "trimmed": trimmed, "dropped": dropped}
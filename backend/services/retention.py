@@ -0,0 +1,271 @@
+"""Retention - Hot window, hourly/daily rollups and compressed NDJSON archives for audit_log and agent_runs
+
+Rows newer than RETENTION_HOT_DAYS stay in their collection. Older rows are processed one UTC hour at
+a time: written to uploads/archive/<source>/<YYYY-MM>/<source>-<YYYY-MM-DDTHH>.ndjson.gz, counted into
+an hourly rollup (per action, agent / entity type, user) that is folded into a daily one, then deleted.
+activity() answers count queries from rollups before the watermark and from raw rows after it.
+"""
+import os
+import gzip
+import json
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+HOT_DAYS = int(os.environ.get("RETENTION_HOT_DAYS", "30"))
+INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", "6"))  # 0 = only on demand
+MAX_HOURS_PER_RUN = int(os.environ.get("RETENTION_MAX_HOURS_PER_RUN", "720"))
+LOCK_SECONDS = 1800
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "archive")
+
+# source collection -> dimensions counted in its rollups
+SOURCES = {
+    "audit_log": ("action", "entity_type", "user_id"),
+    "agent_runs": ("agent_id", "action", "user_id"),
+}
+# period key length in an ISO timestamp: 2026-01-31T13 | 2026-01-31
+PERIOD_CHARS = {"hour": 13, "day": 10}
+
+_db = None
+_task = None
+_lock_index_ready = False
+
+
+def set_db(database):
+    global _db
+    _db = database
+
+
+def _cutoff_hour(now: datetime = None) -> str:
+    """First hour that is still hot; everything before it can be rolled up."""
+    return ((now or datetime.now(timezone.utc)) - timedelta(days=HOT_DAYS)).isoformat()[:PERIOD_CHARS["hour"]]
+
+
+def _next_hour(hour: str) -> str:
+    return (datetime.fromisoformat(hour + ":00:00+00:00") + timedelta(hours=1)).isoformat()[:PERIOD_CHARS["hour"]]
+
+
+def _count(rows: list, dims: tuple) -> dict:
+    counts = {dim: {} for dim in dims}
+    for row in rows:
+        for dim in dims:
+            key = str(row.get(dim) or "-")
+            counts[dim][key] = counts[dim].get(key, 0) + 1
+    return counts
+
+
+def _merge(target: dict, counts: dict) -> dict:
+    for dim, values in counts.items():
+        dim_counts = target.setdefault(dim, {})
+        for key, n in values.items():
+            dim_counts[key] = dim_counts.get(key, 0) + n
+    return target
+
+
+# Rollup counts are stored as [{"key", "n"}] lists: keys such as "application.created" cannot be field names
+def _to_lists(counts: dict) -> dict:
+    return {dim: sorted(({"key": k, "n": n} for k, n in values.items()), key=lambda x: -x["n"]) for dim, values in counts.items()}
+
+
+def _from_lists(counts: dict) -> dict:
+    return {dim: {item["key"]: item["n"] for item in values} for dim, values in (counts or {}).items()}
+
+
+def _write_archive(source: str, hour: str, rows: list) -> str:
+    directory = os.path.join(ARCHIVE_DIR, source, hour[:7])
+    os.makedirs(directory, exist_ok=True)
+    name, n = f"{source}-{hour}.ndjson.gz", 1
+    while os.path.exists(os.path.join(directory, name)):  # late rows for an hour archived before
+        name, n = f"{source}-{hour}-{n}.ndjson.gz", n + 1
+    tmp = os.path.join(directory, f".{name}.tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({k: v for k, v in row.items() if k != "_id"}, ensure_ascii=False, default=str) + "\n")
+    os.replace(tmp, os.path.join(directory, name))
+    return os.path.relpath(os.path.join(directory, name), ARCHIVE_DIR)
+
+
+async def _rebuild_day(db, source: str, day: str):
+    total, counts = 0, {}
+    async for hour_doc in db.activity_rollups.find({"source": source, "granularity": "hour", "period": {"$gte": day, "$lt": day + "U"}}, {"_id": 0}):
+        total += hour_doc["total"]
+        _merge(counts, _from_lists(hour_doc["counts"]))
+    await db.activity_rollups.update_one({"id": f"{source}:day:{day}"}, {"$set": {
+        "source": source, "granularity": "day", "period": day, "total": total, "counts": _to_lists(counts),
+        "updated_at": datetime.now(timezone.utc).isoformat()}}, upsert=True)
+
+
+async def _roll_hour(db, source: str, hour: str) -> int:
+    """Archive, count and delete the rows of one hour. Safe to re-run after a crash at any step:
+    a 'pending' rollup means its rows were already archived and counted, only the delete is left."""
+    coll = db[source]
+    rows = await coll.find({"timestamp": {"$gte": hour, "$lt": _next_hour(hour)}}).to_list(None)
+    if not rows:
+        return 0
+    rollup_id = f"{source}:hour:{hour}"
+    existing = await db.activity_rollups.find_one({"id": rollup_id}, {"_id": 0})
+    if not existing or existing.get("status") != "pending":
+        archive = await asyncio.to_thread(_write_archive, source, hour, rows)
+        counts = _count(rows, SOURCES[source])
+        total = len(rows)
+        if existing:  # rows that arrived after this hour was rolled up
+            counts = _merge(_from_lists(existing["counts"]), counts)
+            total += existing["total"]
+        await db.activity_rollups.update_one({"id": rollup_id}, {
+            "$set": {"source": source, "granularity": "hour", "period": hour, "total": total, "counts": _to_lists(counts),
+                     "status": "pending", "updated_at": datetime.now(timezone.utc).isoformat()},
+            "$push": {"archives": archive}}, upsert=True)
+    ids = [row["_id"] for row in rows]
+    for i in range(0, len(ids), 1000):
+        await coll.delete_many({"_id": {"$in": ids[i:i + 1000]}})
+    await db.activity_rollups.update_one({"id": rollup_id}, {"$set": {"status": "complete"}})
+    return len(rows)
+
+
+async def _lock(db, owner: str) -> bool:
+    global _lock_index_ready
+    if not _lock_index_ready:
+        # The unique id is what makes the upsert below exclusive; don't wait for the startup index build
+        await db.retention_state.create_index([("id", 1)], unique=True)
+        _lock_index_ready = True
+    now = datetime.now(timezone.utc)
+    try:
+        doc = await db.retention_state.find_one_and_update(
+            {"id": "lock", "$or": [{"locked_until": {"$lt": now.isoformat()}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "locked_until": (now + timedelta(seconds=LOCK_SECONDS)).isoformat()}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return doc is not None and doc.get("owner") == owner
+    except DuplicateKeyError:
+        return False  # another worker holds the lock
+
+
+async def run(db=None) -> dict:
+    """One retention pass over every source (skipped when another worker is running one)."""
+    db = db or _db
+    owner = str(uuid.uuid4())
+    if not await _lock(db, owner):
+        return {"skipped": "Retenție deja în curs pe alt proces"}
+    stats = {"started_at": datetime.now(timezone.utc).isoformat(), "hot_days": HOT_DAYS, "sources": {}}
+    try:
+        cutoff = _cutoff_hour()
+        for source in SOURCES:
+            rolled = {"hours": 0, "rows": 0}
+            days = set()
+            while rolled["hours"] < MAX_HOURS_PER_RUN:
+                oldest = await db[source].find_one({"timestamp": {"$lt": cutoff}}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", 1)])
+                if not oldest:
+                    break
+                hour = oldest["timestamp"][:PERIOD_CHARS["hour"]]
+                rolled["rows"] += await _roll_hour(db, source, hour)
+                rolled["hours"] += 1
+                days.add(hour[:PERIOD_CHARS["day"]])
+            for day in sorted(days):
+                await _rebuild_day(db, source, day)
+            # Stopped at MAX_HOURS_PER_RUN: rows from the oldest hour left on must still be read raw
+            left = await db[source].find_one({"timestamp": {"$lt": cutoff}}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", 1)])
+            watermark = left["timestamp"][:PERIOD_CHARS["hour"]] if left else cutoff
+            rolled["backlog"] = left is not None
+            await db.retention_state.update_one({"id": source}, {"$set": {"watermark": watermark, "last_run": stats["started_at"], **{f"last_{k}": v for k, v in rolled.items()}}}, upsert=True)
+            stats["sources"][source] = rolled
+            logger.info(f"Retention {source}: {rolled['rows']} rows in {rolled['hours']} hours rolled up and archived")
+    finally:
+        await db.retention_state.update_one({"id": "lock", "owner": owner}, {"$set": {"locked_until": datetime.now(timezone.utc).isoformat()}})
+    stats["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return stats
+
+
+async def _watermark(db, source: str) -> str:
+    state = await db.retention_state.find_one({"id": source}, {"_id": 0, "watermark": 1})
+    return (state or {}).get("watermark", "")
+
+
+async def activity(db, source: str, since: str, until: str, granularity: str = "day", dim: str = None) -> list:
+    """Counts per period (and per value of dim) between since and until (ISO prefixes). Periods
+    before the watermark come from rollups, the rest from raw rows; a period spanning both is summed."""
+    chars = PERIOD_CHARS[granularity]
+    watermark = await _watermark(db, source)
+    periods = {}
+
+    def add(period: str, n: int, counts: dict = None):
+        entry = periods.setdefault(period, {"period": period, "total": 0, "counts": {}})
+        entry["total"] += n
+        if dim and counts:
+            _merge(entry["counts"], {dim: counts})
+
+    if watermark and since < watermark:
+        # Rolled-up hours end at the watermark; day rollups are only whole for days before it
+        rollup_gran = granularity if granularity == "hour" else ("day" if until <= watermark[:10] else "hour")
+        async for doc in db.activity_rollups.find({"source": source, "granularity": rollup_gran, "period": {"$gte": since[:chars], "$lt": min(until, watermark)}}, {"_id": 0}):
+            add(doc["period"][:chars], doc["total"], _from_lists(doc["counts"]).get(dim))
+    raw_since = max(since, watermark) if watermark else since
+    if raw_since < until:
+        group_id = {"period": {"$substrBytes": ["$timestamp", 0, chars]}}
+        if dim:
+            group_id["key"] = f"${dim}"
+        async for row in db[source].aggregate([
+            {"$match": {"timestamp": {"$gte": raw_since, "$lt": until}}},
+            {"$group": {"_id": group_id, "n": {"$sum": 1}}},
+        ]):
+            add(row["_id"]["period"], row["n"], {str(row["_id"].get("key") or "-"): row["n"]} if dim else None)
+    result = sorted(periods.values(), key=lambda p: p["period"])
+    for entry in result:
+        entry["counts"] = entry["counts"].get(dim, {}) if dim else {}
+    return result
+
+
+async def get_state(db=None) -> dict:
+    db = db or _db
+    states = {s["id"]: s async for s in db.retention_state.find({}, {"_id": 0})}
+    return {"hot_days": HOT_DAYS, "interval_hours": INTERVAL_HOURS, "archive_dir": ARCHIVE_DIR,
+            "sources": {source: states.get(source, {}) for source in SOURCES},
+            "rollups": await db.activity_rollups.count_documents({})}
+
+
+async def _loop():
+    while True:
+        try:
+            await run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Retention pass failed: {e}")
+        await asyncio.sleep(INTERVAL_HOURS * 3600)
+
+
+def start():
+    global _task
+    if INTERVAL_HOURS > 0 and (_task is None or _task.done()):
+        _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
+
+
+if __name__ == "__main__":
+    # One pass from the command line: python -m services.retention (from backend/, reads MONGO_URL / DB_NAME)
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent.parent / ".env")
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        logger.info(f"Retention finished: {await run(client[os.environ['DB_NAME']])}")
+        client.close()
+
+    asyncio.run(_main())
@@ -0,0 +1,72 @@
+"""Streaming helpers - Server-Sent Events framing for agent pipelines"""
+import json
+import asyncio
+import logging
+from typing import AsyncIterator
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from services import llm_backends
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Connection": "keep-alive"}
+
+
+def require_token_streaming():
+    """Token deltas need a chat client that streams; with one that only returns whole messages the
+    endpoint would just delay the full answer, so it is refused instead."""
+    if not llm_backends.can_stream():
+        raise HTTPException(status_code=501, detail="Streaming indisponibil pentru clientul LLM configurat - folosiți varianta fără /stream")
+
+
+def sse_event(event: str, data) -> str:
+    """Format a single SSE frame. Data is always JSON so clients parse one shape."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def with_keepalive(frames: AsyncIterator[str], interval: float = KEEPALIVE_SECONDS) -> AsyncIterator[str]:
+    """Interleave SSE comments while the pipeline is waiting, so proxies keep the connection open."""
+    it = frames.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(it.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield ": ping\n\n"
+                continue
+            task, pending = pending, None
+            try:
+                yield task.result()
+            except StopAsyncIteration:
+                return
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def sse_response(frames: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(with_keepalive(frames), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def stream_frames(deltas: AsyncIterator[str], on_complete, meta: dict = None) -> AsyncIterator[str]:
+    """Relay model deltas as `delta` events, then persist via on_complete(text) and emit `done`.
+
+    Event order: status(generating) → delta* → status(persisting) → done | error.
+    """
+    yield sse_event("status", {"stage": "generating", **(meta or {})})
+    parts = []
+    try:
+        async for delta in deltas:
+            if delta:
+                parts.append(delta)
+                yield sse_event("delta", {"text": delta})
+        yield sse_event("status", {"stage": "persisting"})
+        record = await on_complete("".join(parts))
+        yield sse_event("done", record)
+    except Exception as e:
+        logger.error(f"Streaming pipeline failed: {e}")
+        yield sse_event("error", {"message": str(e)[:200]})
@@ -0,0 +1,70 @@
+"""Update Builder - Accumulates $set/$push/$inc/$unset for one document and commits them in a single round trip"""
+from pymongo import ReturnDocument
+
+
+class UpdateBuilder:
+    """Collect the writes a handler decides on along the way, then apply them with one
+    find_one_and_update. The same path used by two operators is a bug (MongoDB rejects the
+    update), so it is refused as soon as it is added."""
+
+    def __init__(self, update: dict = None):
+        self._ops = {}
+        if update:
+            self.merge(update)
+
+    def _claim(self, op: str, field: str):
+        for other, fields in self._ops.items():
+            if other != op and field in fields:
+                raise ValueError(f"{field} is already updated with {other}")
+        return self._ops.setdefault(op, {})
+
+    def set(self, field: str, value):
+        self._claim("$set", field)[field] = value
+        return self
+
+    def set_many(self, fields: dict):
+        for field, value in fields.items():
+            self.set(field, value)
+        return self
+
+    def unset(self, field: str):
+        self._claim("$unset", field)[field] = ""
+        return self
+
+    def inc(self, field: str, amount=1):
+        ops = self._claim("$inc", field)
+        ops[field] = ops.get(field, 0) + amount
+        return self
+
+    def push(self, field: str, *values):
+        ops = self._claim("$push", field)
+        ops.setdefault(field, {"$each": []})["$each"].extend(values)
+        return self
+
+    def merge(self, update: dict):
+        """Fold in a plain operator dict ({"$set": {...}, "$inc": {...}})."""
+        handlers = {"$set": self.set, "$unset": lambda f, _: self.unset(f), "$inc": self.inc,
+                    "$push": lambda f, v: self.push(f, *(v["$each"] if isinstance(v, dict) and "$each" in v else [v]))}
+        for op, fields in update.items():
+            if op not in handlers:
+                raise ValueError(f"Unsupported update operator {op}")
+            for field, value in fields.items():
+                handlers[op](field, value)
+        return self
+
+    @property
+    def fields(self) -> list:
+        return [field for fields in self._ops.values() for field in fields]
+
+    def __bool__(self):
+        return bool(self._ops)
+
+    def as_update(self) -> dict:
+        return {op: dict(fields) for op, fields in self._ops.items() if fields}
+
+    async def commit(self, coll, query: dict, projection: dict = None):
+        """Apply everything collected; returns the updated document (None if nothing matched).
+        With nothing collected this is a plain read."""
+        if not self:
+            return await coll.find_one(query, projection)
+        return await coll.find_one_and_update(query, self.as_update(), projection=projection, return_document=ReturnDocument.AFTER)
@@ -41,7 +41,7 @@ export function DocumentsPage() {
     if (!selectedApp) { setAppData(null); return; }
     const loadApp = async () => {
       try {
-        const res = await api.get(`/v2/applications/${selectedApp}`);
+        const res = await api.get(`/v2/applications/${selectedApp}?view=documents`);
         setAppData(res.data);
       } catch (e) { console.error(e); }
     };
@@ -58,7 +58,7 @@ export function DocumentsPage() {
       await api.post(`/v2/applications/${selectedApp}/documents`, fd, { headers: { 'Content-Type': 'multipart/form-data' } });
       fileRef.current.value = '';
       // Reload app data
-      const res = await api.get(`/v2/applications/${selectedApp}`);
+      const res = await api.get(`/v2/applications/${selectedApp}?view=documents`);
       setAppData(res.data);
     } catch (e) { console.error(e); }
     setUploading(false);
@@ -67,7 +67,7 @@ export function DocumentsPage() {
   const deleteDoc = async (docId) => {
     try {
       await api.delete(`/v2/applications/${selectedApp}/documents/${docId}`);
-      const res = await api.get(`/v2/applications/${selectedApp}`);
+      const res = await api.get(`/v2/applications/${selectedApp}?view=documents`);
       setAppData(res.data);
     } catch (e) { console.error(e); }
   };
@@ -78,7 +78,14 @@ export function DosareDetailPage() {
     const fd = new FormData(); fd.append('file', e.target.files[0]); fd.append('tip', 'ghid');
     try {
       const res = await api.post(`/v2/applications/${id}/guide`, fd, { headers: { 'Content-Type': 'multipart/form-data' } });
-      setGuideActions(res.data.agent_actions || []);
+      load();
+      // Parsing runs as a background job; poll until it finishes
+      let job = { status: res.data.job_status };
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(r => setTimeout(r, 2000));
+        job = (await api.get(`/v2/jobs/${res.data.job_id}`)).data;
+      }
+      setGuideActions(job.result?.agent_actions || (job.error ? [`Eroare parsare ghid: ${job.error}`] : []));
       load();
     } catch (err) { console.error(err); }
     setGuideProcessing(false);
@@ -48,7 +48,7 @@ export function ProjectWritingPage() {
           api.get('/v2/programs'),
           api.get('/v2/templates'),
           api.get('/v2/calls').then(r => ({data: []})).catch(() => ({ data: [] })),
-          api.get(`/v2/applications/${id}`).then(r => ({data: r.data?.guide_assets || []})).catch(() => ({ data: [] })),
+          api.get(`/v2/applications/${id}?view=documents`).then(r => ({data: r.data?.guide_assets || []})).catch(() => ({ data: [] })),
           api.get(`/v2/applications/${id}/drafts`).catch(() => ({ data: [] })),
         ]);
         setProject(pRes.data);